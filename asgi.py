@@ -0,0 +1,40 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from backend import create_app
+from dotenv import load_dotenv
+
+# Carga las variables de entorno desde .env (si existe)
+load_dotenv()
+
+
+class _ThreadPoolInstance(WsgiToAsgiInstance):
+    def __init__(self, wsgi_application, duplicate_header_limit, executor):
+        super().__init__(wsgi_application, duplicate_header_limit)
+        self.executor = executor
+
+    async def run_wsgi_app(self, body):
+        # asgiref corre run_wsgi_app con thread_sensitive=True: todas las peticiones del
+        # proceso compartirían un solo hilo. Aquí cada petición toma un hilo del pool.
+        run = WsgiToAsgiInstance.__dict__['run_wsgi_app'].func
+        return await sync_to_async(run, thread_sensitive=False, executor=self.executor)(self, body)
+
+
+class ThreadPoolWsgiToAsgi(WsgiToAsgi):
+    """``WsgiToAsgi`` que atiende hasta ``threads`` peticiones síncronas a la vez."""
+
+    def __init__(self, wsgi_application, threads):
+        super().__init__(wsgi_application)
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='wsgi')
+
+    async def __call__(self, scope, receive, send):
+        await _ThreadPoolInstance(self.wsgi_application, self.duplicate_header_limit, self.executor)(
+            scope, receive, send
+        )
+
+
+# Variante ASGI de la aplicación (uvicorn asgi:app). Las rutas son síncronas y se
+# ejecutan en un pool de ASGI_THREADS hilos por worker.
+app = ThreadPoolWsgiToAsgi(create_app(), int(os.environ.get('ASGI_THREADS', 4)))
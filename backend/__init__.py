@@ -4,8 +4,9 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from werkzeug.security import generate_password_hash
 from flask_cors import CORS
+from . import hashing, db_profile, db_routing, rate_limit, request_metrics
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': db_routing.RoutingSession})
 login_manager = LoginManager()
 
 def create_app():
@@ -17,49 +18,123 @@ def create_app():
      resources={r"/api/*": {"origins": ["http://localhost:5173", "http://127.0.0.1:5173"]}}, 
      supports_credentials=True,
      allow_headers=['Content-Type', 'Authorization'],
-     expose_headers=['Set-Cookie'],
+     expose_headers=['Set-Cookie', 'ETag', 'X-Next-Cursor'],
      methods=['GET', 'POST', 'OPTIONS', 'DELETE', 'PUT']
 )
     
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'una_clave_secreta_por_defecto_cambiar_en_prod')
     app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///' + os.path.join(app.instance_path, 'database.db'))
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    replica_urls = [u.strip() for u in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if u.strip()]
+    app.config['SQLALCHEMY_BINDS'] = db_routing.replica_binds(replica_urls)
+    app.config['REPLICA_STICKY_SECONDS'] = float(os.environ.get('REPLICA_STICKY_SECONDS', 5))
+    app.config['USER_CACHE_SIZE'] = int(os.environ.get('USER_CACHE_SIZE', 1024))
+    app.config['USER_CACHE_TTL'] = float(os.environ.get('USER_CACHE_TTL', 30))
+    app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', hashing.DEFAULT_METHOD)
+    app.config['PASSWORD_HASH_SALT_LENGTH'] = int(os.environ.get('PASSWORD_HASH_SALT_LENGTH', hashing.DEFAULT_SALT_LENGTH))
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', min(2, os.cpu_count() or 1)))
+    app.config['PASSWORD_HASH_MAX_CONCURRENCY'] = int(os.environ.get('PASSWORD_HASH_MAX_CONCURRENCY', 0))
+    app.config['PASSWORD_HASH_TIMEOUT'] = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 30))
+    app.config['SIMULATION_CACHE_SIZE'] = int(os.environ.get('SIMULATION_CACHE_SIZE', 512))
+    app.config['SIMULATION_CACHE_TTL'] = float(os.environ.get('SIMULATION_CACHE_TTL', 300))
+    app.config['SIMULATION_MAX_SCENARIOS'] = int(os.environ.get('SIMULATION_MAX_SCENARIOS', 1000))
+    app.config['RATE_LIMIT_ENABLED'] = os.environ.get('RATE_LIMIT_ENABLED', '1').lower() not in ('0', 'false', 'no')
+    app.config['RATE_LIMIT_STORAGE'] = os.environ.get('RATE_LIMIT_STORAGE', 'memory')
+    for name in ('LOGIN_IP', 'LOGIN_ACCOUNT', 'FIND_MAIL_IP', 'RESET_PASSWORD_IP', 'RESET_PASSWORD_ACCOUNT'):
+        if f'RATE_LIMIT_{name}' in os.environ:
+            app.config[f'RATE_LIMIT_{name}'] = os.environ[f'RATE_LIMIT_{name}']
+    app.config['EMAIL_FILTER_ENABLED'] = os.environ.get('EMAIL_FILTER_ENABLED', '1').lower() not in ('0', 'false', 'no')
+    app.config['EMAIL_FILTER_CAPACITY'] = int(os.environ.get('EMAIL_FILTER_CAPACITY', 100000))
+    app.config['EMAIL_FILTER_ERROR_RATE'] = float(os.environ.get('EMAIL_FILTER_ERROR_RATE', 0.01))
+    app.config['EMAIL_FILTER_REBUILD'] = float(os.environ.get('EMAIL_FILTER_REBUILD', 600))
+    app.config['SLOW_REQUEST_MS'] = float(os.environ.get('SLOW_REQUEST_MS', 0))
+    app.config['SLOW_REQUEST_MAX_STATEMENTS'] = int(os.environ.get('SLOW_REQUEST_MAX_STATEMENTS', 20))
+    app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+    app.config['AUTO_MIGRATE'] = os.environ.get('AUTO_MIGRATE', '1').lower() not in ('0', 'false', 'no')
+    app.config['GROUP_COMMIT_ENABLED'] = os.environ.get('GROUP_COMMIT_ENABLED', '0').lower() not in ('0', 'false', 'no')
+    app.config['GROUP_COMMIT_WINDOW_MS'] = float(os.environ.get('GROUP_COMMIT_WINDOW_MS', 2))
+    app.config['GROUP_COMMIT_MAX_BATCH'] = int(os.environ.get('GROUP_COMMIT_MAX_BATCH', 64))
+    # Por defecto, el doble del busy_timeout de SQLite (ver backend/group_commit.py)
+    app.config['GROUP_COMMIT_TIMEOUT'] = float(os.environ.get(
+        'GROUP_COMMIT_TIMEOUT', 2 * int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)) / 1000))
+    app.config['JOBS_WORKERS'] = int(os.environ.get('JOBS_WORKERS', 2))
+    app.config['JOBS_POLL_INTERVAL'] = float(os.environ.get('JOBS_POLL_INTERVAL', 1))
+    app.config['JOBS_LEASE'] = float(os.environ.get('JOBS_LEASE', 600))
+    app.config['JOBS_MAX_ATTEMPTS'] = int(os.environ.get('JOBS_MAX_ATTEMPTS', 3))
+    app.config['ARCHIVE_DIR'] = os.environ.get('ARCHIVE_DIR', os.path.join(app.instance_path, 'archivo'))
+    app.config['TAX_RULES_FILE'] = os.environ.get('TAX_RULES_FILE', os.path.join(app.instance_path, 'reglas_fiscales.json'))
 
-    # Imprimir la ruta de la base de datos para depuración
-    print(f"Ruta absoluta de la BD: {os.path.abspath(app.config['SQLALCHEMY_DATABASE_URI'].replace('sqlite:///', ''))}")
+    # Ruta de la base de datos para depuración (solo con el logger en DEBUG, no en cada arranque de worker)
+    app.logger.debug("Ruta absoluta de la BD: %s", os.path.abspath(app.config['SQLALCHEMY_DATABASE_URI'].replace('sqlite:///', '')))
 
     try:
         os.makedirs(app.instance_path)
     except OSError:
         pass
 
+    db_profile.configure(app)
     db.init_app(app)
     login_manager.init_app(app)
+    hashing.init_app(app)
+    rate_limit.init_app(app)
+    from . import email_filter
+    email_filter.init_app(app)
+    request_metrics.init_app(app)
+    with app.app_context():
+        db_profile.instrument_engine(db.engine, app.config['DB_PROFILE'])
+        request_metrics.instrument_engine(db.engine)
     
     @login_manager.unauthorized_handler
     def unauthorized():
         return {'message': 'Autenticación requerida.'}, 401
 
-    from . import models
+    from . import models, user_cache
+    user_cache.cache.configure(app.config['USER_CACHE_SIZE'], app.config['USER_CACHE_TTL'])
+    from . import simulation
+    simulation.configure(
+        app.config['SIMULATION_CACHE_SIZE'], app.config['SIMULATION_CACHE_TTL'], app.config['SIMULATION_MAX_SCENARIOS']
+    )
 
     @login_manager.user_loader
     def load_user(user_id):
-        return models.User.query.get(int(user_id))
+        return user_cache.load(db.session, models.User, int(user_id))
 
-    from . import routes
+    from . import routes, jobs, group_commit, archive
     app.register_blueprint(routes.bp, url_prefix='/api')
+    jobs.init_app(app)
+    group_commit.init_app(app)
+    archive.init_app(app)
 
-    # Asegurarse de que la creación de tablas y el usuario admin se hagan dentro del contexto de la aplicación
-    with app.app_context():
-        db.create_all()
-        create_admin_user()
+    @app.cli.command('reindex-users')
+    def reindex_users_command():
+        """Reconstruye el índice de búsqueda por nombre de todos los usuarios."""
+        total = rebuild_user_search_index()
+        print(f"Índice de búsqueda reconstruido para {total} usuarios.")
+
+    @app.cli.command('rebuild-reports')
+    def rebuild_reports_command():
+        """Recalcula las tablas de agregados de los reportes de administración."""
+        from . import reporting
+        por_ano, por_dia = reporting.reconstruir()
+        print(f"Agregados reconstruidos: {por_ano} filas por año fiscal y {por_dia} filas por día.")
+
+    from . import migrations
+    app.cli.add_command(migrations.db_cli)
+    db_routing.init_app(app)
+
+    # Con AUTO_MIGRATE (por defecto en desarrollo) se aplican las migraciones pendientes al iniciar;
+    # si el esquema está al día esto es una sola consulta. En producción se desactiva y se usa
+    # 'flask db upgrade' una vez por despliegue.
+    if app.config['AUTO_MIGRATE']:
+        with app.app_context():
+            migrations.upgrade()
 
     return app
 
 def create_admin_user():
     """Crea un usuario administrador por defecto si no existe."""
     from .models import User
-    if not User.query.filter_by(correo_electronico='admin@example.com').first():
+    if not db.session.query(User.id).filter_by(correo_electronico='admin@example.com').first():
         admin_user = User(
             nombre_completo='Administrador',
             tipo_documento='ADMIN',
@@ -72,3 +147,30 @@ def create_admin_user():
         db.session.add(admin_user)
         db.session.commit()
         print("Usuario administrador por defecto creado.")
+
+def rebuild_user_search_index():
+    """Regenera las palabras y trigramas de búsqueda de todos los usuarios (p. ej. tras migrar datos).
+
+    Solo lee id, nombre, correo y documento, así funciona aunque el resto del
+    esquema vaya detrás del modelo.
+    """
+    from .models import User, UserSearchToken, UserSearchTrigram, normalize_search_text, search_trigrams
+    tokens, trigrams = UserSearchToken.__table__, UserSearchTrigram.__table__
+    db.session.execute(tokens.delete())
+    db.session.execute(trigrams.delete())
+    total, token_batch, trigram_batch = 0, [], []
+    query = db.session.query(User.id, User.nombre_completo, User.correo_electronico, User.numero_documento)
+    for user_id, nombre, correo, documento in query.order_by(User.id).yield_per(1000):
+        token_batch.extend({'user_id': user_id, 'token': t} for t in sorted(set(normalize_search_text(nombre).split())))
+        trigram_batch.extend({'user_id': user_id, 'trigram': t} for t in sorted(search_trigrams(correo, documento)))
+        total += 1
+        if len(token_batch) >= 1000 or len(trigram_batch) >= 5000:
+            db.session.execute(tokens.insert(), token_batch)
+            db.session.execute(trigrams.insert(), trigram_batch)
+            token_batch, trigram_batch = [], []
+    if token_batch:
+        db.session.execute(tokens.insert(), token_batch)
+    if trigram_batch:
+        db.session.execute(trigrams.insert(), trigram_batch)
+    db.session.commit()
+    return total
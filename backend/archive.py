@@ -0,0 +1,482 @@
+"""Archivo columnar de las declaraciones de años fiscales cerrados.
+
+``flask --app run archive year 2021`` mueve las declaraciones de un año ya
+cerrado (anterior al año en curso) de la tabla ``declaration`` a
+``ARCHIVE_DIR/<año>/v<versión>/``, con un archivo ``.npy`` por columna:
+
+* dinero (ingresos, deducciones, renta gravable e impuesto) en centavos, ``int64``;
+* ``estado_civil`` y ``estado_declaracion`` codificados con diccionario
+  (``uint8``; los valores quedan en ``manifest.json``);
+* ``dependientes`` en ``int32`` y las fechas en microsegundos desde 1970 (``int64``);
+* ``otros_ingresos_deducciones`` como bytes UTF-8 concatenados, con sus
+  desplazamientos y una máscara de nulos.
+
+Los nulos numéricos se guardan como el mínimo del tipo (``NULO_64``,
+``NULO_32``). Las filas van ordenadas por (``user_id``, ``id``), así que las
+declaraciones de un usuario son un rango contiguo que se encuentra con búsqueda
+binaria.
+
+Las columnas se abren con ``np.load(..., mmap_mode='r')``: los rangos que se
+consultan son vistas del archivo mapeado, sin copiarlo a memoria. Un
+directorio de versión no se modifica nunca; re-liquidar un año archivado
+escribe una versión nueva (enlazando las columnas que no cambian) y la tabla
+``declaration_archive`` dice cuál es la vigente. ``ARCHIVE_DIR`` debe ser
+visible para todos los workers.
+
+``GET /api/declarations``, la exportación de declaraciones,
+``reporting.reconstruir`` y ``liquidation.recalcular_ano_fiscal`` combinan las
+filas vivas con las archivadas. Un año archivado no admite declaraciones
+nuevas; ``flask --app run archive restore <año>`` las devuelve a la tabla.
+
+NumPy se importa dentro de las funciones para no cargarlo al arrancar.
+"""
+import json
+import os
+import shutil
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+from heapq import merge
+from operator import itemgetter
+
+import click
+import sqlalchemy as sa
+from flask import current_app
+from flask.cli import with_appcontext
+
+from . import db
+from .models import Declaration, DeclarationArchive, bump_declarations_version
+
+ARCHIVANDO, ARCHIVADO = 'archivando', 'archivado'
+NULO_64 = -2 ** 63
+NULO_32 = -2 ** 31
+EPOCA = datetime(1970, 1, 1)
+UN_MICROSEGUNDO = timedelta(microseconds=1)
+MICROSEGUNDOS_DIA = 86_400_000_000
+TAMANO_LOTE = 50000
+
+COLUMNAS_DINERO = ('ingresos_totales', 'deducciones_aplicadas', 'renta_gravable', 'impuesto_liquidado')
+COLUMNAS_FECHA = ('fecha_creacion', 'fecha_liquidacion')
+COLUMNAS_DICCIONARIO = ('estado_civil', 'estado_declaracion')
+TEXTO = 'otros_ingresos_deducciones'
+# Columnas de Declaration que se archivan (ano_fiscal es el mismo para todo el archivo)
+COLUMNAS = ('id', 'user_id', *COLUMNAS_DINERO, 'dependientes', *COLUMNAS_DICCIONARIO, *COLUMNAS_FECHA, TEXTO)
+
+
+class ArchiveError(Exception):
+    """Operación de archivo no permitida o interrumpida; el mensaje es para quien la pidió."""
+
+
+class ArchivoAno:
+    """Columnas de una versión de un año archivado, mapeadas en memoria (solo lectura)."""
+
+    def __init__(self, ruta):
+        import numpy as np
+        with open(os.path.join(ruta, 'manifest.json'), encoding='utf-8') as f:
+            manifest = json.load(f)
+        self.ruta = ruta
+        self.ano_fiscal = manifest['ano_fiscal']
+        self.version = manifest['version']
+        self.filas = manifest['filas']
+        self.diccionarios = {c: tuple(v) for c, v in manifest['diccionarios'].items()}
+        # Vistas ndarray del archivo mapeado: mismo buffer, sin la sobrecarga de np.memmap al indexar
+        self.columnas = {
+            nombre[:-len('.npy')]: np.load(os.path.join(ruta, nombre), mmap_mode='r').view(np.ndarray)
+            for nombre in os.listdir(ruta) if nombre.endswith('.npy')
+        }
+
+    def indices_usuario(self, user_id, estado_declaracion=None, desde_id=0):
+        """Índices de las filas de ``user_id`` (en orden de id), opcionalmente filtradas."""
+        import numpy as np
+        user_ids = self.columnas['user_id']
+        inicio, fin = np.searchsorted(user_ids, user_id, 'left'), np.searchsorted(user_ids, user_id, 'right')
+        indices = np.arange(inicio, fin)
+        if desde_id:
+            indices = indices[self.columnas['id'][inicio:fin] > desde_id]
+        if estado_declaracion is not None:
+            diccionario = self.diccionarios['estado_declaracion']
+            if estado_declaracion not in diccionario:
+                return indices[:0]
+            indices = indices[self.columnas['estado_declaracion'][indices] == diccionario.index(estado_declaracion)]
+        return indices
+
+    def valores(self, campo, indices):
+        """Lista de valores de Python de ``campo`` en las filas ``indices``."""
+        if campo == 'ano_fiscal':
+            return [self.ano_fiscal] * len(indices)
+        if campo == TEXTO:
+            return self._textos(indices)
+        datos = self.columnas[campo][indices].tolist()
+        if campo in COLUMNAS_DICCIONARIO:
+            diccionario = self.diccionarios[campo]
+            return [diccionario[codigo] for codigo in datos]
+        if campo in COLUMNAS_DINERO:
+            return [None if v == NULO_64 else v / 100 for v in datos]
+        if campo in COLUMNAS_FECHA:
+            return [None if v == NULO_64 else EPOCA + timedelta(microseconds=v) for v in datos]
+        if campo == 'dependientes':
+            return [None if v == NULO_32 else v for v in datos]
+        return datos
+
+    def _textos(self, indices):
+        desplazamientos = self.columnas[f'{TEXTO}.desplazamientos']
+        nulos = self.columnas[f'{TEXTO}.nulos'][indices].tolist()
+        datos = self.columnas[f'{TEXTO}.datos']
+        return [
+            None if nulo else bytes(datos[inicio:fin]).decode('utf-8')
+            for nulo, inicio, fin in zip(nulos, desplazamientos[indices].tolist(), desplazamientos[indices + 1].tolist())
+        ]
+
+    def tuplas(self, campos, indices):
+        """Tuplas (en el orden de ``campos``) de las filas ``indices``."""
+        return list(zip(*(self.valores(c, indices) for c in campos)))
+
+
+_abiertos = {}
+_lock = threading.Lock()
+lecturas = {'filas': 0}
+
+
+def _directorio(ano_fiscal):
+    return os.path.join(current_app.config['ARCHIVE_DIR'], str(ano_fiscal))
+
+
+def _ruta(ano_fiscal, version):
+    return os.path.join(_directorio(ano_fiscal), f'v{version}')
+
+
+def abrir(ano_fiscal, version):
+    """Devuelve el ``ArchivoAno`` de esa versión (se abre una vez por proceso)."""
+    clave = (ano_fiscal, version)
+    archivo = _abiertos.get(clave)
+    if archivo is None:
+        with _lock:
+            archivo = _abiertos.get(clave)
+            if archivo is None:
+                archivo = ArchivoAno(_ruta(ano_fiscal, version))
+                for vieja in [k for k in _abiertos if k[0] == ano_fiscal]:
+                    del _abiertos[vieja]
+                _abiertos[clave] = archivo
+    return archivo
+
+
+_CONSULTA_ARCHIVADOS = sa.select(DeclarationArchive.ano_fiscal, DeclarationArchive.version).where(
+    DeclarationArchive.estado == ARCHIVADO
+)
+
+
+def anos_archivados():
+    """{año: versión vigente} de los años archivados (se consulta en cada listado; es una tabla mínima)."""
+    return dict(db.session.execute(_CONSULTA_ARCHIVADOS).all())
+
+
+def anos_cerrados():
+    """Años que no admiten declaraciones nuevas (archivados o archivándose)."""
+    return {ano for ano, in db.session.query(DeclarationArchive.ano_fiscal)}
+
+
+def combinar(vivas, user_id, campos, ano_fiscal=None, estado_declaracion=None, desde_id=0, limite=None):
+    """Mezcla por id las filas vivas ``(id, *campos)`` de un usuario con sus filas archivadas.
+
+    ``vivas`` viene ordenada por id; con ``limite`` devuelve como mucho ese número de filas.
+    """
+    archivados = anos_archivados()
+    if ano_fiscal is not None:
+        archivados = {ano_fiscal: archivados[ano_fiscal]} if ano_fiscal in archivados else {}
+    if not archivados:
+        return vivas
+
+    archivadas = []
+    for ano, version in archivados.items():
+        archivo = abrir(ano, version)
+        indices = archivo.indices_usuario(user_id, estado_declaracion, desde_id)[:limite]
+        archivadas.extend(archivo.tuplas(('id', *campos), indices))
+    archivadas.sort(key=itemgetter(0))
+    lecturas['filas'] += len(archivadas)
+    return list(merge(vivas, archivadas, key=itemgetter(0)))[:limite]
+
+
+def iter_lotes(columnas, ano_fiscal=None, user_id=None, tamano_lote=TAMANO_LOTE):
+    """Genera lotes de tuplas (en el orden de ``columnas``) de las declaraciones archivadas."""
+    import numpy as np
+    for ano, version in sorted(anos_archivados().items()):
+        if ano_fiscal is not None and ano != ano_fiscal:
+            continue
+        archivo = abrir(ano, version)
+        indices = archivo.indices_usuario(user_id) if user_id is not None else np.arange(archivo.filas)
+        for inicio in range(0, len(indices), tamano_lote):
+            lote = indices[inicio:inicio + tamano_lote]
+            lecturas['filas'] += len(lote)
+            yield archivo.tuplas(columnas, lote)
+
+
+def agregados():
+    """Totales de los años archivados para ``reporting.reconstruir``.
+
+    Devuelve ({(año, estado_civil): [declaraciones, ingresos, deducciones, impuesto]},
+    {(día, estado_declaracion): declaraciones}).
+    """
+    import numpy as np
+    por_ano, por_dia = {}, defaultdict(int)
+    for ano, version in anos_archivados().items():
+        archivo = abrir(ano, version)
+        columnas = archivo.columnas
+        estados_civiles = archivo.diccionarios['estado_civil']
+        codigos = columnas['estado_civil']
+        cuentas = np.bincount(codigos, minlength=len(estados_civiles))
+        sumas = [
+            np.bincount(codigos, weights=np.where(columnas[m] == NULO_64, 0, columnas[m]), minlength=len(estados_civiles)) / 100
+            for m in ('ingresos_totales', 'deducciones_aplicadas', 'impuesto_liquidado')
+        ]
+        for codigo, estado_civil in enumerate(estados_civiles):
+            if cuentas[codigo]:
+                por_ano[(ano, estado_civil)] = [int(cuentas[codigo]), *(float(s[codigo]) for s in sumas)]
+
+        fechas = columnas['fecha_creacion']
+        con_fecha = fechas != NULO_64
+        estados = archivo.diccionarios['estado_declaracion']
+        claves, cuentas_dia = np.unique(
+            (fechas[con_fecha] // MICROSEGUNDOS_DIA) * 256 + columnas['estado_declaracion'][con_fecha], return_counts=True
+        )
+        for clave, n in zip(claves.tolist(), cuentas_dia.tolist()):
+            por_dia[(EPOCA.date() + timedelta(days=clave // 256), estados[clave % 256])] += n
+    return por_ano, por_dia
+
+
+def _codificar(valores):
+    """Convierte las columnas leídas de la base de datos (listas) en arrays y diccionarios."""
+    import numpy as np
+    columnas = {
+        'id': np.array(valores['id'], dtype=np.int64),
+        'user_id': np.array(valores['user_id'], dtype=np.int64),
+        'dependientes': np.array([NULO_32 if v is None else v for v in valores['dependientes']], dtype=np.int32),
+    }
+    for campo in COLUMNAS_DINERO:
+        columnas[campo] = np.array([NULO_64 if v is None else round(v * 100) for v in valores[campo]], dtype=np.int64)
+    for campo in COLUMNAS_FECHA:
+        columnas[campo] = np.array(
+            [NULO_64 if v is None else (v - EPOCA) // UN_MICROSEGUNDO for v in valores[campo]], dtype=np.int64
+        )
+    diccionarios = {}
+    for campo in COLUMNAS_DICCIONARIO:
+        diccionario = sorted(set(valores[campo]))
+        if len(diccionario) > 255:
+            raise ArchiveError(f'{campo} tiene demasiados valores distintos para archivarse.')
+        posicion = {valor: codigo for codigo, valor in enumerate(diccionario)}
+        columnas[campo] = np.array([posicion[v] for v in valores[campo]], dtype=np.uint8)
+        diccionarios[campo] = diccionario
+
+    datos, desplazamientos = bytearray(), [0]
+    for texto in valores[TEXTO]:
+        datos += (texto or '').encode('utf-8')
+        desplazamientos.append(len(datos))
+    columnas[f'{TEXTO}.datos'] = np.frombuffer(bytes(datos), dtype=np.uint8)
+    columnas[f'{TEXTO}.desplazamientos'] = np.array(desplazamientos, dtype=np.int64)
+    columnas[f'{TEXTO}.nulos'] = np.array([t is None for t in valores[TEXTO]], dtype=bool)
+    return columnas, diccionarios
+
+
+def _escribir(ano_fiscal, version, columnas, diccionarios, base=None):
+    """Escribe una versión del año; las columnas que no están en ``columnas`` se enlazan desde ``base``."""
+    import numpy as np
+    ruta = _ruta(ano_fiscal, version)
+    temporal = ruta + '.tmp'
+    shutil.rmtree(temporal, ignore_errors=True)
+    shutil.rmtree(ruta, ignore_errors=True)
+    os.makedirs(temporal)
+    for nombre, datos in columnas.items():
+        np.save(os.path.join(temporal, f'{nombre}.npy'), datos)
+    if base is not None:
+        for nombre in set(base.columnas) - set(columnas):
+            origen, destino = os.path.join(base.ruta, f'{nombre}.npy'), os.path.join(temporal, f'{nombre}.npy')
+            try:
+                os.link(origen, destino)
+            except OSError:
+                shutil.copyfile(origen, destino)
+    filas = len(columnas['id']) if 'id' in columnas else base.filas
+    with open(os.path.join(temporal, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump({'ano_fiscal': ano_fiscal, 'version': version, 'filas': filas,
+                   'diccionarios': diccionarios, 'fecha': datetime.now().isoformat()}, f, ensure_ascii=False, indent=2)
+    os.rename(temporal, ruta)
+    return ruta
+
+
+def _versionar_usuarios(user_ids):
+    """Cambia el ETag de ``GET /api/declarations`` de los usuarios indicados (sin commit)."""
+    user_ids = sorted(set(user_ids))
+    for inicio in range(0, len(user_ids), 500):
+        bump_declarations_version(user_ids[inicio:inicio + 500])
+
+
+def archivar(ano_fiscal):
+    """Mueve las declaraciones de un año cerrado al archivo; devuelve cuántas se archivaron."""
+    if ano_fiscal >= datetime.now().year:
+        raise ArchiveError(f'El año fiscal {ano_fiscal} aún no está cerrado.')
+    registro = db.session.get(DeclarationArchive, ano_fiscal)
+    if registro is not None and registro.estado == ARCHIVADO:
+        raise ArchiveError(f'El año fiscal {ano_fiscal} ya está archivado.')
+    if registro is None:
+        db.session.add(DeclarationArchive(ano_fiscal=ano_fiscal, estado=ARCHIVANDO, version=1, filas=0))
+    # Desde este commit el año no admite declaraciones nuevas
+    db.session.commit()
+
+    try:
+        consulta = (
+            db.session.query(*[getattr(Declaration, c) for c in COLUMNAS])
+            .filter(Declaration.ano_fiscal == ano_fiscal)
+            .order_by(Declaration.user_id, Declaration.id)
+        )
+        valores = {c: [] for c in COLUMNAS}
+        for fila in consulta.yield_per(TAMANO_LOTE):
+            for campo, valor in zip(COLUMNAS, fila):
+                valores[campo].append(valor)
+        filas = len(valores['id'])
+        if not filas:
+            raise ArchiveError(f'El año fiscal {ano_fiscal} no tiene declaraciones.')
+
+        columnas, diccionarios = _codificar(valores)
+        if ArchivoAno(_escribir(ano_fiscal, 1, columnas, diccionarios)).filas != filas:
+            raise ArchiveError('El archivo escrito no coincide con las declaraciones leídas.')
+
+        _versionar_usuarios(valores['user_id'])
+        borradas = db.session.query(Declaration).filter(Declaration.ano_fiscal == ano_fiscal).delete(synchronize_session=False)
+        if borradas != filas:
+            raise ArchiveError('Cambiaron las declaraciones del año mientras se archivaba; intente de nuevo.')
+        db.session.query(DeclarationArchive).filter(DeclarationArchive.ano_fiscal == ano_fiscal).update(
+            {DeclarationArchive.estado: ARCHIVADO, DeclarationArchive.version: 1,
+             DeclarationArchive.filas: filas, DeclarationArchive.fecha_archivo: datetime.now()},
+            synchronize_session=False,
+        )
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        db.session.query(DeclarationArchive).filter(
+            DeclarationArchive.ano_fiscal == ano_fiscal, DeclarationArchive.estado == ARCHIVANDO
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        shutil.rmtree(_directorio(ano_fiscal), ignore_errors=True)
+        raise
+    return filas
+
+
+def desarchivar(ano_fiscal):
+    """Devuelve a la tabla ``declaration`` las declaraciones de un año archivado; devuelve cuántas."""
+    import numpy as np
+    registro = db.session.get(DeclarationArchive, ano_fiscal)
+    if registro is None or registro.estado != ARCHIVADO:
+        raise ArchiveError(f'El año fiscal {ano_fiscal} no está archivado.')
+    archivo = abrir(ano_fiscal, registro.version)
+    campos = ('ano_fiscal', *COLUMNAS)
+    todos = np.arange(archivo.filas)
+    for inicio in range(0, archivo.filas, TAMANO_LOTE):
+        lote = todos[inicio:inicio + TAMANO_LOTE]
+        db.session.bulk_insert_mappings(Declaration, [dict(zip(campos, fila)) for fila in archivo.tuplas(campos, lote)])
+    _versionar_usuarios(np.unique(archivo.columnas['user_id']).tolist())
+    db.session.delete(registro)
+    db.session.commit()
+    _abiertos.pop((ano_fiscal, archivo.version), None)
+    shutil.rmtree(_directorio(ano_fiscal), ignore_errors=True)
+    return archivo.filas
+
+
+def reliquidar(ano_fiscal, version):
+    """Re-liquida un año archivado en una versión nueva del archivo; devuelve cuántas declaraciones."""
+    import numpy as np
+    from . import liquidation, reporting, tax_rules
+    actual = abrir(ano_fiscal, version)
+    columnas = actual.columnas
+    resultado = liquidation.liquidar(
+        columnas['ingresos_totales'] / 100,
+        columnas['deducciones_aplicadas'] / 100,
+        np.where(columnas['dependientes'] == NULO_32, 0, columnas['dependientes']),
+        tax_rules.obtener_reglas(ano_fiscal),
+    )
+    impuesto = np.round(resultado['impuesto'] * 100).astype(np.int64)
+    anterior = np.where(columnas['impuesto_liquidado'] == NULO_64, 0, columnas['impuesto_liquidado'])
+    estados_civiles = actual.diccionarios['estado_civil']
+    diferencias = np.bincount(columnas['estado_civil'], weights=(impuesto - anterior) / 100, minlength=len(estados_civiles))
+    ahora = (datetime.now() - EPOCA) // UN_MICROSEGUNDO
+
+    nueva = version + 1
+    _escribir(ano_fiscal, nueva, {
+        'renta_gravable': np.round(resultado['renta_gravable'] * 100).astype(np.int64),
+        'impuesto_liquidado': impuesto,
+        'fecha_liquidacion': np.full(actual.filas, ahora, dtype=np.int64),
+    }, actual.diccionarios, base=actual)
+    try:
+        actualizadas = db.session.query(DeclarationArchive).filter(
+            DeclarationArchive.ano_fiscal == ano_fiscal, DeclarationArchive.version == version,
+            DeclarationArchive.estado == ARCHIVADO,
+        ).update({DeclarationArchive.version: nueva}, synchronize_session=False)
+        if not actualizadas:
+            raise ArchiveError(f'El archivo del año {ano_fiscal} cambió mientras se re-liquidaba; intente de nuevo.')
+        _versionar_usuarios(np.unique(columnas['user_id']).tolist())
+        reporting.ajustar_impuesto(ano_fiscal, {
+            estado_civil: float(diferencias[codigo]) for codigo, estado_civil in enumerate(estados_civiles) if diferencias[codigo]
+        })
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        shutil.rmtree(_ruta(ano_fiscal, nueva), ignore_errors=True)
+        raise
+    # Se conserva la versión anterior para los procesos que aún la leen; las previas se borran
+    for nombre in os.listdir(_directorio(ano_fiscal)):
+        if nombre.startswith('v') and nombre[1:].isdigit() and int(nombre[1:]) < version:
+            shutil.rmtree(os.path.join(_directorio(ano_fiscal), nombre), ignore_errors=True)
+    return actual.filas
+
+
+def stats():
+    return {
+        'anos_abiertos': sorted(ano for ano, _ in _abiertos),
+        'filas_leidas': lecturas['filas'],
+    }
+
+
+def init_app(app):
+    """Registra el comando ``flask archive``."""
+    app.cli.add_command(archive_cli)
+
+
+@click.group('archive')
+def archive_cli():
+    """Archivo columnar de años fiscales cerrados."""
+
+
+def _ejecutar(operacion, ano_fiscal):
+    try:
+        return operacion(ano_fiscal)
+    except ArchiveError as e:
+        raise click.ClickException(str(e))
+
+
+@archive_cli.command('year')
+@click.argument('ano_fiscal', type=int)
+@with_appcontext
+def archive_year_command(ano_fiscal):
+    """Mueve las declaraciones de un año cerrado al archivo columnar."""
+    filas = _ejecutar(archivar, ano_fiscal)
+    print(f"Año {ano_fiscal} archivado: {filas} declaraciones en {_ruta(ano_fiscal, 1)}.")
+
+
+@archive_cli.command('restore')
+@click.argument('ano_fiscal', type=int)
+@with_appcontext
+def archive_restore_command(ano_fiscal):
+    """Devuelve las declaraciones de un año archivado a la base de datos."""
+    filas = _ejecutar(desarchivar, ano_fiscal)
+    print(f"Año {ano_fiscal} restaurado: {filas} declaraciones.")
+
+
+@archive_cli.command('status')
+@with_appcontext
+def archive_status_command():
+    """Muestra los años archivados y el tamaño de sus archivos."""
+    registros = db.session.query(DeclarationArchive).order_by(DeclarationArchive.ano_fiscal).all()
+    if not registros:
+        print("No hay años archivados.")
+    for registro in registros:
+        ruta = _ruta(registro.ano_fiscal, registro.version)
+        tamano = sum(os.path.getsize(os.path.join(ruta, n)) for n in os.listdir(ruta)) if os.path.isdir(ruta) else 0
+        print(f"{registro.ano_fiscal}: {registro.estado}, versión {registro.version}, "
+              f"{registro.filas} declaraciones, {tamano / 1e6:.1f} MB")
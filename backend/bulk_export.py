@@ -0,0 +1,91 @@
+"""Exportación masiva de usuarios y declaraciones en NDJSON o CSV.
+
+Las filas se leen por lotes con paginación por llave (``id > último id``) y
+seleccionando solo columnas, sin hidratar objetos ORM. Cada lote se convierte
+en un bloque de texto y se entrega de inmediato, así que la memoria usada no
+depende del tamaño de la tabla.
+"""
+import csv
+import io
+import itertools
+from datetime import date, datetime
+
+from . import archive, db, serializers
+from .models import Declaration
+
+TAMANO_LOTE = 5000
+
+COLUMNAS_USUARIO = serializers.USER_SCHEMA.fields
+COLUMNAS_DECLARACION = serializers.DECLARATION_SCHEMA.fields
+
+TIPOS_CONTENIDO = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+
+def _valor(valor):
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    return valor
+
+
+def iter_lotes(modelo, columnas, filtros=(), tamano_lote=TAMANO_LOTE):
+    """Genera listas de tuplas (una por fila) recorriendo la tabla por id."""
+    cols = [getattr(modelo, c) for c in columnas]
+    ultimo_id = 0
+    while True:
+        filas = (
+            db.session.query(*cols)
+            .filter(modelo.id > ultimo_id, *filtros)
+            .order_by(modelo.id.asc())
+            .limit(tamano_lote)
+            .all()
+        )
+        if not filas:
+            return
+        yield filas
+        ultimo_id = filas[-1][0]
+
+
+def _ndjson(lotes, columnas, esquema):
+    to_dict = esquema.row_serializer(columnas)
+    for filas in lotes:
+        yield b''.join(_bytes(serializers.dumps(to_dict(fila))) + b'\n' for fila in filas)
+
+
+def _bytes(texto):
+    return texto if isinstance(texto, bytes) else texto.encode('utf-8')
+
+
+def _csv(lotes, columnas):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columnas)
+    for filas in lotes:
+        writer.writerows([_valor(v) for v in fila] for fila in filas)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def exportar(esquema, columnas, formato, filtros=(), lotes_extra=()):
+    """Devuelve un generador de bloques con la exportación pedida (más ``lotes_extra`` al final)."""
+    lotes = itertools.chain(iter_lotes(esquema.model, columnas, filtros), lotes_extra)
+    if formato == 'csv':
+        return _csv(lotes, columnas)
+    return _ndjson(lotes, columnas, esquema)
+
+
+def exportar_usuarios(formato):
+    return exportar(serializers.USER_SCHEMA, COLUMNAS_USUARIO, formato)
+
+
+def exportar_declaraciones(formato, ano_fiscal=None, user_id=None):
+    filtros = []
+    if ano_fiscal is not None:
+        filtros.append(Declaration.ano_fiscal == ano_fiscal)
+    if user_id is not None:
+        filtros.append(Declaration.user_id == user_id)
+    # Las declaraciones de años archivados van después de las de la tabla
+    archivadas = archive.iter_lotes(COLUMNAS_DECLARACION, ano_fiscal, user_id)
+    return exportar(serializers.DECLARATION_SCHEMA, COLUMNAS_DECLARACION, formato, filtros, archivadas)
@@ -0,0 +1,141 @@
+"""Importación masiva de declaraciones desde CSV o NDJSON.
+
+El archivo se lee como flujo: las filas se parsean una a una con un generador,
+se validan con las mismas reglas que ``POST /api/declarations`` y las válidas
+se insertan en lotes con commits periódicos. En memoria solo vive el lote en
+curso y el reporte de errores (acotado a ``MAX_ERRORES_REPORTADOS``).
+"""
+import csv
+import io
+import json
+from collections import defaultdict
+from datetime import datetime
+
+from . import db, liquidation, reporting
+from .models import Declaration, bump_declarations_version
+
+FORMATOS = ('csv', 'ndjson')
+TAMANO_LOTE = 1000
+MAX_ERRORES_REPORTADOS = 1000
+
+CAMPOS = ('ano_fiscal', 'ingresos_totales', 'deducciones_aplicadas', 'estado_civil',
+          'dependientes', 'otros_ingresos_deducciones')
+
+
+def detectar_formato(content_type, formato=None):
+    """Determina el formato a partir del parámetro explícito o del Content-Type."""
+    if formato:
+        formato = formato.lower()
+        return formato if formato in FORMATOS else None
+    content_type = (content_type or '').lower()
+    if 'csv' in content_type:
+        return 'csv'
+    if 'ndjson' in content_type or 'jsonl' in content_type or 'json-seq' in content_type:
+        return 'ndjson'
+    return None
+
+
+def iter_registros(stream, formato):
+    """Genera tuplas (fila, datos, error) leyendo el flujo de forma incremental."""
+    texto = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if formato == 'csv':
+        for fila, registro in enumerate(csv.DictReader(texto), start=2):
+            # En CSV las celdas vacías equivalen a campos ausentes.
+            yield fila, {k: (v.strip() or None) for k, v in registro.items() if k and v is not None}, None
+    else:
+        for fila, linea in enumerate(texto, start=1):
+            if not linea.strip():
+                continue
+            try:
+                registro = json.loads(linea)
+            except ValueError:
+                yield fila, None, 'JSON inválido.'
+                continue
+            if not isinstance(registro, dict):
+                yield fila, None, 'Cada línea debe ser un objeto JSON.'
+                continue
+            yield fila, registro, None
+
+
+def _a_fila(registro, user_id, ahora):
+    dependientes = registro.get('dependientes')
+    return {
+        'user_id': user_id,
+        'ano_fiscal': int(registro['ano_fiscal']),
+        'ingresos_totales': float(registro['ingresos_totales']),
+        'deducciones_aplicadas': float(registro.get('deducciones_aplicadas') or 0.0),
+        'estado_civil': registro['estado_civil'],
+        'dependientes': int(dependientes) if dependientes is not None else None,
+        'otros_ingresos_deducciones': registro.get('otros_ingresos_deducciones'),
+        'estado_declaracion': 'Guardada',
+        'fecha_creacion': ahora,
+    }
+
+
+def _insertar_lote(lote, reglas_por_ano, ahora, user_id):
+    """Liquida el lote agrupado por año fiscal e inserta todas sus filas."""
+    por_ano = defaultdict(list)
+    for fila in lote:
+        por_ano[fila['ano_fiscal']].append(fila)
+
+    for ano, filas in por_ano.items():
+        resultado = liquidation.liquidar(
+            [f['ingresos_totales'] for f in filas],
+            [f['deducciones_aplicadas'] for f in filas],
+            [f['dependientes'] or 0 for f in filas],
+            reglas_por_ano[ano],
+        )
+        for fila, renta, impuesto in zip(filas, resultado['renta_gravable'].tolist(), resultado['impuesto'].tolist()):
+            fila['renta_gravable'] = renta
+            fila['impuesto_liquidado'] = impuesto
+            fila['fecha_liquidacion'] = ahora
+
+    db.session.bulk_insert_mappings(Declaration, lote)
+    bump_declarations_version(user_id)
+    reporting.registrar(lote)
+    db.session.commit()
+
+
+def importar_declaraciones(stream, formato, user_id, validar, tamano_lote=TAMANO_LOTE):
+    """Importa declaraciones para ``user_id`` y devuelve el reporte por fila.
+
+    ``validar`` recibe el diccionario de la fila y devuelve (errores, reglas),
+    igual que ``routes.validate_declaration``.
+    """
+    reporte = {'procesadas': 0, 'importadas': 0, 'con_errores': 0, 'errores': [], 'errores_truncados': False}
+    lote, reglas_por_ano = [], {}
+    ahora = datetime.now()
+
+    def registrar_error(fila, errores):
+        reporte['con_errores'] += 1
+        if len(reporte['errores']) < MAX_ERRORES_REPORTADOS:
+            reporte['errores'].append({'fila': fila, 'errors': errores})
+        else:
+            reporte['errores_truncados'] = True
+
+    for fila, registro, error in iter_registros(stream, formato):
+        reporte['procesadas'] += 1
+        if error:
+            registrar_error(fila, {'_fila': error})
+            continue
+
+        registro = {k: v for k, v in registro.items() if k in CAMPOS}
+        errores, reglas = validar(registro)
+        if errores:
+            registrar_error(fila, errores)
+            continue
+
+        fila_db = _a_fila(registro, user_id, ahora)
+        reglas_por_ano[fila_db['ano_fiscal']] = reglas
+        lote.append(fila_db)
+
+        if len(lote) >= tamano_lote:
+            _insertar_lote(lote, reglas_por_ano, ahora, user_id)
+            reporte['importadas'] += len(lote)
+            lote = []
+
+    if lote:
+        _insertar_lote(lote, reglas_por_ano, ahora, user_id)
+        reporte['importadas'] += len(lote)
+
+    return reporte
@@ -0,0 +1,153 @@
+"""Perfil de rendimiento de la base de datos y métricas del pool de conexiones.
+
+``DB_PROFILE=performance`` activa el perfil afinado:
+
+* SQLite: WAL, ``busy_timeout``, ``synchronous=NORMAL``, ``mmap_size`` y
+  ``cache_size`` aplicados en cada conexión nueva.
+* Bases de datos de servidor: tamaño de pool, overflow, ``pool_pre_ping`` y
+  reciclaje de conexiones.
+
+Con ``DB_PROFILE=default`` se mantienen las opciones de SQLAlchemy. En ambos
+perfiles se registran las métricas del pool (checkouts, conexiones abiertas y
+tiempo de espera por una conexión).
+"""
+import os
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+from .metrics import Histogram
+
+PROFILES = ('default', 'performance')
+
+
+class PoolStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.wait = Histogram()
+
+    def incr(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def to_dict(self, pool=None):
+        with self._lock:
+            data = {
+                'connects': self.connects,
+                'checkouts': self.checkouts,
+                'checkins': self.checkins,
+                'checked_out': self.checkouts - self.checkins,
+                'invalidations': self.invalidations,
+            }
+        data['wait_seconds'] = self.wait.to_dict()
+        if pool is not None:
+            data['status'] = pool.status()
+        return data
+
+
+pool_stats = PoolStats()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool que mide cuánto espera cada checkout por una conexión libre."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_stats.wait.observe(time.perf_counter() - start)
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def is_sqlite_file(uri):
+    url = make_url(uri)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+
+def engine_options(uri, profile):
+    """Devuelve SQLALCHEMY_ENGINE_OPTIONS para la URI y el perfil indicados."""
+    url = make_url(uri)
+    if url.get_backend_name() == 'sqlite':
+        if not is_sqlite_file(uri):
+            return {}
+        options = {'poolclass': InstrumentedQueuePool}
+        if profile == 'performance':
+            options.update(pool_size=_env_int('DB_POOL_SIZE', 10), max_overflow=_env_int('DB_MAX_OVERFLOW', 20))
+        return options
+
+    options = {'poolclass': InstrumentedQueuePool}
+    if profile == 'performance':
+        options.update(
+            pool_size=_env_int('DB_POOL_SIZE', 10),
+            max_overflow=_env_int('DB_MAX_OVERFLOW', 20),
+            pool_timeout=_env_int('DB_POOL_TIMEOUT', 30),
+            pool_recycle=_env_int('DB_POOL_RECYCLE', 1800),
+            pool_pre_ping=True,
+        )
+    return options
+
+
+def sqlite_pragmas():
+    return (
+        ('journal_mode', 'WAL'),
+        ('busy_timeout', _env_int('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+        ('synchronous', 'NORMAL'),
+        ('mmap_size', _env_int('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+        # Negativo = tamaño en KiB (64 MiB por defecto)
+        ('cache_size', _env_int('SQLITE_CACHE_SIZE', -64000)),
+    )
+
+
+def configure(app):
+    """Completa la configuración de la app antes de ``db.init_app``."""
+    profile = os.environ.get('DB_PROFILE', 'default').lower()
+    if profile not in PROFILES:
+        raise ValueError(f'DB_PROFILE inválido: {profile}. Opciones: {", ".join(PROFILES)}.')
+    app.config['DB_PROFILE'] = profile
+    options = engine_options(app.config['SQLALCHEMY_DATABASE_URI'], profile)
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+
+def instrument_engine(engine, profile):
+    """Registra los hooks de conexión (PRAGMAs) y de métricas del pool en ``engine``."""
+    if profile == 'performance' and is_sqlite_file(engine.url):
+        pragmas = sqlite_pragmas()
+
+        @event.listens_for(engine, 'connect')
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in pragmas:
+                cursor.execute(f'PRAGMA {name}={value}')
+            cursor.close()
+
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        pool_stats.incr('connects')
+
+    @event.listens_for(engine, 'checkout')
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        pool_stats.incr('checkouts')
+
+    @event.listens_for(engine, 'checkin')
+    def on_checkin(dbapi_connection, connection_record):
+        pool_stats.incr('checkins')
+
+    @event.listens_for(engine, 'invalidate')
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        pool_stats.incr('invalidations')
+
+
+def stats(engine=None):
+    return pool_stats.to_dict(engine.pool if engine is not None else None)
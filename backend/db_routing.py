@@ -0,0 +1,121 @@
+"""Enrutamiento de lecturas a réplicas de la base de datos.
+
+Con ``DATABASE_REPLICA_URLS`` (URLs separadas por coma) cada réplica queda
+como un bind ``replica_N`` de Flask-SQLAlchemy. Las rutas de solo lectura
+marcadas con ``read_only`` consultan una réplica (la misma durante toda la
+petición, elegida al azar); todo lo demás, y cualquier escritura o flush, va
+a la base de datos principal.
+
+Lectura de lo propio: después de una petición de escritura exitosa la sesión
+del navegador lleva ``db_primary_until`` y, durante
+``REPLICA_STICKY_SECONDS`` segundos, sus lecturas también van a la principal,
+así que quien acaba de escribir no ve una réplica atrasada.
+
+Para probarlo en local con archivos SQLite como réplicas,
+``flask --app run db sync-replicas`` copia la base principal sobre cada
+réplica (con la API de backup de SQLite).
+"""
+import random
+import sqlite3
+import time
+from functools import wraps
+
+import click
+import sqlalchemy as sa
+from flask import current_app, g, has_request_context, request, session
+from flask.cli import with_appcontext
+from flask_sqlalchemy.session import Session
+from sqlalchemy.engine import make_url
+
+REPLICA_PREFIX = 'replica_'
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+
+class RoutingSession(Session):
+    """Sesión que envía las lecturas de las rutas ``read_only`` a una réplica."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and not isinstance(clause, sa.UpdateBase):
+            key = has_request_context() and g.get('db_replica')
+            if key:
+                return self._db.engines[key]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+# Peticiones de solo lectura atendidas por una réplica o, por una escritura reciente, por la principal
+routed = {'replica': 0, 'primary_sticky': 0}
+
+
+def replica_binds(urls):
+    """SQLALCHEMY_BINDS para las URLs de réplica indicadas."""
+    return {f'{REPLICA_PREFIX}{i}': url for i, url in enumerate(urls)}
+
+
+def replica_keys():
+    return [k for k in current_app.config.get('SQLALCHEMY_BINDS', {}) if k.startswith(REPLICA_PREFIX)]
+
+
+def read_only(f):
+    """Marca una ruta de solo lectura: sus consultas van a una réplica si hay y no hubo escrituras recientes."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        keys = replica_keys()
+        if keys:
+            if session.get('db_primary_until', 0) > time.time():
+                routed['primary_sticky'] += 1
+            else:
+                g.db_replica = random.choice(keys)
+                routed['replica'] += 1
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def init_app(app):
+    """Registra la marca de lectura de lo propio tras las escrituras y el comando ``db sync-replicas``."""
+    sticky_seconds = app.config['REPLICA_STICKY_SECONDS']
+
+    @app.after_request
+    def stick_to_primary(response):
+        if request.method in WRITE_METHODS and response.status_code < 400 and replica_keys():
+            session['db_primary_until'] = time.time() + sticky_seconds
+        return response
+
+    from .migrations import db_cli
+    db_cli.add_command(sync_replicas_command)
+
+
+def stats():
+    return {
+        'replicas': len(replica_keys()),
+        'replica_requests': routed['replica'],
+        'primary_sticky_requests': routed['primary_sticky'],
+    }
+
+
+def _sqlite_path(url):
+    url = make_url(url)
+    if url.get_backend_name() != 'sqlite' or url.database in (None, '', ':memory:'):
+        return None
+    return url.database
+
+
+@click.command('sync-replicas')
+@with_appcontext
+def sync_replicas_command():
+    """Copia la base de datos principal sobre las réplicas SQLite (pruebas locales)."""
+    primary = _sqlite_path(current_app.config['SQLALCHEMY_DATABASE_URI'])
+    if primary is None:
+        raise click.ClickException('sync-replicas solo funciona con archivos SQLite.')
+    binds = current_app.config.get('SQLALCHEMY_BINDS', {})
+    for key in replica_keys():
+        path = _sqlite_path(binds[key])
+        if path is None:
+            print(f"{key}: no es un archivo SQLite, se omite.")
+            continue
+        source, target = sqlite3.connect(primary), sqlite3.connect(path)
+        try:
+            source.backup(target)
+        finally:
+            source.close()
+            target.close()
+        print(f"{key}: copiada desde {primary}.")
@@ -0,0 +1,268 @@
+"""Filtro de Bloom de los correos registrados, para responder "no existe" sin buscar el correo en la BD.
+
+``/api/find-mail``, ``/api/login`` y ``/api/reset-password`` buscan un usuario
+por correo. Si el filtro dice que puede estar, se consulta como siempre (los
+falsos positivos solo cuestan esa consulta). Si dice que no está, antes de
+responder se incorporan los cambios de otros procesos y se vuelve a mirar:
+
+* usuarios nuevos, leyendo ``id > último id`` por la llave primaria;
+* correos modificados, leyendo ``EmailChange.id > último id`` (bitácora que
+  escribe ``record_change`` en la misma transacción del cambio).
+
+Esa puesta al día se comparte: una petición que llega mientras otra la está
+haciendo espera y usa la siguiente, así que bajo una ráfaga de correos
+inexistentes se hace una sola lectura por tanda en vez de una búsqueda por
+petición. Como la puesta al día siempre empieza después de que llegó la
+petición, el filtro nunca responde "no existe" para un correo confirmado
+antes. Las consultas se hacen sin tomar el lock del filtro, que solo
+protege los ids leídos y los bits; así una lectura lenta no frena las
+comprobaciones que el filtro resuelve en memoria. El filtro se construye con una sola lectura de la tabla la primera
+vez que se usa y se reconstruye cada ``EMAIL_FILTER_REBUILD`` segundos (para
+cambios hechos por fuera de la API).
+"""
+import hashlib
+import math
+import threading
+import time
+
+from . import db
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate):
+        capacity = max(int(capacity), 1)
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self._bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value):
+        # Doble hashing (Kirsch-Mitzenmacher) a partir de un solo digest
+        digest = hashlib.blake2b(value.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, value):
+        for pos in self._positions(value):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(value))
+
+
+class EmailFilter:
+    def __init__(self):
+        # El lock protege el estado del filtro; las consultas a la BD se hacen sin tenerlo
+        self._lock = threading.Lock()
+        self._caught_up = threading.Condition(self._lock)
+        self.configure(True, 100000, 0.01, 600.0)
+
+    def configure(self, enabled, capacity, error_rate, rebuild):
+        with self._lock:
+            self.enabled = enabled
+            self.capacity = capacity
+            self.error_rate = error_rate
+            self.rebuild_interval = rebuild
+            self._bloom = None
+            self._building = False
+            # Correos agregados mientras se construye el filtro nuevo, para no perderlos al reemplazarlo
+            self._pending = []
+            self._last_id = 0
+            self._last_change_id = 0
+            self._built_at = 0.0
+            # Número de puestas al día iniciadas; se lee sin el lock al llegar cada petición
+            self._catch_ups = 0
+            # Mayor número de puesta al día terminada (o fallida); las que esperan lo comparan con el suyo
+            self._finished = 0
+            self._failed = 0
+            self.checks = 0
+            self.negatives = 0
+            self.false_positives = 0
+            self.rebuilds = 0
+
+    def _load(self, add, after_id, after_change_id):
+        """Pasa a ``add`` los correos de usuarios con id > ``after_id`` y de cambios con id > ``after_change_id``.
+
+        Devuelve los últimos ids leídos de cada tabla.
+        """
+        from .models import User, EmailChange
+        last_id, last_change_id = after_id, after_change_id
+        users = (
+            db.session.query(User.id, User.correo_electronico)
+            .filter(User.id > after_id).order_by(User.id).yield_per(5000)
+        )
+        for user_id, email in users:
+            add(email)
+            last_id = user_id
+        changes = (
+            db.session.query(EmailChange.id, EmailChange.correo_electronico)
+            .filter(EmailChange.id > after_change_id).order_by(EmailChange.id).yield_per(5000)
+        )
+        for change_id, email in changes:
+            add(email)
+            last_change_id = change_id
+        return last_id, last_change_id
+
+    def _finish(self, number, ok):
+        # Llamar con el lock tomado
+        if ok:
+            self._finished = max(self._finished, number)
+        else:
+            self._failed = max(self._failed, number)
+        self._caught_up.notify_all()
+
+    def _ensure_built(self):
+        """Construye el filtro la primera vez o si venció ``rebuild_interval``.
+
+        Devuelve False si aún no hay filtro porque otra petición lo está construyendo.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self._bloom is not None and now - self._built_at <= self.rebuild_interval:
+                return True
+            if self._building:
+                # Mientras tanto se sigue usando el filtro anterior, si lo hay
+                return self._bloom is not None
+            self._building = True
+            self._pending = []
+            self._catch_ups += 1
+            number = self._catch_ups
+        try:
+            from .models import User, EmailChange
+            total = db.session.query(db.func.count(User.id)).scalar() or 0
+            bloom = BloomFilter(max(self.capacity, total * 2), self.error_rate)
+            # Los cambios anteriores ya están reflejados en la tabla de usuarios
+            last_change_id = db.session.query(db.func.max(EmailChange.id)).scalar() or 0
+            last_id, _ = self._load(bloom.add, 0, last_change_id)
+        except BaseException:
+            with self._lock:
+                self._building = False
+                self._finish(number, False)
+            raise
+        with self._lock:
+            for email in self._pending:
+                bloom.add(email)
+            self._pending = []
+            self._bloom = bloom
+            self._last_id = max(self._last_id, last_id)
+            self._last_change_id = max(self._last_change_id, last_change_id)
+            self._built_at = now
+            self._building = False
+            self.rebuilds += 1
+            self._finish(number, True)
+        return True
+
+    def might_exist(self, email):
+        """False si el correo seguro no está registrado; True si hay que consultar la BD."""
+        if not self.enabled or not isinstance(email, str) or not email:
+            return True
+        arrived_after = self._catch_ups
+        if not self._ensure_built():
+            return True
+        with self._lock:
+            self.checks += 1
+            if email in self._bloom:
+                return True
+            # Si ninguna lectura empezó después de que llegó esta petición, se hace una ahora;
+            # si ya empezó alguna, se espera a que termine
+            if self._catch_ups == arrived_after:
+                self._catch_ups += 1
+                number = self._catch_ups
+                after_id, after_change_id = self._last_id, self._last_change_id
+            else:
+                number = self._catch_ups
+                self._caught_up.wait_for(lambda: self._finished >= number or self._failed >= number)
+                if self._finished < number:
+                    return True
+                return self._negative(email)
+
+        emails = []
+        try:
+            last_id, last_change_id = self._load(emails.append, after_id, after_change_id)
+        except BaseException:
+            with self._lock:
+                self._finish(number, False)
+            raise
+        with self._lock:
+            for found in emails:
+                self._bloom.add(found)
+            if self._building:
+                self._pending.extend(emails)
+            self._last_id = max(self._last_id, last_id)
+            self._last_change_id = max(self._last_change_id, last_change_id)
+            self._finish(number, True)
+            return self._negative(email)
+
+    def _negative(self, email):
+        # Llamar con el lock tomado, después de una puesta al día
+        if email in self._bloom:
+            return True
+        self.negatives += 1
+        return False
+
+    def add(self, email):
+        """Registra un correo nuevo o modificado en este proceso."""
+        if not isinstance(email, str):
+            return
+        with self._lock:
+            if self._bloom is not None:
+                self._bloom.add(email)
+            if self._building:
+                self._pending.append(email)
+
+    def record_false_positive(self):
+        with self._lock:
+            self.false_positives += 1
+
+    def stats(self):
+        with self._lock:
+            bloom = self._bloom
+            return {
+                'enabled': self.enabled,
+                'loaded': bloom is not None,
+                'entries': bloom.count if bloom else 0,
+                'bits': bloom.num_bits if bloom else 0,
+                'hashes': bloom.num_hashes if bloom else 0,
+                'checks': self.checks,
+                'negatives': self.negatives,
+                'false_positives': self.false_positives,
+                'rebuilds': self.rebuilds,
+                'catch_ups': self._catch_ups,
+            }
+
+
+email_filter = EmailFilter()
+
+
+def init_app(app):
+    """Configura el filtro con ``EMAIL_FILTER_*`` de ``app.config``."""
+    email_filter.configure(
+        app.config['EMAIL_FILTER_ENABLED'],
+        app.config['EMAIL_FILTER_CAPACITY'],
+        app.config['EMAIL_FILTER_ERROR_RATE'],
+        app.config['EMAIL_FILTER_REBUILD'],
+    )
+
+
+def might_exist(email):
+    return email_filter.might_exist(email)
+
+
+def add(email):
+    email_filter.add(email)
+
+
+def record_change(email):
+    """Anota en la bitácora un correo que cambió, para los filtros de otros procesos (sin commit)."""
+    from .models import EmailChange
+    db.session.add(EmailChange(correo_electronico=email))
+
+
+def record_false_positive():
+    email_filter.record_false_positive()
+
+
+def stats():
+    return email_filter.stats()
@@ -0,0 +1,180 @@
+"""Commit en grupo: varias escrituras pequeñas de peticiones concurrentes en una sola transacción.
+
+En SQLite cada commit es un fsync bajo el bloqueo global de escritura, lo que
+limita las escrituras por segundo. Con ``GROUP_COMMIT_ENABLED=1`` las rutas de
+escritura no hacen su propio commit: entregan a ``run`` una función (unidad)
+que aplica sus cambios sobre ``db.session`` y devuelve datos ya serializados.
+Un hilo por proceso junta las unidades que llegan durante
+``GROUP_COMMIT_WINDOW_MS`` milisegundos (hasta ``GROUP_COMMIT_MAX_BATCH``),
+las aplica en su propia sesión y hace un solo commit; cada petición recibe su
+resultado cuando ese commit termina.
+
+Si alguna unidad falla o el commit del lote falla, se deshace el lote y cada
+unidad se vuelve a aplicar en su propia transacción, así que el error de una
+petición no afecta a las demás. Por eso las unidades deben poder ejecutarse
+más de una vez: crean sus objetos dentro de la función, no usan objetos de la
+sesión de la petición (ni ``current_user``) y dejan el trabajo costoso, como
+el hash de contraseñas, fuera de la unidad.
+
+Cada petición espera su resultado como mucho ``GROUP_COMMIT_TIMEOUT``
+segundos (por defecto, el doble del ``busy_timeout`` de SQLite: el lote y, si
+falla, el reintento de cada unidad). Si se vence se lanza
+``GroupCommitTimeout`` y la API responde 503. Una unidad que el hilo aún no
+había tomado se cancela y no se aplica; si ya estaba en curso, puede
+aplicarse igual.
+
+Sin ``GROUP_COMMIT_ENABLED`` la unidad se ejecuta en la sesión de la petición
+y se hace commit enseguida, como siempre.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from . import db
+from .metrics import Histogram
+
+
+class GroupCommitTimeout(Exception):
+    """El hilo del commit en grupo no respondió a tiempo."""
+
+
+class _GroupCommitter:
+    def __init__(self):
+        self.app = None
+        self.enabled = False
+        self.window = 0.002
+        self.max_batch = 64
+        self.timeout = 10.0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.batches = 0
+        self.units = 0
+        self.fallbacks = 0
+        self.timeouts = 0
+        self.batch_size = Histogram(buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+        self.wait = Histogram()
+
+    def configure(self, app, enabled, window_ms, max_batch, timeout):
+        self.app = app
+        self.enabled = enabled
+        self.window = window_ms / 1000.0
+        self.max_batch = max(max_batch, 1)
+        self.timeout = timeout
+
+    def run(self, unit):
+        """Aplica ``unit()`` y hace commit (en grupo si está activo); devuelve su resultado."""
+        if not self.enabled:
+            result = unit()
+            db.session.commit()
+            return result
+
+        # Libera la conexión de la petición: en SQLite su transacción de lectura
+        # bloquearía el commit del lote mientras la petición espera
+        db.session.close()
+        self._start()
+        future = Future()
+        start = time.perf_counter()
+        self._queue.put((unit, future))
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            # Si el hilo aún no la tomó, la unidad ya no se aplicará
+            future.cancel()
+            self.timeouts += 1
+            raise GroupCommitTimeout()
+        finally:
+            self.wait.observe(time.perf_counter() - start)
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name='group-commit', daemon=True)
+                self._thread.start()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        # Se descartan las unidades cuya petición dejó de esperar
+        return [(unit, future) for unit, future in batch if future.set_running_or_notify_cancel()]
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            if not batch:
+                continue
+            try:
+                with self.app.app_context():
+                    self._commit(batch)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _commit(self, batch):
+        self.batches += 1
+        self.units += len(batch)
+        self.batch_size.observe(len(batch))
+        try:
+            results = [unit() for unit, _ in batch]
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            if len(batch) == 1:
+                batch[0][1].set_exception(e)
+                return
+            self.fallbacks += 1
+            for unit, future in batch:
+                try:
+                    result = unit()
+                    db.session.commit()
+                    future.set_result(result)
+                except Exception as e:
+                    db.session.rollback()
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'window_ms': self.window * 1000.0,
+            'max_batch': self.max_batch,
+            'batches': self.batches,
+            'units': self.units,
+            'fallbacks': self.fallbacks,
+            'timeouts': self.timeouts,
+            'batch_size': self.batch_size.to_dict(),
+            'wait_seconds': self.wait.to_dict(),
+        }
+
+
+committer = _GroupCommitter()
+
+
+def init_app(app):
+    """Configura el commit en grupo con ``GROUP_COMMIT_*`` de ``app.config``."""
+    committer.configure(
+        app, app.config['GROUP_COMMIT_ENABLED'], app.config['GROUP_COMMIT_WINDOW_MS'], app.config['GROUP_COMMIT_MAX_BATCH'],
+        app.config['GROUP_COMMIT_TIMEOUT'],
+    )
+
+
+def run(unit):
+    return committer.run(unit)
+
+
+def stats():
+    return committer.stats()
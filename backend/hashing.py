@@ -0,0 +1,178 @@
+"""Hashing de contraseñas configurable y fuera del hilo de la petición.
+
+El método de hash se configura por despliegue (``PASSWORD_HASH_METHOD``, con
+la sintaxis de Werkzeug, p. ej. ``scrypt:32768:8:1`` o ``pbkdf2:sha256:600000``).
+El cálculo se hace en un pool de ``PASSWORD_HASH_WORKERS`` procesos (por
+defecto el menor entre 2 y el número de núcleos) que se crea la primera vez
+que se usa, así que una ráfaga de logins no ocupa los hilos de las peticiones
+ni el GIL; con 0 se hace en el mismo hilo. En
+ambos casos ``PASSWORD_HASH_MAX_CONCURRENCY`` limita los hashes en curso: si
+se supera, se lanza ``PasswordHashingBusy`` y la API responde 429 en lugar de
+encolar trabajo sin límite. Un hash que no termina en ``PASSWORD_HASH_TIMEOUT``
+segundos también se responde con 429, pero su cupo sigue ocupado hasta que
+el proceso lo termina.
+"""
+import inspect
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from .metrics import Histogram
+
+# Por defecto se usa el mismo método que Werkzeug, para no invalidar hashes existentes.
+DEFAULT_METHOD = inspect.signature(generate_password_hash).parameters['method'].default
+DEFAULT_SALT_LENGTH = 16
+
+
+class PasswordHashingBusy(Exception):
+    """No hay capacidad para calcular otro hash en este momento."""
+
+
+class _Hasher:
+    def __init__(self):
+        self.method = DEFAULT_METHOD
+        self.salt_length = DEFAULT_SALT_LENGTH
+        self.workers = 0
+        self.max_concurrency = os.cpu_count() or 1
+        self.timeout = 30.0
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._method_prefix = None
+        self._counters_lock = threading.Lock()
+        self.rejected = 0
+        self.timeouts = 0
+        self.rehashed = 0
+        self.latency = {'hash': Histogram(), 'verify': Histogram()}
+        self.listeners = []
+
+    def configure(self, method, salt_length, workers, max_concurrency, timeout):
+        self.shutdown()
+        self.method = method
+        self.salt_length = salt_length
+        self.workers = workers
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._method_prefix = None
+
+    def _executor(self):
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False)
+                self._pool = None
+
+    def increment(self, counter):
+        with self._counters_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _run(self, operation, func, *args):
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            self.increment('rejected')
+            raise PasswordHashingBusy()
+        start = time.perf_counter()
+        try:
+            if self.workers > 0:
+                try:
+                    future = self._executor().submit(func, *args)
+                except BaseException:
+                    slots.release()
+                    raise
+                # El cupo se libera cuando el proceso termina el hash, no cuando la petición deja de esperarlo
+                future.add_done_callback(lambda _: slots.release())
+                try:
+                    return future.result(timeout=self.timeout)
+                except FutureTimeoutError:
+                    future.cancel()
+                    self.increment('timeouts')
+                    raise PasswordHashingBusy()
+            try:
+                return func(*args)
+            finally:
+                slots.release()
+        finally:
+            elapsed = time.perf_counter() - start
+            self.latency[operation].observe(elapsed)
+            for listener in self.listeners:
+                listener(operation, elapsed)
+
+    def hash(self, password):
+        return self._run('hash', generate_password_hash, password, self.method, self.salt_length)
+
+    def verify(self, pwhash, password):
+        return self._run('verify', check_password_hash, pwhash, password)
+
+    def method_prefix(self):
+        # Werkzeug completa los parámetros por defecto del método ('scrypt' ->
+        # 'scrypt:32768:8:1'); se obtiene el prefijo real generando un hash una vez.
+        if self._method_prefix is None:
+            self._method_prefix = generate_password_hash('', self.method, self.salt_length).split('$', 1)[0]
+        return self._method_prefix
+
+    def needs_rehash(self, pwhash):
+        return pwhash.split('$', 1)[0] != self.method_prefix()
+
+    def stats(self):
+        with self._counters_lock:
+            rejected, timeouts, rehashed = self.rejected, self.timeouts, self.rehashed
+        return {
+            'method': self.method,
+            'workers': self.workers,
+            'max_concurrency': self.max_concurrency,
+            'rejected': rejected,
+            'timeouts': timeouts,
+            'rehashed': rehashed,
+            'latency': {op: h.to_dict() for op, h in self.latency.items()},
+        }
+
+
+hasher = _Hasher()
+
+
+def init_app(app):
+    """Configura el hasher con los valores de ``app.config``."""
+    workers = app.config['PASSWORD_HASH_WORKERS']
+    hasher.configure(
+        method=app.config['PASSWORD_HASH_METHOD'],
+        salt_length=app.config['PASSWORD_HASH_SALT_LENGTH'],
+        workers=workers,
+        max_concurrency=app.config['PASSWORD_HASH_MAX_CONCURRENCY'] or max(workers, os.cpu_count() or 1) * 2,
+        timeout=app.config['PASSWORD_HASH_TIMEOUT'],
+    )
+
+
+def hash_password(password):
+    return hasher.hash(password)
+
+
+def verify_password(pwhash, password):
+    return hasher.verify(pwhash, password)
+
+
+def needs_rehash(pwhash):
+    """Indica si el hash fue generado con parámetros distintos a los configurados."""
+    return hasher.needs_rehash(pwhash)
+
+
+def record_rehash():
+    hasher.increment('rehashed')
+
+
+def add_listener(listener):
+    """Registra ``listener(operacion, segundos)``, llamado tras cada hash o verificación."""
+    hasher.listeners.append(listener)
+
+
+def stats():
+    return hasher.stats()
@@ -0,0 +1,295 @@
+"""Cola de trabajos en segundo plano sobre la tabla ``job`` de la misma base de datos.
+
+Las rutas encolan el trabajo costoso con ``encolar`` (en la transacción de la
+petición, sin commit), responden 202 con el id del trabajo y, tras el commit,
+llaman a ``despertar``. Los trabajadores toman los trabajos pendientes en
+orden de id y registran el resultado o el error; ``GET /api/jobs/<id>``
+consulta el estado.
+
+* ``JOBS_WORKERS`` hilos trabajadores por proceso, que arrancan con la
+  primera petición (después del fork de gunicorn). Con 0 el proceso web solo
+  encola y los trabajos los ejecuta ``flask --app run jobs work``, que puede
+  correr en otros procesos o máquinas contra la misma base de datos.
+* Un trabajo se reclama con un ``UPDATE`` condicional, así que varios
+  procesos pueden compartir la cola sin ejecutarlo dos veces.
+* Los trabajadores esperan a ``despertar`` o, como mucho,
+  ``JOBS_POLL_INTERVAL`` segundos, para ver lo que encolan otros procesos.
+  Si la cola está vacía esa consulta es de solo lectura: no toma el bloqueo
+  de escritura.
+* Un trabajo 'en_proceso' cuyo proceso murió se vuelve a tomar cuando pasan
+  ``JOBS_LEASE`` segundos desde su último latido, hasta ``JOBS_MAX_ATTEMPTS``
+  intentos; después queda 'fallido'. Las tareas llaman a ``latido`` en la
+  misma transacción de cada lote que escriben: renueva ``fecha_inicio`` y, si
+  otro trabajador ya retomó el trabajo, aborta esa transacción, así que una
+  ejecución vencida nunca escribe (ni aplica dos veces los agregados).
+
+Los tipos de trabajo se registran en ``TAREAS``: cada uno recibe los
+parámetros y el id del usuario que lo encoló y devuelve un diccionario que se
+guarda como resultado.
+"""
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import or_
+
+from . import db
+from .metrics import Histogram
+from .models import Job
+
+PENDIENTE, EN_PROCESO, TERMINADO, FALLIDO = 'pendiente', 'en_proceso', 'terminado', 'fallido'
+
+
+class JobError(Exception):
+    """Error esperado de un trabajo; su mensaje se guarda tal cual para el usuario."""
+
+
+class _TrabajoRetomado(Exception):
+    """El trabajo venció y otro trabajador lo retomó; esta ejecución se descarta sin escribir."""
+
+
+def _liquidar_declaraciones(parametros, user_id):
+    from . import liquidation
+    total = liquidation.liquidar_declaraciones(parametros['ids'])
+    latido()
+    db.session.commit()
+    return {'liquidadas': total}
+
+
+def _presentar_declaracion(parametros, user_id):
+    from . import liquidation
+    declaracion = liquidation.presentar_declaracion(parametros['declaration_id'], user_id)
+    latido()
+    db.session.commit()
+    return {'declaration_id': declaracion.id, 'estado_declaracion': declaracion.estado_declaracion,
+            'impuesto_liquidado': declaracion.impuesto_liquidado}
+
+
+def _recalcular_ano_fiscal(parametros, user_id):
+    from . import liquidation
+    return {'ano_fiscal': parametros['ano_fiscal'], 'total': liquidation.recalcular_ano_fiscal(parametros['ano_fiscal'])}
+
+
+TAREAS = {
+    'liquidar_declaraciones': _liquidar_declaraciones,
+    'presentar_declaracion': _presentar_declaracion,
+    'recalcular_ano_fiscal': _recalcular_ano_fiscal,
+}
+
+
+class _Cola:
+    def __init__(self):
+        self.app = None
+        self.workers = 0
+        self.poll_interval = 1.0
+        self.lease = 600.0
+        self.max_attempts = 3
+        self._despertar = threading.Event()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._detener = threading.Event()
+        # (id, intentos) del trabajo que ejecuta el hilo actual
+        self._actual = threading.local()
+        self.terminados = 0
+        self.fallidos = 0
+        self.reclamados = 0
+        self.duracion = Histogram(buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0))
+
+    def configure(self, app, workers, poll_interval, lease, max_attempts):
+        self.app = app
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.max_attempts = max_attempts
+
+    def start(self, workers=None):
+        """Arranca los hilos trabajadores si aún no están corriendo."""
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            self._detener.clear()
+            for n in range(self.workers if workers is None else workers):
+                thread = threading.Thread(target=self._trabajar, name=f'job-worker-{n}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self):
+        with self._lock:
+            self._detener.set()
+            self._despertar.set()
+            for thread in self._threads:
+                thread.join()
+            self._threads = []
+
+    def _reclamable(self, ahora):
+        vencido = ahora - timedelta(seconds=self.lease)
+        return or_(
+            Job.estado == PENDIENTE,
+            (Job.estado == EN_PROCESO) & (Job.fecha_inicio < vencido) & (Job.intentos < self.max_attempts),
+        )
+
+    def _reclamar(self):
+        """Marca como 'en_proceso' el siguiente trabajo disponible y lo devuelve (o None)."""
+        ahora = datetime.now()
+        # Los trabajos cuyo proceso murió demasiadas veces no se reintentan más; se busca
+        # primero con una lectura para no escribir en cada sondeo de la cola vacía
+        agotados = (
+            Job.estado == EN_PROCESO, Job.fecha_inicio < ahora - timedelta(seconds=self.lease),
+            Job.intentos >= self.max_attempts,
+        )
+        if db.session.query(Job.id).filter(*agotados).first() is not None:
+            db.session.query(Job).filter(*agotados).update(
+                {Job.estado: FALLIDO, Job.error: 'Se agotaron los intentos.', Job.fecha_fin: ahora},
+                synchronize_session=False,
+            )
+            db.session.commit()
+        while True:
+            candidato = db.session.query(Job.id, Job.estado).filter(self._reclamable(ahora)).order_by(Job.id).first()
+            if candidato is None:
+                db.session.rollback()
+                return None
+            tomados = db.session.query(Job).filter(Job.id == candidato.id, self._reclamable(ahora)).update(
+                {Job.estado: EN_PROCESO, Job.fecha_inicio: ahora, Job.intentos: Job.intentos + 1},
+                synchronize_session=False,
+            )
+            db.session.commit()
+            if tomados:
+                if candidato.estado == EN_PROCESO:
+                    self.reclamados += 1
+                return db.session.get(Job, candidato.id)
+
+    def latido(self):
+        """Renueva el plazo del trabajo en curso dentro de la transacción actual (sin commit).
+
+        Lanza ``_TrabajoRetomado`` si el trabajo ya no es de esta ejecución.
+        Fuera de un trabajo no hace nada.
+        """
+        actual = getattr(self._actual, 'job', None)
+        if actual is None:
+            return
+        job_id, intentos = actual
+        renovados = db.session.query(Job).filter(
+            Job.id == job_id, Job.estado == EN_PROCESO, Job.intentos == intentos,
+        ).update({Job.fecha_inicio: datetime.now()}, synchronize_session=False)
+        if not renovados:
+            raise _TrabajoRetomado()
+
+    def ejecutar_siguiente(self):
+        """Ejecuta un trabajo pendiente; devuelve False si no había ninguno."""
+        job = self._reclamar()
+        if job is None:
+            return False
+        inicio = time.perf_counter()
+        job_id = job.id
+        self._actual.job = (job_id, job.intentos)
+        try:
+            tarea = TAREAS.get(job.tipo)
+            if tarea is None:
+                raise JobError(f'Tipo de trabajo desconocido: {job.tipo}.')
+            resultado = tarea(json.loads(job.parametros), job.user_id)
+            self.latido()
+            job = db.session.get(Job, job_id)
+            job.estado = TERMINADO
+            job.resultado = json.dumps(resultado)
+            self.terminados += 1
+        except _TrabajoRetomado:
+            db.session.rollback()
+            print(f"El trabajo {job_id} venció y lo retomó otro trabajador; se descarta esta ejecución.")
+            return True
+        except Exception as e:
+            db.session.rollback()
+            if not isinstance(e, JobError):
+                print(f"Error en el trabajo {job.id} ({job.tipo}): {e}")
+            job = db.session.get(Job, job_id)
+            if job.estado != EN_PROCESO or job.intentos != self._actual.job[1]:
+                # Otro trabajador lo retomó; su ejecución registra el resultado
+                db.session.rollback()
+                return True
+            job.estado = FALLIDO
+            job.error = str(e) if isinstance(e, JobError) else 'Error interno al ejecutar el trabajo.'
+            self.fallidos += 1
+        finally:
+            self._actual.job = None
+        job.fecha_fin = datetime.now()
+        db.session.commit()
+        self.duracion.observe(time.perf_counter() - inicio)
+        return True
+
+    def _trabajar(self):
+        while not self._detener.is_set():
+            try:
+                with self.app.app_context():
+                    while not self._detener.is_set() and self.ejecutar_siguiente():
+                        pass
+            except Exception as e:
+                print(f"Error en el trabajador de la cola: {e}")
+            self._despertar.wait(self.poll_interval)
+            self._despertar.clear()
+
+    def stats(self):
+        return {
+            'workers': len(self._threads),
+            'terminados': self.terminados,
+            'fallidos': self.fallidos,
+            'reclamados': self.reclamados,
+            'duracion': self.duracion.to_dict(),
+        }
+
+
+cola = _Cola()
+
+
+def init_app(app):
+    """Configura la cola con ``JOBS_*`` y arranca los trabajadores con la primera petición."""
+    cola.configure(
+        app, app.config['JOBS_WORKERS'], app.config['JOBS_POLL_INTERVAL'],
+        app.config['JOBS_LEASE'], app.config['JOBS_MAX_ATTEMPTS'],
+    )
+    app.before_request(cola.start)
+    app.cli.add_command(jobs_cli)
+
+
+def encolar(tipo, parametros, user_id=None):
+    """Agrega un trabajo a la sesión (sin commit) y lo devuelve con su id."""
+    job = Job(tipo=tipo, estado=PENDIENTE, parametros=json.dumps(parametros), user_id=user_id)
+    db.session.add(job)
+    db.session.flush()
+    return job
+
+
+def latido():
+    """Renueva el plazo del trabajo en curso; las tareas lo llaman antes del commit de cada lote."""
+    cola.latido()
+
+
+def despertar():
+    """Avisa a los trabajadores de este proceso que hay trabajos nuevos (llamar tras el commit)."""
+    cola._despertar.set()
+
+
+def stats():
+    return cola.stats()
+
+
+@click.group('jobs')
+def jobs_cli():
+    """Cola de trabajos en segundo plano."""
+
+
+@jobs_cli.command('work')
+@click.option('--workers', default=2, show_default=True, help='Hilos trabajadores.')
+@with_appcontext
+def work_command(workers):
+    """Ejecuta trabajos de la cola hasta que se interrumpa."""
+    cola.start(workers)
+    print(f"Procesando trabajos con {workers} hilos (Ctrl+C para terminar).")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        cola.stop()
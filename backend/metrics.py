@@ -0,0 +1,117 @@
+"""Primitivas de métricas en proceso."""
+import threading
+
+# Límites superiores (en segundos) de los buckets de latencia por defecto.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Histograma acumulativo de latencias, seguro entre hilos."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = len(self.buckets)
+        for i, limit in enumerate(self.buckets):
+            if value <= limit:
+                index = i
+                break
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self):
+        """Devuelve conteos acumulados por bucket (incluido '+Inf'), suma y total."""
+        with self._lock:
+            counts = list(self._counts)
+            total_sum, count = self._sum, self._count
+        cumulative, running = [], 0
+        for limit, n in zip(self.buckets + (float('inf'),), counts):
+            running += n
+            cumulative.append(('+Inf' if limit == float('inf') else limit, running))
+        return {'buckets': cumulative, 'sum': total_sum, 'count': count}
+
+    def to_dict(self):
+        data = self.snapshot()
+        return {
+            'count': data['count'],
+            'sum': round(data['sum'], 6),
+            'avg': round(data['sum'] / data['count'], 6) if data['count'] else 0.0,
+            'buckets': {str(limit): n for limit, n in data['buckets']},
+        }
+
+
+class HistogramFamily:
+    """Histogramas con etiquetas (uno por combinación de valores), creados al primer uso."""
+
+    def __init__(self, labelnames, buckets=DEFAULT_BUCKETS):
+        self.labelnames = tuple(labelnames)
+        self.buckets = buckets
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, Histogram(self.buckets))
+        return child
+
+    def items(self):
+        with self._lock:
+            children = list(self._children.items())
+        return [(dict(zip(self.labelnames, values)), child) for values, child in children]
+
+
+class CounterFamily:
+    """Contadores con etiquetas, seguros entre hilos."""
+
+    def __init__(self, labelnames):
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, values, amount=1):
+        with self._lock:
+            self._values[values] = self._values.get(values, 0) + amount
+
+    def items(self):
+        with self._lock:
+            values = list(self._values.items())
+        return [(dict(zip(self.labelnames, key)), value) for key, value in values]
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels, extra=None):
+    pairs = list(labels.items()) + list((extra or {}).items())
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def render_histogram(name, help_text, items):
+    """Formato de texto de Prometheus para ``items`` = [(etiquetas, Histogram)]."""
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+    for labels, histogram in items:
+        data = histogram.snapshot()
+        for limit, count in data['buckets']:
+            lines.append(f'{name}_bucket{_labels(labels, {"le": limit})} {count}')
+        lines.append(f'{name}_sum{_labels(labels)} {data["sum"]!r}')
+        lines.append(f'{name}_count{_labels(labels)} {data["count"]}')
+    return lines
+
+
+def render_counter(name, help_text, items, kind='counter'):
+    """Formato de texto de Prometheus para ``items`` = [(etiquetas, valor)]."""
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+    lines.extend(f'{name}{_labels(labels)} {value!r}' for labels, value in items)
+    return lines
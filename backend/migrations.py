@@ -0,0 +1,212 @@
+"""Migraciones de esquema versionadas.
+
+Cada migración tiene un identificador ordenable y una función idempotente que
+se ejecuta dentro de ``db.session``; las aplicadas se registran en la tabla
+``schema_migrations``. Así una base de datos existente (creada con
+``db.create_all()`` en versiones anteriores) recibe las columnas e índices
+nuevos, y una base de datos vacía queda con el esquema completo.
+
+Como el modelo puede ir por delante del esquema mientras hay migraciones
+pendientes, las migraciones de datos deben leer y escribir columnas
+explícitas, no entidades completas.
+
+Uso desde la línea de comandos::
+
+    flask --app run db upgrade
+    flask --app run db status
+"""
+from datetime import datetime
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import Column, DateTime, MetaData, String, Table, inspect, text
+from sqlalchemy.exc import DBAPIError
+
+from . import db
+
+schema_migrations = Table(
+    'schema_migrations', MetaData(),
+    Column('version', String(100), primary_key=True),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+
+def _inspector():
+    return inspect(db.session.connection())
+
+
+def add_column_if_missing(model, column_name):
+    """Añade a la tabla existente una columna declarada en el modelo."""
+    table = model.__table__
+    if column_name in {c['name'] for c in _inspector().get_columns(table.name)}:
+        return
+    column = table.c[column_name]
+    dialect = db.session.get_bind().dialect
+    preparer = dialect.identifier_preparer
+    ddl = f'ALTER TABLE {preparer.format_table(table)} ADD COLUMN {preparer.format_column(column)} {column.type.compile(dialect=dialect)}'
+    if column.server_default is not None:
+        ddl += f' DEFAULT {column.server_default.arg}'
+        if not column.nullable:
+            ddl += ' NOT NULL'
+    db.session.execute(text(ddl))
+
+
+def create_indexes_if_missing(model):
+    """Crea los índices declarados en el modelo que aún no existen."""
+    table = model.__table__
+    existing = {i['name'] for i in _inspector().get_indexes(table.name)}
+    for index in table.indexes:
+        if index.name not in existing:
+            index.create(db.session.connection())
+
+
+def _base_schema():
+    db.metadata.create_all(db.session.connection(), checkfirst=True)
+
+
+def _liquidation_columns():
+    from .models import Declaration
+    for column_name in ('renta_gravable', 'impuesto_liquidado', 'fecha_liquidacion'):
+        add_column_if_missing(Declaration, column_name)
+
+
+def _user_search_tokens():
+    from . import rebuild_user_search_index
+    rebuild_user_search_index()
+
+
+def _hot_query_indexes():
+    from .models import User, Declaration, UserSearchToken
+    for model in (User, Declaration, UserSearchToken):
+        create_indexes_if_missing(model)
+
+
+def _declarations_version():
+    from .models import User
+    add_column_if_missing(User, 'declaraciones_version')
+
+
+def _declaration_rollups():
+    from . import reporting
+    from .models import DeclarationYearStats, DeclarationDailyStats
+    for model in (DeclarationYearStats, DeclarationDailyStats):
+        model.__table__.create(db.session.connection(), checkfirst=True)
+    reporting.reconstruir(incluir_archivo=False)
+
+
+def _user_search_trigrams():
+    from . import rebuild_user_search_index
+    from .models import UserSearchTrigram
+    UserSearchTrigram.__table__.create(db.session.connection(), checkfirst=True)
+    rebuild_user_search_index()
+
+
+def _email_changes():
+    from .models import EmailChange
+    EmailChange.__table__.create(db.session.connection(), checkfirst=True)
+
+
+def _jobs():
+    from .models import Job
+    Job.__table__.create(db.session.connection(), checkfirst=True)
+
+
+def _declaration_archive():
+    from .models import Declaration, DeclarationArchive
+    DeclarationArchive.__table__.create(db.session.connection(), checkfirst=True)
+    if db.session.get_bind().dialect.name != 'sqlite':
+        return
+    # En SQLite, sin AUTOINCREMENT, un id mayor que todos los de la tabla se reutiliza al borrarlo;
+    # los ids archivados deben seguir siendo únicos, así que se reconstruye la tabla con AUTOINCREMENT
+    sql = db.session.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'declaration'")).scalar()
+    if 'AUTOINCREMENT' in (sql or '').upper():
+        return
+    table = Declaration.__table__
+    columns = ', '.join(c['name'] for c in _inspector().get_columns(table.name) if c['name'] in table.c)
+    for index in _inspector().get_indexes(table.name):
+        db.session.execute(text(f'DROP INDEX {index["name"]}'))
+    db.session.execute(text('ALTER TABLE declaration RENAME TO declaration_0011'))
+    table.create(db.session.connection())
+    db.session.execute(text(f'INSERT INTO declaration ({columns}) SELECT {columns} FROM declaration_0011'))
+    db.session.execute(text('DROP TABLE declaration_0011'))
+
+
+def _user_changes():
+    from .models import UserChange
+    UserChange.__table__.create(db.session.connection(), checkfirst=True)
+
+
+def _seed_admin():
+    from . import create_admin_user
+    create_admin_user()
+
+
+MIGRATIONS = [
+    ('0001_base_schema', 'Crea las tablas que no existan', _base_schema),
+    ('0002_liquidation_columns', 'Columnas de liquidación en declaration', _liquidation_columns),
+    ('0003_user_search_tokens', 'Índice de búsqueda por nombre de usuarios existentes', _user_search_tokens),
+    ('0004_hot_query_indexes', 'Índices de consultas frecuentes y reportes', _hot_query_indexes),
+    ('0005_seed_admin', 'Usuario administrador por defecto', _seed_admin),
+    ('0006_declarations_version', 'Contador de versión de declaraciones por usuario', _declarations_version),
+    ('0007_declaration_rollups', 'Tablas de agregados para reportes', _declaration_rollups),
+    ('0008_user_search_trigrams', 'Trigramas de correo y documento para búsquedas por subcadena', _user_search_trigrams),
+    ('0009_email_changes', 'Bitácora de cambios de correo para el filtro de correos', _email_changes),
+    ('0010_jobs', 'Tabla de la cola de trabajos en segundo plano', _jobs),
+    ('0011_declaration_archive', 'Registro del archivo columnar de años cerrados; ids de declaraciones sin reutilizar', _declaration_archive),
+    ('0012_user_changes', 'Bitácora de usuarios modificados para invalidar la caché de usuarios entre procesos', _user_changes),
+]
+
+
+def applied_versions():
+    """Devuelve las versiones aplicadas (crea la tabla de control si no existe)."""
+    try:
+        return {row[0] for row in db.session.execute(schema_migrations.select())}
+    except DBAPIError:
+        db.session.rollback()
+    schema_migrations.create(db.session.connection(), checkfirst=True)
+    db.session.commit()
+    return set()
+
+
+def pending():
+    applied = applied_versions()
+    return [m for m in MIGRATIONS if m[0] not in applied]
+
+
+def upgrade():
+    """Aplica en orden las migraciones pendientes y devuelve sus identificadores."""
+    done = []
+    for version, description, migrate in pending():
+        try:
+            migrate()
+            db.session.execute(schema_migrations.insert().values(version=version, applied_at=datetime.now()))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        print(f"Migración aplicada: {version} - {description}")
+        done.append(version)
+    return done
+
+
+@click.group('db')
+def db_cli():
+    """Gestión del esquema de la base de datos."""
+
+
+@db_cli.command('upgrade')
+@with_appcontext
+def upgrade_command():
+    """Aplica las migraciones pendientes."""
+    if not upgrade():
+        print("La base de datos ya está actualizada.")
+
+
+@db_cli.command('status')
+@with_appcontext
+def status_command():
+    """Muestra las migraciones aplicadas y pendientes."""
+    applied = applied_versions()
+    for version, description, _ in MIGRATIONS:
+        mark = 'x' if version in applied else ' '
+        print(f"[{mark}] {version} - {description}")
@@ -1,8 +1,22 @@
-from . import db
+from . import db, hashing
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy.orm import validates
 from datetime import datetime
 import pytz
+import unicodedata
+
+def normalize_search_text(text):
+    """Pasa a minúsculas y quita tildes para comparar texto de búsqueda."""
+    text = unicodedata.normalize('NFKD', text or '')
+    return ''.join(c for c in text if not unicodedata.combining(c)).lower().strip()
+
+def search_trigrams(*values):
+    """Trigramas (subcadenas de 3 caracteres, en minúsculas) de los valores indicados."""
+    trigrams = set()
+    for value in values:
+        value = (value or '').lower()
+        trigrams.update(value[i:i + 3] for i in range(len(value) - 2))
+    return trigrams
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -13,18 +27,87 @@ class User(UserMixin, db.Model):
     password_hash = db.Column(db.String(256), nullable=False)
     estado = db.Column(db.String(50), default='activo', nullable=False)
     es_admin = db.Column(db.Boolean, default=False, nullable=False)
+    # Se incrementa con cada escritura sobre sus declaraciones; base del ETag de GET /api/declarations
+    declaraciones_version = db.Column(db.Integer, server_default='0', nullable=False)
     declarations = db.relationship('Declaration', backref='author', lazy=True)
+    search_tokens = db.relationship('UserSearchToken', lazy=True, cascade='all, delete-orphan')
+    search_trigrams = db.relationship('UserSearchTrigram', lazy=True, cascade='all, delete-orphan')
+
+    @validates('nombre_completo')
+    def _index_nombre(self, key, value):
+        # Mantiene el índice de búsqueda por palabra sincronizado con el nombre
+        tokens = sorted(set(normalize_search_text(value).split()))
+        self.search_tokens = [UserSearchToken(token=t) for t in tokens]
+        return value
+
+    @validates('correo_electronico', 'numero_documento')
+    def _index_trigrams(self, key, value):
+        # Trigramas del correo y del documento para búsquedas por subcadena
+        other = self.numero_documento if key == 'correo_electronico' else self.correo_electronico
+        self.search_trigrams = [UserSearchTrigram(trigram=t) for t in sorted(search_trigrams(value, other))]
+        return value
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hashing.hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return hashing.verify_password(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        return hashing.needs_rehash(self.password_hash)
 
     def __repr__(self):
         return f'<User {self.correo_electronico}>'
 
+class UserSearchToken(db.Model):
+    """Palabra normalizada del nombre de un usuario, indexada para búsquedas por prefijo."""
+    __table_args__ = (db.Index('ix_user_search_token_token', 'token', 'user_id'),)
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    token = db.Column(db.String(150), primary_key=True)
+
+    def __repr__(self):
+        return f'<UserSearchToken {self.user_id} {self.token}>'
+
+class UserSearchTrigram(db.Model):
+    """Trigrama del correo o del número de documento de un usuario, para búsquedas por subcadena."""
+    __table_args__ = (db.Index('ix_user_search_trigram_trigram', 'trigram', 'user_id'),)
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    trigram = db.Column(db.String(3), primary_key=True)
+
+    def __repr__(self):
+        return f'<UserSearchTrigram {self.user_id} {self.trigram}>'
+
+class EmailChange(db.Model):
+    """Bitácora de correos modificados, que leen los filtros de correos de otros procesos (ver backend/email_filter.py)."""
+    id = db.Column(db.Integer, primary_key=True)
+    correo_electronico = db.Column(db.String(150), nullable=False)
+    fecha = db.Column(db.DateTime, default=datetime.now, nullable=False)
+
+    def __repr__(self):
+        return f'<EmailChange {self.id} {self.correo_electronico}>'
+
+class UserChange(db.Model):
+    """Bitácora de usuarios modificados, con la que la caché de usuarios de cada proceso se invalida (ver backend/user_cache.py)."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    fecha = db.Column(db.DateTime, default=datetime.now, nullable=False)
+
+    def __repr__(self):
+        return f'<UserChange {self.id} {self.user_id}>'
+
 class Declaration(db.Model):
+    # (user_id, ano_fiscal) también sirve para los filtros solo por user_id (panel del usuario)
+    __table_args__ = (
+        db.Index('ix_declaration_user_ano', 'user_id', 'ano_fiscal'),
+        db.Index('ix_declaration_ano_id', 'ano_fiscal', 'id'),
+        db.Index('ix_declaration_estado_fecha', 'estado_declaracion', 'fecha_creacion'),
+        db.Index('ix_declaration_fecha_creacion', 'fecha_creacion'),
+        # Los ids de declaraciones archivadas (ver backend/archive.py) no se deben reutilizar
+        {'sqlite_autoincrement': True},
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     ano_fiscal = db.Column(db.Integer, nullable=False)
@@ -34,6 +117,11 @@ class Declaration(db.Model):
     dependientes = db.Column(db.Integer, nullable=True)
     otros_ingresos_deducciones = db.Column(db.Text, nullable=True)
     estado_declaracion = db.Column(db.String(50), default='Borrador', nullable=False)
+
+    # Resultado de la última liquidación (ver backend/liquidation.py)
+    renta_gravable = db.Column(db.Float, nullable=True)
+    impuesto_liquidado = db.Column(db.Float, nullable=True)
+    fecha_liquidacion = db.Column(db.DateTime, nullable=True)
     
     # Bug-014: Usar datetime.now() en lugar de datetime.utcnow
     # Esto registra la hora local del servidor en lugar de UTC
@@ -44,4 +132,69 @@ class Declaration(db.Model):
 
     def __repr__(self):
         return f'<Declaration {self.id} - User {self.user_id} - Año {self.ano_fiscal}>'
-    
\ No newline at end of file
+    
+class DeclarationYearStats(db.Model):
+    """Totales precalculados de declaraciones por año fiscal y estado civil (ver backend/reporting.py)."""
+    ano_fiscal = db.Column(db.Integer, primary_key=True)
+    estado_civil = db.Column(db.String(50), primary_key=True)
+    declaraciones = db.Column(db.Integer, nullable=False, default=0)
+    ingresos_totales = db.Column(db.Float, nullable=False, default=0.0)
+    deducciones_aplicadas = db.Column(db.Float, nullable=False, default=0.0)
+    impuesto_liquidado = db.Column(db.Float, nullable=False, default=0.0)
+
+    def __repr__(self):
+        return f'<DeclarationYearStats {self.ano_fiscal} {self.estado_civil}>'
+
+class DeclarationDailyStats(db.Model):
+    """Número de declaraciones por día de creación y estado (ver backend/reporting.py)."""
+    dia = db.Column(db.Date, primary_key=True)
+    estado_declaracion = db.Column(db.String(50), primary_key=True)
+    declaraciones = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<DeclarationDailyStats {self.dia} {self.estado_declaracion}>'
+
+class DeclarationArchive(db.Model):
+    """Años fiscales cerrados cuyas declaraciones están en el archivo columnar (ver backend/archive.py)."""
+    ano_fiscal = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    # 'archivando' mientras se escriben los archivos (el año ya no admite declaraciones nuevas), luego 'archivado'
+    estado = db.Column(db.String(20), nullable=False)
+    version = db.Column(db.Integer, nullable=False, default=1)
+    filas = db.Column(db.Integer, nullable=False, default=0)
+    fecha_archivo = db.Column(db.DateTime, default=datetime.now, nullable=False)
+
+    def __repr__(self):
+        return f'<DeclarationArchive {self.ano_fiscal} v{self.version} {self.estado}>'
+
+class Job(db.Model):
+    """Trabajo de la cola en segundo plano (ver backend/jobs.py)."""
+    __table_args__ = (db.Index('ix_job_estado_id', 'estado', 'id'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(50), nullable=False)
+    estado = db.Column(db.String(20), default='pendiente', nullable=False)
+    # Parámetros y resultado en JSON
+    parametros = db.Column(db.Text, nullable=False)
+    resultado = db.Column(db.Text, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    intentos = db.Column(db.Integer, default=0, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    fecha_creacion = db.Column(db.DateTime, default=datetime.now, nullable=False)
+    fecha_inicio = db.Column(db.DateTime, nullable=True)
+    fecha_fin = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.tipo} {self.estado}>'
+
+def bump_declarations_version(user_ids):
+    """Incrementa la versión de declaraciones de los usuarios indicados (sin hacer commit).
+
+    ``user_ids`` puede ser un id, una lista de ids o una subconsulta.
+    """
+    if isinstance(user_ids, int):
+        condition = User.id == user_ids
+    else:
+        condition = User.id.in_(user_ids)
+    db.session.query(User).filter(condition).update(
+        {User.declaraciones_version: User.declaraciones_version + 1}, synchronize_session=False
+    )
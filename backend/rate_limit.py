@@ -0,0 +1,210 @@
+"""Limitación de peticiones por token bucket.
+
+Cada regla tiene un nombre (``login``, ``find_mail``, ``reset_password``) y
+límites por IP y, opcionalmente, por cuenta (el correo). Un límite se escribe
+``"N/unidad"`` (``second``, ``minute`` u ``hour``): el bucket admite ráfagas
+de hasta N peticiones y se rellena a N por unidad de tiempo. Si algún bucket
+está vacío se lanza ``RateLimitExceeded`` y la API responde 429 con
+``Retry-After``.
+
+Los buckets viven en un backend intercambiable, elegido con
+``RATE_LIMIT_STORAGE``:
+
+* ``memory`` (por defecto): en el proceso; con varios workers cada uno limita
+  por separado.
+* ``redis://...``: compartido entre procesos y servidores (requiere el paquete
+  ``redis``).
+
+Se pueden registrar otros backends con ``register_backend``.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+
+UNIDADES = {'second': 1, 'minute': 60, 'hour': 3600}
+
+# Límites por defecto: (regla, ámbito) -> "N/unidad"
+DEFAULT_LIMITS = {
+    ('login', 'ip'): '20/minute',
+    ('login', 'account'): '5/minute',
+    ('find_mail', 'ip'): '30/minute',
+    ('reset_password', 'ip'): '10/minute',
+    ('reset_password', 'account'): '5/hour',
+}
+
+
+class RateLimitExceeded(Exception):
+    """Se agotó el bucket de una regla; ``retry_after`` en segundos."""
+
+    def __init__(self, rule, retry_after):
+        super().__init__(rule)
+        self.rule = rule
+        self.retry_after = retry_after
+
+
+def parse_limit(texto):
+    """Convierte ``"N/unidad"`` en (capacidad, tokens por segundo)."""
+    cantidad, _, unidad = texto.strip().partition('/')
+    unidad = unidad.strip().lower().rstrip('s')
+    if unidad not in UNIDADES or int(cantidad) <= 0:
+        raise ValueError(f'Límite inválido: {texto!r}. Formato: N/second, N/minute o N/hour.')
+    capacidad = int(cantidad)
+    return capacidad, capacidad / UNIDADES[unidad]
+
+
+class MemoryBackend:
+    """Buckets en memoria del proceso, en una LRU acotada."""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, rate, cost=1):
+        """Intenta gastar ``cost`` tokens; devuelve (permitido, tokens restantes)."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - last) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, tokens
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class RedisBackend:
+    """Buckets compartidos en Redis; la recarga y el consumo son atómicos (script Lua)."""
+
+    SCRIPT = """
+    local capacity = tonumber(ARGV[1])
+    local rate = tonumber(ARGV[2])
+    local cost = tonumber(ARGV[3])
+    local t = redis.call('TIME')
+    local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens = tonumber(bucket[1]) or capacity
+    local ts = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    local allowed = 0
+    if tokens >= cost then
+        tokens = tokens - cost
+        allowed = 1
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+    return {allowed, tostring(tokens)}
+    """
+
+    def __init__(self, url, prefix='rl:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('RATE_LIMIT_STORAGE usa Redis pero el paquete "redis" no está instalado.')
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+        self._script = self._client.register_script(self.SCRIPT)
+
+    def consume(self, key, capacity, rate, cost=1):
+        allowed, tokens = self._script(keys=[self.prefix + key], args=[capacity, rate, cost])
+        return bool(allowed), float(tokens)
+
+    def reset(self):
+        for key in self._client.scan_iter(self.prefix + '*'):
+            self._client.delete(key)
+
+
+BACKENDS = {'memory': lambda uri: MemoryBackend(), 'redis': RedisBackend, 'rediss': RedisBackend}
+
+
+def register_backend(scheme, factory):
+    """Registra un backend; ``factory`` recibe la URI de ``RATE_LIMIT_STORAGE``."""
+    BACKENDS[scheme] = factory
+
+
+def create_backend(uri):
+    scheme = uri.split(':', 1)[0].lower()
+    if scheme not in BACKENDS:
+        raise ValueError(f'RATE_LIMIT_STORAGE no soportado: {uri}. Opciones: {", ".join(sorted(BACKENDS))}.')
+    return BACKENDS[scheme](uri)
+
+
+class _Limiter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.configure(True, MemoryBackend(), {})
+
+    def configure(self, enabled, backend, overrides):
+        self.enabled = enabled
+        self.backend = backend
+        limits = dict(DEFAULT_LIMITS)
+        limits.update(overrides)
+        self.limits = {clave: parse_limit(texto) for clave, texto in limits.items() if texto}
+        with self._lock:
+            self.allowed = {regla: 0 for regla, _ in self.limits}
+            self.limited = {f'{regla}:{ambito}': 0 for regla, ambito in self.limits}
+            self.errors = 0
+
+    def check(self, rule, ip, account=None):
+        """Consume un token de cada bucket de la regla; lanza ``RateLimitExceeded`` si alguno está vacío."""
+        if not self.enabled:
+            return
+        for scope, value in (('ip', ip), ('account', account)):
+            limit = self.limits.get((rule, scope))
+            if limit is None or not value:
+                continue
+            capacity, rate = limit
+            try:
+                allowed, tokens = self.backend.consume(f'{rule}:{scope}:{value}', capacity, rate)
+            except Exception as e:
+                # Si el backend compartido falla se deja pasar la petición: el límite no debe tumbar la API.
+                print(f"Error en el backend de rate limiting: {e}")
+                with self._lock:
+                    self.errors += 1
+                continue
+            if not allowed:
+                with self._lock:
+                    self.limited[f'{rule}:{scope}'] += 1
+                raise RateLimitExceeded(rule, max(1, math.ceil((1 - tokens) / rate)))
+        with self._lock:
+            self.allowed[rule] = self.allowed.get(rule, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'backend': type(self.backend).__name__,
+                'limits': {f'{r}:{s}': {'capacity': c, 'per_second': round(v, 6)} for (r, s), (c, v) in self.limits.items()},
+                'allowed': dict(self.allowed),
+                'limited': dict(self.limited),
+                'backend_errors': self.errors,
+            }
+
+
+limiter = _Limiter()
+
+
+def init_app(app):
+    """Configura el limitador con ``RATE_LIMIT_*`` de ``app.config``."""
+    overrides = {
+        (regla, ambito): app.config[f'RATE_LIMIT_{regla.upper()}_{ambito.upper()}']
+        for regla, ambito in DEFAULT_LIMITS
+        if app.config.get(f'RATE_LIMIT_{regla.upper()}_{ambito.upper()}') is not None
+    }
+    limiter.configure(app.config['RATE_LIMIT_ENABLED'], create_backend(app.config['RATE_LIMIT_STORAGE']), overrides)
+
+
+def check(rule, ip, account=None):
+    limiter.check(rule, ip, account)
+
+
+def stats():
+    return limiter.stats()
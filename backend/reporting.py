@@ -0,0 +1,179 @@
+"""Agregados precalculados de declaraciones para los reportes de administración.
+
+Dos tablas de resumen se mantienen de forma incremental en la misma
+transacción que escribe las declaraciones:
+
+* ``DeclarationYearStats``: número de declaraciones y sumas de ingresos,
+  deducciones e impuesto por (``ano_fiscal``, ``estado_civil``).
+* ``DeclarationDailyStats``: número de declaraciones por día de creación y
+  ``estado_declaracion``.
+
+Quien crea, cambia o re-liquida declaraciones llama a ``registrar`` (o a
+``ajustar_impuesto`` / ``cambiar_estado``) antes del commit. Los reportes leen
+solo estas tablas, cuyo tamaño no depende del número de declaraciones.
+``reconstruir`` las recalcula desde cero (``flask --app run rebuild-reports``).
+"""
+from collections import defaultdict
+from datetime import date, datetime
+
+import importlib
+
+from sqlalchemy import func
+
+from . import db, serializers
+from .models import Declaration, DeclarationYearStats, DeclarationDailyStats
+
+METRICAS_ANO = ('declaraciones', 'ingresos_totales', 'deducciones_aplicadas', 'impuesto_liquidado')
+METRICAS_DIA = ('declaraciones',)
+
+# Dialectos con INSERT ... ON CONFLICT; el módulo se importa al usarlo (el de
+# PostgreSQL tarda en importarse y no hace falta con SQLite)
+_DIALECTOS_CON_UPSERT = ('sqlite', 'postgresql')
+
+
+def _insert_con_upsert(dialecto):
+    if dialecto not in _DIALECTOS_CON_UPSERT:
+        return None
+    return importlib.import_module(f'sqlalchemy.dialects.{dialecto}').insert
+
+
+def _dia(valor):
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    return date.fromisoformat(valor[:10])
+
+
+def _aplicar(modelo, claves, metricas, deltas):
+    """Suma ``deltas`` ({clave: [métricas]}) a las filas de ``modelo``, creándolas si faltan."""
+    if not deltas:
+        return
+    filas = [
+        {**dict(zip(claves, clave)), **dict(zip(metricas, valores))}
+        for clave, valores in deltas.items()
+    ]
+    tabla = modelo.__table__
+    insert = _insert_con_upsert(db.session.get_bind().dialect.name)
+    if insert is not None:
+        stmt = insert(tabla)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(claves),
+            set_={m: tabla.c[m] + stmt.excluded[m] for m in metricas},
+        )
+        db.session.execute(stmt, filas)
+        return
+
+    for fila in filas:
+        condicion = [tabla.c[c] == fila[c] for c in claves]
+        actualizadas = db.session.execute(
+            tabla.update().where(*condicion).values({m: tabla.c[m] + fila[m] for m in metricas})
+        ).rowcount
+        if not actualizadas:
+            db.session.execute(tabla.insert().values(fila))
+
+
+def registrar(declaraciones, signo=1):
+    """Suma (o resta con ``signo=-1``) declaraciones a los agregados, sin hacer commit.
+
+    ``declaraciones`` es un iterable de diccionarios o instancias con
+    ``ano_fiscal``, ``estado_civil``, ``ingresos_totales``,
+    ``deducciones_aplicadas``, ``impuesto_liquidado``, ``estado_declaracion``
+    y ``fecha_creacion``.
+    """
+    por_ano = defaultdict(lambda: [0, 0.0, 0.0, 0.0])
+    por_dia = defaultdict(lambda: [0])
+    for d in declaraciones:
+        campo = dict.get if isinstance(d, dict) else getattr
+        totales = por_ano[(campo(d, 'ano_fiscal'), campo(d, 'estado_civil'))]
+        totales[0] += signo
+        totales[1] += signo * (campo(d, 'ingresos_totales') or 0.0)
+        totales[2] += signo * (campo(d, 'deducciones_aplicadas') or 0.0)
+        totales[3] += signo * (campo(d, 'impuesto_liquidado') or 0.0)
+        fecha = campo(d, 'fecha_creacion')
+        if fecha is not None:
+            por_dia[(_dia(fecha), campo(d, 'estado_declaracion'))][0] += signo
+
+    _aplicar(DeclarationYearStats, ('ano_fiscal', 'estado_civil'), METRICAS_ANO, por_ano)
+    _aplicar(DeclarationDailyStats, ('dia', 'estado_declaracion'), METRICAS_DIA, por_dia)
+
+
+def ajustar_impuesto(ano_fiscal, diferencias):
+    """Aplica cambios de impuesto liquidado ({estado_civil: diferencia}) de un año, sin commit."""
+    _aplicar(DeclarationYearStats, ('ano_fiscal', 'estado_civil'), ('impuesto_liquidado',), {
+        (ano_fiscal, estado_civil): [diferencia] for estado_civil, diferencia in diferencias.items() if diferencia
+    })
+
+
+def cambiar_estado(cambios):
+    """Mueve conteos diarios entre estados; ``cambios`` es un iterable de (fecha, anterior, nuevo)."""
+    por_dia = defaultdict(lambda: [0])
+    for fecha, anterior, nuevo in cambios:
+        if fecha is None or anterior == nuevo:
+            continue
+        por_dia[(_dia(fecha), anterior)][0] -= 1
+        por_dia[(_dia(fecha), nuevo)][0] += 1
+    _aplicar(DeclarationDailyStats, ('dia', 'estado_declaracion'), METRICAS_DIA, por_dia)
+
+
+def reconstruir(incluir_archivo=True):
+    """Recalcula ambas tablas de agregados a partir de ``Declaration`` y del archivo de años cerrados.
+
+    ``incluir_archivo=False`` es para migraciones anteriores a la tabla ``declaration_archive``.
+    """
+    from . import archive
+    db.session.execute(DeclarationYearStats.__table__.delete())
+    db.session.execute(DeclarationDailyStats.__table__.delete())
+
+    totales_ano, totales_dia = archive.agregados() if incluir_archivo else ({}, defaultdict(int))
+    for ano, estado_civil, *valores in db.session.query(
+        Declaration.ano_fiscal, Declaration.estado_civil, func.count(Declaration.id),
+        func.coalesce(func.sum(Declaration.ingresos_totales), 0.0),
+        func.coalesce(func.sum(Declaration.deducciones_aplicadas), 0.0),
+        func.coalesce(func.sum(Declaration.impuesto_liquidado), 0.0),
+    ).group_by(Declaration.ano_fiscal, Declaration.estado_civil):
+        acumulado = totales_ano.setdefault((ano, estado_civil), [0, 0.0, 0.0, 0.0])
+        totales_ano[(ano, estado_civil)] = [a + v for a, v in zip(acumulado, valores)]
+    dia = func.date(Declaration.fecha_creacion)
+    for d, estado, n in (
+        db.session.query(dia, Declaration.estado_declaracion, func.count(Declaration.id))
+        .filter(Declaration.fecha_creacion.isnot(None))
+        .group_by(dia, Declaration.estado_declaracion)
+    ):
+        totales_dia[(_dia(d), estado)] += n
+
+    por_ano = [
+        {'ano_fiscal': ano, 'estado_civil': estado_civil, **dict(zip(METRICAS_ANO, valores))}
+        for (ano, estado_civil), valores in totales_ano.items()
+    ]
+    por_dia = [
+        {'dia': d, 'estado_declaracion': estado, 'declaraciones': n}
+        for (d, estado), n in totales_dia.items()
+    ]
+    if por_ano:
+        db.session.execute(DeclarationYearStats.__table__.insert(), por_ano)
+    if por_dia:
+        db.session.execute(DeclarationDailyStats.__table__.insert(), por_dia)
+    db.session.commit()
+    return len(por_ano), len(por_dia)
+
+
+def resumen_por_ano(ano_fiscal=None):
+    """Tuplas de ``DeclarationYearStats`` (opcionalmente de un año) ordenadas por año y estado civil.
+
+    Las columnas siguen el orden de ``serializers.YEAR_STATS_SCHEMA``.
+    """
+    query = db.session.query(*serializers.YEAR_STATS_SCHEMA.columns()).filter(DeclarationYearStats.declaraciones != 0)
+    if ano_fiscal is not None:
+        query = query.filter(DeclarationYearStats.ano_fiscal == ano_fiscal)
+    return query.order_by(DeclarationYearStats.ano_fiscal, DeclarationYearStats.estado_civil).all()
+
+
+def resumen_por_dia(desde, hasta, estado_declaracion=None):
+    """Tuplas de ``DeclarationDailyStats`` entre ``desde`` y ``hasta`` (inclusive)."""
+    query = db.session.query(*serializers.DAILY_STATS_SCHEMA.columns()).filter(
+        DeclarationDailyStats.dia.between(desde, hasta), DeclarationDailyStats.declaraciones != 0
+    )
+    if estado_declaracion:
+        query = query.filter(DeclarationDailyStats.estado_declaracion == estado_declaracion)
+    return query.order_by(DeclarationDailyStats.dia, DeclarationDailyStats.estado_declaracion).all()
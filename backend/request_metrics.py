@@ -0,0 +1,141 @@
+"""Métricas por petición y exposición en formato Prometheus.
+
+Por cada petición se registra, con el endpoint de Flask como etiqueta:
+
+* latencia total (histograma) y conteo por código de estado;
+* número de consultas SQL y tiempo total en SQL (eventos
+  ``before/after_cursor_execute`` del engine);
+* tiempo de hashing de contraseñas (listener de ``hashing``).
+
+``render`` produce el texto que sirve ``GET /api/metrics``. Las métricas son
+del proceso: con varios workers cada uno expone las suyas.
+
+Con ``SLOW_REQUEST_MS > 0`` las peticiones más lentas que ese umbral se
+registran (``app.logger``, nivel WARNING) junto con las sentencias SQL que
+ejecutaron.
+"""
+import time
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+
+from . import db_profile, hashing
+from .metrics import CounterFamily, HistogramFamily, render_counter, render_histogram
+
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250, 1000)
+MAX_STATEMENT_LENGTH = 500
+
+request_latency = HistogramFamily(('endpoint', 'method'))
+request_count = CounterFamily(('endpoint', 'method', 'status'))
+sql_queries = HistogramFamily(('endpoint',), buckets=QUERY_COUNT_BUCKETS)
+sql_time = HistogramFamily(('endpoint',))
+hash_time = CounterFamily(('endpoint', 'operation'))
+
+settings = {'slow_request_ms': 0.0, 'slow_request_max_statements': 20}
+
+
+def _state():
+    if has_request_context():
+        return g.get('_request_metrics')
+    return None
+
+
+def _before_request():
+    g._request_metrics = {
+        'start': time.perf_counter(),
+        'queries': 0,
+        'sql_time': 0.0,
+        'statements': [] if settings['slow_request_ms'] else None,
+    }
+
+
+def _after_request(response):
+    state = _state()
+    if state is None:
+        return response
+    elapsed = time.perf_counter() - state['start']
+    endpoint = request.endpoint or 'unmatched'
+    request_latency.labels(endpoint, request.method).observe(elapsed)
+    request_count.inc((endpoint, request.method, str(response.status_code)))
+    sql_queries.labels(endpoint).observe(state['queries'])
+    sql_time.labels(endpoint).observe(state['sql_time'])
+
+    if settings['slow_request_ms'] and elapsed * 1000 >= settings['slow_request_ms']:
+        _log_slow_request(endpoint, response.status_code, elapsed, state)
+    return response
+
+
+def _log_slow_request(endpoint, status, elapsed, state):
+    lines = ["Petición lenta: %s %s (%s) -> %s en %.1f ms; %d consultas SQL (%.1f ms)"]
+    args = [request.method, request.path, endpoint, status, elapsed * 1000, state['queries'], state['sql_time'] * 1000]
+    for statement, duration in state['statements']:
+        lines.append("    %8.1f ms  %s")
+        args.extend((duration * 1000, statement))
+    omitted = state['queries'] - len(state['statements'])
+    if omitted > 0:
+        lines.append("    ... %d consultas más")
+        args.append(omitted)
+    # Con el logger de la aplicación el nivel y el destino se configuran como el resto de los logs (p. ej. en gunicorn)
+    current_app.logger.warning('\n'.join(lines), *args)
+
+
+def _on_hash(operation, elapsed):
+    if _state() is not None:
+        hash_time.inc((request.endpoint or 'unmatched', operation), elapsed)
+
+
+def instrument_engine(engine):
+    """Registra los eventos que cuentan y cronometran las consultas SQL de cada petición."""
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('_query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['_query_start'].pop()
+        state = _state()
+        if state is None:
+            return
+        state['queries'] += 1
+        state['sql_time'] += elapsed
+        statements = state['statements']
+        if statements is not None and len(statements) < settings['slow_request_max_statements']:
+            statements.append((' '.join(statement.split())[:MAX_STATEMENT_LENGTH], elapsed))
+
+    @event.listens_for(engine, 'handle_error')
+    def handle_error(context):
+        # Una sentencia que falla no llega a after_cursor_execute
+        if context.connection is not None and context.connection.info.get('_query_start'):
+            context.connection.info['_query_start'].pop()
+
+
+def init_app(app):
+    """Registra los hooks de petición y de hashing en ``app``."""
+    settings['slow_request_ms'] = app.config['SLOW_REQUEST_MS']
+    settings['slow_request_max_statements'] = app.config['SLOW_REQUEST_MAX_STATEMENTS']
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    if _on_hash not in hashing.hasher.listeners:
+        hashing.add_listener(_on_hash)
+
+
+def render():
+    """Devuelve todas las métricas en el formato de texto de Prometheus."""
+    lines = []
+    lines += render_histogram('http_request_duration_seconds', 'Latencia de las peticiones HTTP.',
+                              request_latency.items())
+    lines += render_counter('http_requests_total', 'Peticiones HTTP por código de estado.', request_count.items())
+    lines += render_histogram('db_queries_per_request', 'Consultas SQL ejecutadas por petición.', sql_queries.items())
+    lines += render_histogram('db_query_seconds_per_request', 'Tiempo total en SQL por petición.', sql_time.items())
+    lines += render_counter('password_hash_seconds_total', 'Tiempo de hashing de contraseñas por endpoint.',
+                            hash_time.items())
+    lines += render_histogram('password_hash_duration_seconds', 'Duración de cada hash o verificación.',
+                              [({'operation': op}, h) for op, h in hashing.hasher.latency.items()])
+    lines += render_counter('password_hash_rejected_total', 'Hashes rechazados por falta de capacidad.',
+                            [({}, hashing.hasher.rejected)])
+    lines += render_histogram('db_pool_wait_seconds', 'Espera por una conexión del pool.',
+                              [({}, db_profile.pool_stats.wait)])
+    lines += render_counter('db_pool_checked_out', 'Conexiones del pool en uso.',
+                            [({}, db_profile.stats()['checked_out'])], kind='gauge')
+    return '\n'.join(lines) + '\n'
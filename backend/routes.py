@@ -1,14 +1,25 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context, current_app
 from flask_login import login_user, current_user, logout_user, login_required
 from functools import wraps
+from sqlalchemy import and_, false, func
 from . import db
-from .models import User, Declaration
+from .models import User, Declaration, Job, UserSearchToken, UserSearchTrigram, normalize_search_text, search_trigrams, bump_declarations_version
+from . import liquidation, tax_rules, bulk_import, bulk_export, user_cache, hashing, db_profile, serializers, reporting, simulation, rate_limit, email_filter, request_metrics, jobs, group_commit, db_routing, archive
+from .cache import LRUCache
 from werkzeug.security import generate_password_hash
 import re
-from datetime import datetime
+import hashlib
+import hmac
+from datetime import datetime, date, timedelta
 
 bp = Blueprint('main', __name__)
 
+MAX_PER_PAGE = 100
+MAX_REPORT_DAYS = 366
+
+# Totales de la búsqueda de usuarios en modo cursor: se recalculan como mucho cada 30 s por búsqueda
+user_totals = LRUCache(maxsize=256, ttl=30.0)
+
 # Helper para validar contraseña fuerte
 def validate_strong_password(password):
     """Valida que la contraseña cumpla con requisitos de seguridad"""
@@ -30,32 +41,129 @@ def validate_email(email):
     email_regex = r'^[a-zA-Z0-9._-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
     return re.match(email_regex, email) is not None
 
+def validate_declaration(data):
+    """Valida los datos de una declaración con las reglas fiscales de su año.
+
+    Devuelve (errores, reglas); las reglas son las del año fiscal indicado o,
+    si el año es inválido, las del año en curso.
+    """
+    required_fields = ['ano_fiscal', 'ingresos_totales', 'estado_civil']
+    errors = {field: f'{field.replace("_"," ").capitalize()} es requerido.' for field in required_fields if field not in data or data[field] is None}
+
+    current_year = datetime.now().year
+    reglas = tax_rules.obtener_reglas(current_year)
+
+    # BUG-012: Validación de año fiscal (no futuro)
+    try:
+        ano = int(data.get('ano_fiscal', 0))
+        if not reglas.ano_minimo <= ano <= current_year:
+            errors['ano_fiscal'] = f'Año fiscal inválido. Debe estar entre {reglas.ano_minimo} y {current_year}.'
+        else:
+            reglas = tax_rules.obtener_reglas(ano)
+    except (ValueError, TypeError):
+        errors['ano_fiscal'] = 'Año fiscal debe ser un número entero válido.'
+
+    # BUG-013: Validación de ingresos mínimos (1M COP)
+    try:
+        ingresos = float(data.get('ingresos_totales', 0.0))
+        
+        if ingresos < 0:
+            errors['ingresos_totales'] = 'Los ingresos totales no pueden ser negativos.'
+        elif ingresos < reglas.ingresos_minimos:
+            errors['ingresos_totales'] = f'Los ingresos totales deben ser al menos ${reglas.ingresos_minimos:,.0f} COP.'
+        elif ingresos > reglas.ingresos_maximos:
+            errors['ingresos_totales'] = 'Los ingresos totales exceden el límite permitido.'
+            
+    except (ValueError, TypeError):
+        errors['ingresos_totales'] = 'Los ingresos totales deben ser un número válido.'
+
+    if data.get('estado_civil') not in reglas.estados_civiles:
+        errors['estado_civil'] = f'Estado civil inválido. Debe ser uno de: {", ".join(reglas.estados_civiles)}.'
+
+    # BUG-007: Validación de dependientes máximo 5
+    if 'dependientes' in data and data['dependientes'] is not None:
+        try:
+            deps = int(data['dependientes'])
+            if deps < 0:
+                errors['dependientes'] = 'El número de dependientes no puede ser negativo.'
+            if deps > reglas.max_dependientes:
+                errors['dependientes'] = f'El número de dependientes no puede ser mayor a {reglas.max_dependientes} (normativa colombiana).'
+        except (ValueError, TypeError):
+            errors['dependientes'] = 'El número de dependientes debe ser un número entero válido.'
+
+    # BUG-004: Validación de deducciones con mínimo razonable
+    if 'deducciones_aplicadas' in data and data['deducciones_aplicadas'] is not None:
+        try:
+            deducciones = float(data['deducciones_aplicadas'])
+            if deducciones < 0:
+                errors['deducciones_aplicadas'] = 'Las deducciones no pueden ser negativas.'
+            elif deducciones > 0 and deducciones < reglas.deduccion_minima:
+                errors['deducciones_aplicadas'] = f'Las deducciones deben ser al menos ${reglas.deduccion_minima:,.0f} COP o cero.'
+            elif deducciones > reglas.deducciones_maximas:
+                errors['deducciones_aplicadas'] = 'Las deducciones exceden el límite permitido.'
+        except (ValueError, TypeError):
+            errors['deducciones_aplicadas'] = 'Las deducciones deben ser un número válido.'
+
+    if 'otros_ingresos_deducciones' in data and data['otros_ingresos_deducciones']:
+        otros = str(data['otros_ingresos_deducciones']).strip()
+        if len(otros) > reglas.max_otros_ingresos_deducciones:
+            errors['otros_ingresos_deducciones'] = f'El campo "otros ingresos/deducciones" es demasiado largo (máximo {reglas.max_otros_ingresos_deducciones} caracteres).'
+
+    return errors, reglas
+
+def validate_new_declaration(data, closed_years=None):
+    """Como ``validate_declaration``, pero rechaza los años fiscales cerrados y archivados.
+
+    ``closed_years`` evita consultar el registro del archivo en cada fila de una importación.
+    """
+    errors, reglas = validate_declaration(data)
+    if 'ano_fiscal' not in errors:
+        ano = int(data['ano_fiscal'])
+        if ano in (archive.anos_cerrados() if closed_years is None else closed_years):
+            errors['ano_fiscal'] = f'El año fiscal {ano} está cerrado y archivado; no admite declaraciones nuevas.'
+    return errors, reglas
+
 def serialize(model_instance):
     """Serializa un objeto SQLAlchemy a un diccionario."""
-    if isinstance(model_instance, User):
-        return {
-            'id': model_instance.id,
-            'nombre_completo': model_instance.nombre_completo,
-            'tipo_documento': model_instance.tipo_documento,
-            'numero_documento': model_instance.numero_documento,
-            'correo_electronico': model_instance.correo_electronico,
-            'estado': model_instance.estado,
-            'es_admin': model_instance.es_admin
-        }
-    elif isinstance(model_instance, Declaration):
-        return {
-            'id': model_instance.id,
-            'user_id': model_instance.user_id,
-            'ano_fiscal': model_instance.ano_fiscal,
-            'ingresos_totales': model_instance.ingresos_totales,
-            'deducciones_aplicadas': model_instance.deducciones_aplicadas,
-            'estado_civil': model_instance.estado_civil,
-            'dependientes': model_instance.dependientes,
-            'otros_ingresos_deducciones': model_instance.otros_ingresos_deducciones,
-            'estado_declaracion': model_instance.estado_declaracion,
-            'fecha_creacion': model_instance.fecha_creacion.isoformat()
-        }
-    return None
+    return serializers.serialize(model_instance)
+
+def wants_async():
+    """Indica si la petición pide encolar el trabajo (``?async=1``) en lugar de hacerlo en línea."""
+    return request.args.get('async', '').lower() in ('1', 'true', 'yes')
+
+def job_accepted(job, message, **extra):
+    """Respuesta 202 con el trabajo encolado (ya serializado) y la URL para consultar su estado."""
+    return jsonify({'message': message, 'job': job, **extra}), 202, {'Location': f'/api/jobs/{job["id"]}'}
+
+@bp.errorhandler(hashing.PasswordHashingBusy)
+def password_hashing_busy(e):
+    """Respuesta cuando el pool de hashing está saturado."""
+    return jsonify({'message': 'El servidor está ocupado. Intenta de nuevo en unos segundos.'}), 429, {'Retry-After': '1'}
+
+@bp.errorhandler(group_commit.GroupCommitTimeout)
+def group_commit_timeout(e):
+    """Respuesta cuando el commit en grupo no confirmó la escritura a tiempo."""
+    return jsonify({'message': 'El servidor está ocupado. Intenta de nuevo en unos segundos.'}), 503, {'Retry-After': '1'}
+
+@bp.errorhandler(rate_limit.RateLimitExceeded)
+def rate_limit_exceeded(e):
+    """Respuesta cuando se supera el límite de peticiones de una regla."""
+    return jsonify({'message': 'Demasiadas solicitudes. Intenta de nuevo más tarde.'}), 429, {'Retry-After': str(e.retry_after)}
+
+def rate_limited(rule, account_field=None):
+    """Aplica la regla de rate limiting por IP y, si se indica, por el correo del campo ``account_field``."""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            account = None
+            if account_field:
+                data = request.get_json(silent=True) or {}
+                account = data.get(account_field) if isinstance(data, dict) else None
+                account = str(account).strip().lower() if account else None
+            rate_limit.check(rule, request.remote_addr, account)
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
 
 def admin_required(f):
     @wraps(f)
@@ -125,7 +233,7 @@ def register_api():
         email = data['correo_electronico'].strip().lower()
         if not validate_email(email):
              errors['correo_electronico'] = 'El formato del correo electrónico es inválido.'
-        elif User.query.filter_by(correo_electronico=email).first():
+        elif email_filter.might_exist(email) and User.query.filter_by(correo_electronico=email).first():
             errors['correo_electronico'] = 'El correo electrónico ya está en uso.'
 
     if errors:
@@ -136,24 +244,37 @@ def register_api():
         if current_user.is_authenticated and current_user.es_admin and 'es_admin' in data:
             es_admin = bool(data['es_admin'])
         
-        user = User(
-            nombre_completo=data['nombre_completo'].strip(),
-            tipo_documento=data['tipo_documento'],
-            numero_documento=data['numero_documento'],
-            correo_electronico=data['correo_electronico'].strip().lower(),
-            estado='activo',
-            es_admin=es_admin
-        )
-        user.set_password(data['password'])
-        db.session.add(user)
-        db.session.commit()
-        return jsonify({'message': 'Usuario creado exitosamente.', 'user': serialize(user)}), 201
+        password_hash = hashing.hash_password(data['password'])
+
+        def crear_usuario():
+            user = User(
+                nombre_completo=data['nombre_completo'].strip(),
+                tipo_documento=data['tipo_documento'],
+                numero_documento=data['numero_documento'],
+                correo_electronico=data['correo_electronico'].strip().lower(),
+                password_hash=password_hash,
+                estado='activo',
+                es_admin=es_admin
+            )
+            db.session.add(user)
+            db.session.flush()
+            return serialize(user)
+
+        user = group_commit.run(crear_usuario)
+        user_cache.invalidate(user['id'])
+        email_filter.add(user['correo_electronico'])
+        user_totals.clear()
+        return jsonify({'message': 'Usuario creado exitosamente.', 'user': user}), 201
+    except (hashing.PasswordHashingBusy, group_commit.GroupCommitTimeout):
+        db.session.rollback()
+        raise
     except Exception as e:
         db.session.rollback()
         print(f"Error en registro: {e}")
         return jsonify({'message': 'Error interno al crear el usuario.'}), 500
 
 @bp.route('/login', methods=['POST'])
+@rate_limited('login', account_field='correo_electronico')
 def login_api():
     if current_user.is_authenticated:
         return jsonify({'message': 'Ya estás autenticado.', 'user': serialize(current_user)}), 200
@@ -161,11 +282,28 @@ def login_api():
     data = request.get_json()
     if not data or 'correo_electronico' not in data or 'password' not in data:
         return jsonify({'message': 'Correo electrónico y contraseña requeridos.'}), 400
+    if not isinstance(data['correo_electronico'], str) or not isinstance(data['password'], str):
+        return jsonify({'message': 'Credenciales inválidas.'}), 401
+
+    # Un correo que seguro no existe se rechaza sin consultar la BD ni verificar el hash
+    if not email_filter.might_exist(data['correo_electronico']):
+        return jsonify({'message': 'Credenciales inválidas.'}), 401
 
     user = User.query.filter_by(correo_electronico=data['correo_electronico']).first()
+    if user is None:
+        email_filter.record_false_positive()
 
     if user and user.check_password(data['password']):
         if user.estado == 'activo':
+            if user.password_needs_rehash():
+                # Actualiza el hash a los parámetros configurados aprovechando que se tiene la contraseña
+                try:
+                    user.set_password(data['password'])
+                    db.session.commit()
+                    hashing.record_rehash()
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Error al actualizar el hash de la contraseña: {e}")
             login_user(user, remember=data.get('remember', False))
             return jsonify({'message': 'Inicio de sesión exitoso.', 'user': serialize(user)}), 200
         else:
@@ -175,10 +313,64 @@ def login_api():
 
 @bp.route('/declarations', methods=['GET'])
 @login_required
+@db_routing.read_only
 def get_declarations():
-    """Obtiene las declaraciones del usuario actual."""
-    declarations = Declaration.query.filter_by(author=current_user).all()
-    return jsonify([serialize(d) for d in declarations]), 200
+    """Obtiene las declaraciones del usuario actual.
+
+    Parámetros opcionales: ``fields`` (columnas separadas por coma), ``ano_fiscal``,
+    ``estado_declaracion`` y paginación por llave con ``limit``/``cursor`` (el
+    siguiente cursor se devuelve en la cabecera ``X-Next-Cursor``). La respuesta
+    lleva un ETag derivado de la versión de declaraciones del usuario, así que un
+    ``If-None-Match`` vigente se responde con 304 sin consultar las declaraciones.
+    """
+    schema = serializers.DECLARATION_SCHEMA
+    fields = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()] or list(schema.fields)
+    invalid = [f for f in fields if f not in schema.fields]
+    if invalid:
+        return jsonify({'message': f'Campos inválidos: {", ".join(invalid)}.'}), 400
+
+    ano_fiscal = request.args.get('ano_fiscal', type=int)
+    estado = request.args.get('estado_declaracion')
+    paginated = 'limit' in request.args or 'cursor' in request.args
+    try:
+        limit = min(max(int(request.args.get('limit', 50)), 1), MAX_PER_PAGE)
+        cursor = int(request.args.get('cursor') or 0)
+    except ValueError:
+        return jsonify({'message': 'Los parámetros limit y cursor deben ser números enteros.'}), 400
+
+    version = db.session.query(User.declaraciones_version).filter(User.id == current_user.id).scalar()
+    params = '&'.join(f'{k}={v}' for k, v in sorted(request.args.items(multi=True)))
+    etag = hashlib.sha1(f'{current_user.id}:{version}:{params}'.encode()).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+
+    query = db.session.query(Declaration.id, *schema.columns(fields)).filter(Declaration.user_id == current_user.id)
+    if ano_fiscal is not None:
+        query = query.filter(Declaration.ano_fiscal == ano_fiscal)
+    if estado:
+        query = query.filter(Declaration.estado_declaracion == estado)
+
+    # Las declaraciones de años archivados se leen del archivo columnar y se mezclan por id
+    next_cursor = None
+    if paginated:
+        rows = query.filter(Declaration.id > cursor).order_by(Declaration.id.asc()).limit(limit + 1).all()
+        rows = archive.combinar(rows, current_user.id, fields, ano_fiscal, estado, cursor, limit + 1)
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = rows[-1][0]
+    else:
+        rows = archive.combinar(query.order_by(Declaration.id.asc()).all(), current_user.id, fields, ano_fiscal, estado)
+
+    to_dict = schema.row_serializer(fields)
+    response = serializers.json_response([to_dict(row[1:]) for row in rows])
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    if next_cursor is not None:
+        response.headers['X-Next-Cursor'] = str(next_cursor)
+    return response
 
 @bp.route('/declarations', methods=['POST'])
 @login_required
@@ -188,105 +380,331 @@ def create_declaration():
     if not data:
         return jsonify({'message': 'No se recibieron datos JSON.'}), 400
 
-    required_fields = ['ano_fiscal', 'ingresos_totales', 'estado_civil']
-    errors = {field: f'{field.replace("_"," ").capitalize()} es requerido.' for field in required_fields if field not in data or data[field] is None}
-
-    # BUG-012: Validación de año fiscal (no futuro)
-    try:
-        ano = int(data.get('ano_fiscal', 0))
-        current_year = datetime.now().year
-        if not 2000 <= ano <= current_year:
-            errors['ano_fiscal'] = f'Año fiscal inválido. Debe estar entre 2000 y {current_year}.'
-    except (ValueError, TypeError):
-        errors['ano_fiscal'] = 'Año fiscal debe ser un número entero válido.'
+    errors, reglas = validate_new_declaration(data)
+    if errors:
+        return jsonify({'message': 'Errores de validación', 'errors': errors}), 422
 
-    # BUG-013: Validación de ingresos mínimos (1M COP)
     try:
-        ingresos = float(data.get('ingresos_totales', 0.0))
-        
-        if ingresos < 0:
-            errors['ingresos_totales'] = 'Los ingresos totales no pueden ser negativos.'
-        elif ingresos < 1000000:
-            errors['ingresos_totales'] = 'Los ingresos totales deben ser al menos $1,000,000 COP.'
-        elif ingresos > 999999999999:
-            errors['ingresos_totales'] = 'Los ingresos totales exceden el límite permitido.'
-            
-    except (ValueError, TypeError):
-        errors['ingresos_totales'] = 'Los ingresos totales deben ser un número válido.'
-
-    estados_civiles_validos = ['Soltero/a', 'Casado/a', 'Divorciado/a', 'Viudo/a']
-    if data.get('estado_civil') not in estados_civiles_validos:
-        errors['estado_civil'] = f'Estado civil inválido. Debe ser uno de: {", ".join(estados_civiles_validos)}.'
+        # validate_declaration acepta números como texto; se guardan (y se agregan) ya convertidos
+        ingresos = float(data['ingresos_totales'])
+        deducciones = float(data.get('deducciones_aplicadas') or 0.0)
+        dependientes = int(data['dependientes']) if data.get('dependientes') is not None else None
+        asincrono = wants_async()
+        user_id = current_user.id
+        resultado = None if asincrono else liquidation.liquidar([ingresos], [deducciones], [dependientes or 0], reglas)
+
+        def guardar_declaracion():
+            ahora = datetime.now()
+            declaration = Declaration(
+                ano_fiscal=int(data['ano_fiscal']),
+                ingresos_totales=ingresos,
+                deducciones_aplicadas=deducciones,
+                estado_civil=data['estado_civil'],
+                dependientes=dependientes,
+                otros_ingresos_deducciones=data.get('otros_ingresos_deducciones'),
+                estado_declaracion='Guardada',
+                fecha_creacion=ahora,
+                user_id=user_id
+            )
+            if resultado is not None:
+                declaration.renta_gravable = float(resultado['renta_gravable'][0])
+                declaration.impuesto_liquidado = float(resultado['impuesto'][0])
+                declaration.fecha_liquidacion = ahora
+            db.session.add(declaration)
+            bump_declarations_version(user_id)
+            reporting.registrar([declaration])
+            db.session.flush()
+            # Sin liquidar, el trabajo completa el impuesto y los agregados
+            job = jobs.encolar('liquidar_declaraciones', {'ids': [declaration.id]}, user_id) if asincrono else None
+            return serialize(declaration), serialize(job) if job is not None else None
+
+        declaration, job = group_commit.run(guardar_declaracion)
+        if job is not None:
+            jobs.despertar()
+            return job_accepted(job, 'Declaración guardada. La liquidación está en proceso.', declaration=declaration)
+        return jsonify({'message': 'Declaración creada exitosamente.', 'declaration': declaration}), 201
+    except group_commit.GroupCommitTimeout:
+        db.session.rollback()
+        raise
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error al crear declaración: {e}")
+        return jsonify({'message': 'Error interno al crear la declaración.'}), 500
 
-    # BUG-007: Validación de dependientes máximo 5
-    if 'dependientes' in data and data['dependientes'] is not None:
-        try:
-            deps = int(data['dependientes'])
-            if deps < 0:
-                errors['dependientes'] = 'El número de dependientes no puede ser negativo.'
-            if deps > 5:
-                errors['dependientes'] = 'El número de dependientes no puede ser mayor a 5 (normativa colombiana).'
-        except (ValueError, TypeError):
-            errors['dependientes'] = 'El número de dependientes debe ser un número entero válido.'
+@bp.route('/declarations/<int:declaration_id>/submit', methods=['POST'])
+@login_required
+def submit_declaration(declaration_id):
+    """Encola la presentación de una declaración guardada (se re-liquida con las reglas vigentes)."""
+    declaration = db.session.query(Declaration.id, Declaration.estado_declaracion).filter(
+        Declaration.id == declaration_id, Declaration.user_id == current_user.id
+    ).first()
+    if declaration is None:
+        return jsonify({'message': 'Declaración no encontrada.'}), 404
+    if declaration.estado_declaracion != 'Guardada':
+        return jsonify({'message': 'Solo se pueden presentar declaraciones guardadas.'}), 409
 
-    # BUG-004: Validación de deducciones con mínimo razonable
-    if 'deducciones_aplicadas' in data and data['deducciones_aplicadas'] is not None:
-        try:
-            deducciones = float(data['deducciones_aplicadas'])
-            if deducciones < 0:
-                errors['deducciones_aplicadas'] = 'Las deducciones no pueden ser negativas.'
-            elif deducciones > 0 and deducciones < 1000:
-                errors['deducciones_aplicadas'] = 'Las deducciones deben ser al menos $1,000 COP o cero.'
-            elif deducciones > 999999999999:
-                errors['deducciones_aplicadas'] = 'Las deducciones exceden el límite permitido.'
-        except (ValueError, TypeError):
-            errors['deducciones_aplicadas'] = 'Las deducciones deben ser un número válido.'
+    try:
+        job = jobs.encolar('presentar_declaracion', {'declaration_id': declaration_id}, current_user.id)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error al encolar la presentación: {e}")
+        return jsonify({'message': 'Error interno al presentar la declaración.'}), 500
+    jobs.despertar()
+    return job_accepted(serialize(job), 'La presentación de la declaración está en proceso.')
 
-    if 'otros_ingresos_deducciones' in data and data['otros_ingresos_deducciones']:
-        otros = str(data['otros_ingresos_deducciones']).strip()
-        if len(otros) > 1000:
-            errors['otros_ingresos_deducciones'] = 'El campo "otros ingresos/deducciones" es demasiado largo (máximo 1000 caracteres).'
+@bp.route('/jobs/<int:job_id>', methods=['GET'])
+@login_required
+def get_job(job_id):
+    """Estado y resultado de un trabajo en segundo plano del usuario (o de cualquiera, para administradores)."""
+    job = db.session.get(Job, job_id)
+    if job is None or (job.user_id != current_user.id and not current_user.es_admin):
+        return jsonify({'message': 'Trabajo no encontrado.'}), 404
+    return jsonify(serialize(job)), 200
+
+@bp.route('/simulate', methods=['POST'])
+@login_required
+def simulate():
+    """Liquida una declaración base y una grilla de escenarios sin guardar nada."""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'message': 'No se recibieron datos JSON.'}), 400
 
+    errors, body = simulation.simular(data.get('base'), data.get('escenarios'), validate_declaration)
     if errors:
         return jsonify({'message': 'Errores de validación', 'errors': errors}), 422
+    return Response(body, mimetype='application/json')
+
+@bp.route('/declarations/import', methods=['POST'])
+@login_required
+def import_declarations():
+    """Importa declaraciones en bloque desde un archivo CSV o NDJSON."""
+    formato = bulk_import.detectar_formato(request.content_type, request.args.get('format'))
+    if not formato:
+        return jsonify({'message': 'Formato no soportado. Use CSV (text/csv) o NDJSON (application/x-ndjson).'}), 415
 
     try:
-        declaration = Declaration(
-            ano_fiscal=data['ano_fiscal'],
-            ingresos_totales=data['ingresos_totales'],
-            deducciones_aplicadas=data.get('deducciones_aplicadas', 0.0),
-            estado_civil=data['estado_civil'],
-            dependientes=data.get('dependientes'),
-            otros_ingresos_deducciones=data.get('otros_ingresos_deducciones'),
-            estado_declaracion='Guardada',
-            author=current_user
+        closed_years = archive.anos_cerrados()
+        reporte = bulk_import.importar_declaraciones(
+            request.stream, formato, current_user.id, lambda data: validate_new_declaration(data, closed_years)
         )
-        db.session.add(declaration)
-        db.session.commit()
-        return jsonify({'message': 'Declaración creada exitosamente.', 'declaration': serialize(declaration)}), 201
+    except UnicodeDecodeError:
+        db.session.rollback()
+        return jsonify({'message': 'El archivo debe estar codificado en UTF-8.'}), 400
     except Exception as e:
         db.session.rollback()
-        print(f"Error al crear declaración: {e}")
-        return jsonify({'message': 'Error interno al crear la declaración.'}), 500
+        print(f"Error al importar declaraciones: {e}")
+        return jsonify({'message': 'Error interno al importar las declaraciones.'}), 500
+
+    status = 200 if reporte['importadas'] or not reporte['con_errores'] else 422
+    return jsonify({'message': f"Se importaron {reporte['importadas']} de {reporte['procesadas']} declaraciones.", **reporte}), status
+
+def export_response(chunks, formato, nombre):
+    """Envuelve un generador de exportación en una respuesta HTTP por bloques."""
+    return Response(
+        stream_with_context(chunks),
+        mimetype=bulk_export.TIPOS_CONTENIDO[formato],
+        headers={'Content-Disposition': f'attachment; filename={nombre}.{formato}'}
+    )
+
+@bp.route('/admin/export/users', methods=['GET'])
+@login_required
+@admin_required
+def admin_export_users():
+    """Exporta todos los usuarios en NDJSON o CSV."""
+    formato = request.args.get('format', 'ndjson').lower()
+    if formato not in bulk_export.TIPOS_CONTENIDO:
+        return jsonify({'message': 'Formato inválido. Debe ser "ndjson" o "csv".'}), 400
+    return export_response(bulk_export.exportar_usuarios(formato), formato, 'usuarios')
+
+@bp.route('/admin/export/declarations', methods=['GET'])
+@login_required
+@admin_required
+def admin_export_declarations():
+    """Exporta las declaraciones (opcionalmente filtradas) en NDJSON o CSV."""
+    formato = request.args.get('format', 'ndjson').lower()
+    if formato not in bulk_export.TIPOS_CONTENIDO:
+        return jsonify({'message': 'Formato inválido. Debe ser "ndjson" o "csv".'}), 400
+    ano_fiscal = request.args.get('ano_fiscal', type=int)
+    user_id = request.args.get('user_id', type=int)
+    chunks = bulk_export.exportar_declaraciones(formato, ano_fiscal=ano_fiscal, user_id=user_id)
+    return export_response(chunks, formato, 'declaraciones')
+
+@bp.route('/admin/stats', methods=['GET'])
+@login_required
+@admin_required
+def admin_get_stats():
+    """Devuelve los contadores internos de rendimiento (cachés, etc.)."""
+    return jsonify({
+        'user_cache': user_cache.cache.stats(),
+        'password_hashing': hashing.stats(),
+        'db_pool': db_profile.stats(db.engine),
+        'simulation_cache': simulation.cache.stats(),
+        'rate_limit': rate_limit.stats(),
+        'email_filter': email_filter.stats(),
+        'user_totals': user_totals.stats(),
+        'jobs': jobs.stats(),
+        'group_commit': group_commit.stats(),
+        'db_routing': db_routing.stats(),
+        'archive': archive.stats()
+    }), 200
+
+@bp.route('/metrics', methods=['GET'])
+def metrics():
+    """Métricas del proceso en formato Prometheus (token ``METRICS_TOKEN`` o sesión de administrador)."""
+    token = current_app.config.get('METRICS_TOKEN')
+    authorization = request.headers.get('Authorization', '')
+    authorized = bool(token) and hmac.compare_digest(authorization, f'Bearer {token}')
+    if not authorized and not (current_user.is_authenticated and current_user.es_admin):
+        return jsonify({'message': 'Acceso no autorizado.'}), 403
+    return Response(request_metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@bp.route('/admin/tax-rules/<int:ano_fiscal>', methods=['GET'])
+@login_required
+@admin_required
+def admin_get_tax_rules(ano_fiscal):
+    """Devuelve las reglas fiscales vigentes (y su versión) para un año."""
+    return jsonify(tax_rules.obtener_reglas(ano_fiscal).to_dict()), 200
+
+@bp.route('/admin/declarations/<int:ano_fiscal>/liquidate', methods=['POST'])
+@login_required
+@admin_required
+def admin_liquidate_fiscal_year(ano_fiscal):
+    """Re-liquida en bloque todas las declaraciones de un año fiscal (con ``?async=1``, en segundo plano)."""
+    if wants_async():
+        try:
+            job = jobs.encolar('recalcular_ano_fiscal', {'ano_fiscal': ano_fiscal}, current_user.id)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error al encolar la liquidación del año fiscal: {e}")
+            return jsonify({'message': 'Error interno al liquidar las declaraciones.'}), 500
+        jobs.despertar()
+        return job_accepted(serialize(job), f'La liquidación del año {ano_fiscal} está en proceso.', ano_fiscal=ano_fiscal)
+    try:
+        total = liquidation.recalcular_ano_fiscal(ano_fiscal)
+        return jsonify({'message': f'Se liquidaron {total} declaraciones del año {ano_fiscal}.', 'ano_fiscal': ano_fiscal, 'total': total}), 200
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error al liquidar año fiscal: {e}")
+        return jsonify({'message': 'Error interno al liquidar las declaraciones.'}), 500
+
+@bp.route('/admin/reports/fiscal-years', methods=['GET'])
+@login_required
+@admin_required
+def admin_report_fiscal_years():
+    """Totales de declaraciones, ingresos, deducciones e impuesto por año fiscal y estado civil."""
+    ano_fiscal = request.args.get('ano_fiscal', type=int)
+    to_dict = serializers.YEAR_STATS_SCHEMA.row_serializer()
+    return serializers.json_response([to_dict(row) for row in reporting.resumen_por_ano(ano_fiscal)])
+
+@bp.route('/admin/reports/daily', methods=['GET'])
+@login_required
+@admin_required
+def admin_report_daily():
+    """Número de declaraciones por día de creación y estado (últimos 30 días por defecto)."""
+    try:
+        hasta = date.fromisoformat(request.args['hasta']) if request.args.get('hasta') else date.today()
+        desde = date.fromisoformat(request.args['desde']) if request.args.get('desde') else hasta - timedelta(days=29)
+    except ValueError:
+        return jsonify({'message': 'Las fechas deben tener el formato AAAA-MM-DD.'}), 400
+    if desde > hasta:
+        return jsonify({'message': 'La fecha "desde" no puede ser posterior a "hasta".'}), 400
+    if (hasta - desde).days > MAX_REPORT_DAYS:
+        return jsonify({'message': f'El rango no puede superar {MAX_REPORT_DAYS} días.'}), 400
+    rows = reporting.resumen_por_dia(desde, hasta, request.args.get('estado_declaracion'))
+    to_dict = serializers.DAILY_STATS_SCHEMA.row_serializer()
+    return serializers.json_response([to_dict(row) for row in rows])
+
+def prefix_range(column, prefix):
+    """Filtro por prefijo expresado como rango, para que use el índice de la columna."""
+    return (column >= prefix) & (column < prefix + '\uffff')
+
+def user_search_filter(search_query):
+    """Construye el filtro de búsqueda de usuarios sobre columnas indexadas.
+
+    Cada palabra de la búsqueda debe ser prefijo de alguna palabra del nombre
+    (índice ``UserSearchToken``); también se acepta que la búsqueda aparezca en
+    cualquier parte del correo o del número de documento. Con 3 o más
+    caracteres los candidatos salen del índice de trigramas
+    (``UserSearchTrigram``) y solo se comparan con ``LIKE`` esas filas; con
+    menos se exige un prefijo.
+    """
+    words = normalize_search_text(search_query).split()
+    name_filter = and_(*[
+        User.id.in_(db.session.query(UserSearchToken.user_id).filter(prefix_range(UserSearchToken.token, w)))
+        for w in words
+    ]) if words else false()
+    term = search_query.strip()
+    trigrams = search_trigrams(term)
+    if not trigrams:
+        return (
+            name_filter |
+            prefix_range(User.correo_electronico, term.lower()) |
+            prefix_range(User.numero_documento, term)
+        )
+    candidates = (
+        db.session.query(UserSearchTrigram.user_id)
+        .filter(UserSearchTrigram.trigram.in_(trigrams))
+        .group_by(UserSearchTrigram.user_id)
+        .having(func.count() == len(trigrams))
+    )
+    substring = User.id.in_(candidates) & (
+        User.correo_electronico.icontains(term, autoescape=True) |
+        User.numero_documento.icontains(term, autoescape=True)
+    )
+    return name_filter | substring
 
 @bp.route('/admin/users', methods=['GET'])
 @login_required
 @admin_required
+@db_routing.read_only
 def admin_get_users():
-    """Obtiene la lista de usuarios (con paginación y búsqueda)."""
+    """Obtiene la lista de usuarios (con paginación y búsqueda).
+
+    Con ``cursor`` (el ``next_cursor`` opaco de la página anterior, vacío para
+    la primera) usa paginación por llave; el total se calcula una vez por
+    búsqueda y se guarda unos segundos en ``user_totals``, así que puede
+    quedar levemente desactualizado. Sin cursor mantiene la paginación clásica
+    por ``page``.
+    """
     search_query = request.args.get('q', '')
     page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 10, type=int)
+    per_page = min(max(request.args.get('per_page', 10, type=int), 1), MAX_PER_PAGE)
+    cursor = request.args.get('cursor')
     
     query = User.query
     
-    if search_query:
-        search_term = f'%{search_query}%'
-        query = query.filter(
-            User.nombre_completo.ilike(search_term) |
-            User.correo_electronico.ilike(search_term) |
-            User.numero_documento.ilike(search_term)
+    if search_query.strip():
+        query = query.filter(user_search_filter(search_query))
+
+    if cursor is not None:
+        try:
+            last_id = serializers.decode_cursor(cursor)
+        except ValueError:
+            return jsonify({'message': 'Cursor inválido.'}), 400
+
+        total_key = search_query.strip().lower()
+        total = user_totals.get(total_key)
+        if total is None:
+            total = query.with_entities(func.count(User.id)).scalar()
+            user_totals.put(total_key, total)
+
+        schema = serializers.USER_SCHEMA
+        rows = (
+            query.with_entities(*schema.columns())
+            .filter(User.id > last_id).order_by(User.id.asc()).limit(per_page + 1).all()
         )
+        has_next = len(rows) > per_page
+        rows = rows[:per_page]
+        to_dict = schema.row_serializer()
+        return serializers.json_response({
+            'users': [to_dict(row) for row in rows],
+            'per_page': per_page,
+            'total': total,
+            'has_next': has_next,
+            'next_cursor': serializers.encode_cursor(rows[-1][0]) if has_next else None
+        })
     
     try:
         pagination = query.order_by(User.id.asc()).paginate(page=page, per_page=per_page, error_out=False)
@@ -303,23 +721,14 @@ def admin_get_users():
         }
     except Exception as e:
         print(f"Error en paginación: {e}")
-        users = query.order_by(User.id.asc()).all()
-        
-        response = {
-            'users': [serialize(u) for u in users],
-            'total': len(users),
-            'page': 1,
-            'per_page': len(users),
-            'pages': 1,
-            'has_next': False,
-            'has_prev': False
-        }
+        return jsonify({'message': 'Error interno al paginar los usuarios.'}), 500
     
     return jsonify(response), 200
 
 @bp.route('/admin/users/<int:user_id>', methods=['GET'])
 @login_required
 @admin_required
+@db_routing.read_only
 def admin_get_user(user_id):
     """Obtiene los detalles de un usuario específico."""
     user = User.query.get_or_404(user_id)
@@ -369,19 +778,35 @@ def admin_update_user(user_id):
         return jsonify({'message': 'Errores de validación', 'errors': errors}), 422
 
     try:
+        cambios = {}
         if 'nombre_completo' in data:
-            user_to_edit.nombre_completo = data['nombre_completo'].strip()
+            cambios['nombre_completo'] = data['nombre_completo'].strip()
         if 'correo_electronico' in data:
-            user_to_edit.correo_electronico = data['correo_electronico'].strip().lower()
+            cambios['correo_electronico'] = data['correo_electronico'].strip().lower()
         if 'password' in data and data['password']:
-            user_to_edit.set_password(data['password'])
+            cambios['password_hash'] = hashing.hash_password(data['password'])
         if 'estado' in data:
-            user_to_edit.estado = data['estado']
+            cambios['estado'] = data['estado']
         if 'es_admin' in data:
-            user_to_edit.es_admin = data['es_admin']
-
-        db.session.commit()
-        return jsonify({'message': 'Usuario actualizado exitosamente.', 'user': serialize(user_to_edit)}), 200
+            cambios['es_admin'] = data['es_admin']
+
+        def actualizar_usuario():
+            user = db.session.get(User, user_id)
+            if 'correo_electronico' in cambios and cambios['correo_electronico'] != user.correo_electronico:
+                email_filter.record_change(cambios['correo_electronico'])
+            for campo, valor in cambios.items():
+                setattr(user, campo, valor)
+            user_cache.record_change(user_id)
+            return serialize(user)
+
+        user = group_commit.run(actualizar_usuario)
+        user_cache.invalidate(user_id)
+        email_filter.add(user['correo_electronico'])
+        user_totals.clear()
+        return jsonify({'message': 'Usuario actualizado exitosamente.', 'user': user}), 200
+    except (hashing.PasswordHashingBusy, group_commit.GroupCommitTimeout):
+        db.session.rollback()
+        raise
     except Exception as e:
         db.session.rollback()
         print(f"Error al actualizar usuario: {e}")
@@ -398,42 +823,66 @@ def admin_toggle_user_status_api(user_id):
         return jsonify({'message': 'No puedes cambiar tu propio estado.'}), 403
 
     try:
-        user_to_toggle.estado = 'inactivo' if user_to_toggle.estado == 'activo' else 'activo'
-        db.session.commit()
-        return jsonify({'message': f'Estado del usuario cambiado a {user_to_toggle.estado}.', 'user': serialize(user_to_toggle)}), 200
+        def alternar_estado():
+            user = db.session.get(User, user_id)
+            user.estado = 'inactivo' if user.estado == 'activo' else 'activo'
+            user_cache.record_change(user_id)
+            return serialize(user)
+
+        user = group_commit.run(alternar_estado)
+        user_cache.invalidate(user_id)
+        return jsonify({'message': f"Estado del usuario cambiado a {user['estado']}.", 'user': user}), 200
+    except group_commit.GroupCommitTimeout:
+        db.session.rollback()
+        raise
     except Exception as e:
         db.session.rollback()
         print(f"Error al cambiar estado del usuario: {e}")
         return jsonify({'message': 'Error interno al cambiar el estado del usuario.'}), 500
     
 @bp.route('/find-mail', methods=['GET'])
+@rate_limited('find_mail')
+@db_routing.read_only
 def find_mail():
     """Verifica si el correo electrónico existe."""
     email = request.args.get('mail')
     if not email:
         return jsonify({'message': 'Correo electrónico requerido.'}), 400
 
-    user = User.query.filter_by(correo_electronico=email).first()
+    if not email_filter.might_exist(email):
+        return jsonify({'exists': False}), 200
+
+    user = db.session.query(User.id).filter_by(correo_electronico=email).first()
     if user:
         return jsonify({'exists': True}), 200
     else:
+        email_filter.record_false_positive()
         return jsonify({'exists': False}), 200
 
 @bp.route('/reset-password', methods=['PATCH'])
+@rate_limited('reset_password', account_field='mail')
 def update_pass():
     """Actualiza la contraseña del usuario."""
     data = request.get_json()
     if not data or 'mail' not in data or 'password' not in data:
         return jsonify({'message': 'Correo electrónico y contraseña requeridos.'}), 400
+    if not isinstance(data['mail'], str):
+        return jsonify({'message': 'El correo electrónico debe ser un texto.'}), 422
 
     is_valid, error_msg = validate_strong_password(data['password'])
     if not is_valid:
         return jsonify({'message': error_msg}), 422
 
-    user = User.query.filter_by(correo_electronico=data['mail']).first()
+    user = User.query.filter_by(correo_electronico=data['mail']).first() if email_filter.might_exist(data['mail']) else None
     if user:
-        user.set_password(data['password'])
-        db.session.commit()
+        user_id = user.id
+        password_hash = hashing.hash_password(data['password'])
+
+        def cambiar_password():
+            db.session.get(User, user_id).password_hash = password_hash
+
+        group_commit.run(cambiar_password)
+        user_cache.invalidate(user_id)
         return jsonify({'message': 'Contraseña actualizada exitosamente.'}), 200
     else:
         return jsonify({'message': 'Usuario no encontrado.'}), 404 # <-- ¡CORREGIDO!
@@ -0,0 +1,145 @@
+"""Serialización basada en esquemas para los modelos de la API.
+
+Cada esquema declara los campos públicos de un modelo y se compila una vez en
+funciones extractoras: una para instancias ORM (``attrgetter``) y otra para
+tuplas de resultados de consultas por columnas, que evitan hidratar objetos.
+Solo los campos que lo necesitan (fechas) pasan por un convertidor.
+
+``dumps`` usa ``orjson`` si está instalado (y ``FAST_JSON`` no es 0); si no,
+el módulo ``json`` estándar.
+"""
+import base64
+import binascii
+import json
+import os
+from datetime import date, datetime
+from operator import attrgetter
+
+from flask import Response
+
+from .models import User, Declaration, DeclarationYearStats, DeclarationDailyStats, Job
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dependencia opcional
+    orjson = None
+
+USE_ORJSON = orjson is not None and os.environ.get('FAST_JSON', '1').lower() not in ('0', 'false', 'no')
+
+
+def _isoformat(value):
+    return value.isoformat() if value is not None else None
+
+
+def _json_text(value):
+    return json.loads(value) if value is not None else None
+
+
+class Schema:
+    def __init__(self, model, fields, converters=None):
+        self.model = model
+        self.fields = tuple(fields)
+        self.converters = dict(converters or {})
+        self._cache = {}
+
+    def columns(self, fields=None):
+        """Columnas del modelo para consultar solo ``fields`` (todos por defecto)."""
+        return [getattr(self.model, f) for f in (fields or self.fields)]
+
+    def row_serializer(self, fields=None):
+        """Devuelve una función que convierte una tupla (en el orden de ``fields``) en dict."""
+        fields = tuple(fields or self.fields)
+        serializer = self._cache.get(fields)
+        if serializer is not None:
+            return serializer
+
+        conversions = [(i, f, self.converters[f]) for i, f in enumerate(fields) if f in self.converters]
+        if not conversions:
+            def serializer(row):
+                return dict(zip(fields, row))
+        else:
+            def serializer(row):
+                data = dict(zip(fields, row))
+                for i, field, convert in conversions:
+                    data[field] = convert(row[i])
+                return data
+
+        self._cache[fields] = serializer
+        return serializer
+
+    def instance_serializer(self, fields=None):
+        """Devuelve una función que convierte una instancia ORM en dict."""
+        fields = tuple(fields or self.fields)
+        getter = attrgetter(*fields)
+        to_dict = self.row_serializer(fields)
+        if len(fields) == 1:
+            return lambda instance: to_dict((getter(instance),))
+        return lambda instance: to_dict(getter(instance))
+
+
+USER_SCHEMA = Schema(User, (
+    'id', 'nombre_completo', 'tipo_documento', 'numero_documento', 'correo_electronico', 'estado', 'es_admin',
+))
+
+DECLARATION_SCHEMA = Schema(Declaration, (
+    'id', 'user_id', 'ano_fiscal', 'ingresos_totales', 'deducciones_aplicadas', 'estado_civil',
+    'dependientes', 'otros_ingresos_deducciones', 'estado_declaracion', 'renta_gravable',
+    'impuesto_liquidado', 'fecha_creacion',
+), converters={'fecha_creacion': _isoformat})
+
+YEAR_STATS_SCHEMA = Schema(DeclarationYearStats, (
+    'ano_fiscal', 'estado_civil', 'declaraciones', 'ingresos_totales', 'deducciones_aplicadas', 'impuesto_liquidado',
+))
+
+DAILY_STATS_SCHEMA = Schema(DeclarationDailyStats, (
+    'dia', 'estado_declaracion', 'declaraciones',
+), converters={'dia': _isoformat})
+
+JOB_SCHEMA = Schema(Job, (
+    'id', 'tipo', 'estado', 'resultado', 'error', 'fecha_creacion', 'fecha_inicio', 'fecha_fin',
+), converters={'resultado': _json_text, 'fecha_creacion': _isoformat, 'fecha_inicio': _isoformat, 'fecha_fin': _isoformat})
+
+SCHEMAS = {User: USER_SCHEMA, Declaration: DECLARATION_SCHEMA, Job: JOB_SCHEMA}
+_INSTANCE_SERIALIZERS = {model: schema.instance_serializer() for model, schema in SCHEMAS.items()}
+
+
+def serialize(instance):
+    """Serializa una instancia de un modelo registrado; None si el tipo no tiene esquema."""
+    # __class__ en lugar de type() para que funcione con proxies como current_user
+    serializer = _INSTANCE_SERIALIZERS.get(instance.__class__)
+    return serializer(instance) if serializer is not None else None
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f'Objeto de tipo {type(value).__name__} no serializable a JSON')
+
+
+def dumps(data):
+    """Codifica ``data`` a JSON (bytes con orjson, str con json)."""
+    if USE_ORJSON:
+        return orjson.dumps(data, default=_default)
+    return json.dumps(data, default=_default, ensure_ascii=False, separators=(',', ':'))
+
+
+def encode_cursor(last_id):
+    """Cursor opaco de paginación por llave a partir del último id devuelto."""
+    raw = json.dumps({'id': last_id}, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+
+def decode_cursor(cursor):
+    """Devuelve el último id de un cursor de ``encode_cursor`` (0 si está vacío); ValueError si es inválido."""
+    if not cursor:
+        return 0
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return int(data['id'])
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise ValueError('Cursor inválido.')
+
+
+def json_response(data, status=200):
+    """Respuesta JSON construida con el codificador rápido (alternativa a ``jsonify``)."""
+    return Response(dumps(data), status=status, mimetype='application/json')
@@ -0,0 +1,144 @@
+"""Simulación de escenarios ("¿qué pasa si...?") sobre una declaración base.
+
+Una petición trae la declaración base y una grilla de variaciones, por ejemplo
+``{"deducciones_aplicadas": [0, 5e6, 1e7], "dependientes": [0, 1, 2]}``. Se
+evalúa el producto cartesiano completo en una sola llamada a
+``liquidation.liquidar``; nada se guarda en la base de datos.
+
+Las respuestas ya codificadas se memorizan en una LRU con TTL, con las reglas
+fiscales compiladas como parte de la llave: si cambian las reglas, cambia la
+llave.
+
+``estado_civil`` es parte de la declaración base pero no se puede variar: la
+liquidación no depende de él y todos los escenarios darían el mismo impuesto.
+"""
+from . import liquidation, serializers
+from .cache import LRUCache
+
+MAX_ESCENARIOS = 1000
+
+# Campos que se pueden variar y cómo se normalizan sus valores
+CAMPOS_SIMULABLES = {
+    'ingresos_totales': float,
+    'deducciones_aplicadas': lambda v: float(v or 0.0),
+    'dependientes': lambda v: int(v or 0),
+}
+CAMPOS_BASE = ('ano_fiscal', 'estado_civil') + tuple(CAMPOS_SIMULABLES)
+
+cache = LRUCache(maxsize=512, ttl=300.0)
+max_escenarios = MAX_ESCENARIOS
+
+
+def configure(maxsize, ttl, max_scenarios):
+    global max_escenarios
+    cache.configure(maxsize, ttl)
+    max_escenarios = max_scenarios
+
+
+def _normalizar_base(base):
+    datos = {campo: convertir(base.get(campo)) for campo, convertir in CAMPOS_SIMULABLES.items()}
+    return {'ano_fiscal': int(base['ano_fiscal']), 'estado_civil': str(base['estado_civil']), **datos}
+
+
+def validar_variaciones(base, variaciones, validar):
+    """Valida cada valor de la grilla con las mismas reglas que la declaración base.
+
+    Devuelve (errores, variaciones normalizadas).
+    """
+    if not isinstance(variaciones, dict):
+        return {'grilla': 'Debe ser un objeto con listas de valores por campo.'}, None
+
+    errores, normalizadas, total = {}, {}, 1
+    for campo, valores in variaciones.items():
+        if campo == 'estado_civil':
+            errores[campo] = 'No se puede variar: el estado civil no afecta la liquidación.'
+            continue
+        if campo not in CAMPOS_SIMULABLES:
+            errores[campo] = f'No se puede variar. Campos permitidos: {", ".join(CAMPOS_SIMULABLES)}.'
+            continue
+        if not isinstance(valores, list) or not valores:
+            errores[campo] = 'Debe ser una lista no vacía de valores.'
+            continue
+        total *= len(valores)
+        if total > max_escenarios:
+            return {'grilla': f'La grilla no puede superar {max_escenarios} escenarios.'}, None
+
+        for i, valor in enumerate(valores):
+            error = validar({**base, campo: valor})[0].get(campo)
+            if error:
+                errores[f'{campo}[{i}]'] = error
+                break
+        else:
+            normalizadas[campo] = [CAMPOS_SIMULABLES[campo](v) for v in valores]
+
+    return errores, normalizadas
+
+
+def _grilla(base, variaciones):
+    """Expande la grilla a columnas alineadas (una entrada por escenario)."""
+    import numpy as np
+    campos = list(variaciones)
+    indices = np.meshgrid(*[np.arange(len(variaciones[c])) for c in campos], indexing='ij')
+    n = indices[0].size if campos else 1
+    columnas = {}
+    for campo in CAMPOS_SIMULABLES:
+        if campo in variaciones:
+            valores = np.asarray(variaciones[campo], dtype=np.float64)
+            columnas[campo] = valores[indices[campos.index(campo)].ravel()]
+        else:
+            columnas[campo] = np.full(n, base[campo], dtype=np.float64)
+    return campos, columnas
+
+
+def evaluar(base, variaciones, reglas):
+    """Liquida la base y todos los escenarios; devuelve el cuerpo de la respuesta."""
+    campos, columnas = _grilla(base, variaciones)
+    resultado_base = liquidation.liquidar(
+        [base['ingresos_totales']], [base['deducciones_aplicadas']], [base['dependientes']], reglas
+    )
+    impuesto_base = float(resultado_base['impuesto'][0])
+    resultado = liquidation.liquidar(
+        columnas['ingresos_totales'], columnas['deducciones_aplicadas'], columnas['dependientes'], reglas
+    )
+    impuestos = resultado['impuesto']
+
+    salida = {campo: columnas[campo].tolist() for campo in campos}
+    if 'dependientes' in salida:
+        salida['dependientes'] = [int(d) for d in salida['dependientes']]
+    salida['renta_gravable'] = resultado['renta_gravable'].tolist()
+    salida['impuesto'] = impuestos.tolist()
+    salida['diferencia'] = (impuestos - impuesto_base).tolist()
+    nombres = list(salida)
+
+    return {
+        'ano_fiscal': base['ano_fiscal'],
+        'version_reglas': reglas.version,
+        'base': {**base, 'renta_gravable': float(resultado_base['renta_gravable'][0]), 'impuesto': impuesto_base},
+        'total': len(impuestos),
+        'escenarios': [dict(zip(nombres, fila)) for fila in zip(*salida.values())],
+    }
+
+
+def simular(base, variaciones, validar):
+    """Valida y evalúa una simulación.
+
+    ``validar`` es ``routes.validate_declaration``. Devuelve (errores, cuerpo
+    JSON codificado); el cuerpo sale de la caché si la entrada ya se evaluó
+    con las mismas reglas.
+    """
+    if not isinstance(base, dict):
+        return {'base': 'Se requiere la declaración base.'}, None
+    errores, reglas = validar(base)
+    if errores:
+        return {'base': errores}, None
+    errores, variaciones = validar_variaciones(base, variaciones or {}, validar)
+    if errores:
+        return {'escenarios': errores}, None
+
+    base = _normalizar_base(base)
+    llave = (reglas, tuple(base[c] for c in CAMPOS_BASE), tuple((c, tuple(v)) for c, v in variaciones.items()))
+    cuerpo = cache.get(llave)
+    if cuerpo is None:
+        cuerpo = serializers.dumps(evaluar(base, variaciones, reglas))
+        cache.put(llave, cuerpo)
+    return None, cuerpo
@@ -0,0 +1,206 @@
+"""Tablas de reglas tributarias versionadas por año fiscal.
+
+Las reglas base viven en este módulo y pueden sobrescribirse sin redesplegar
+mediante un archivo JSON (por defecto ``instance/reglas_fiscales.json``)::
+
+    {
+        "version": "2025-02",
+        "base": {"max_dependientes": 5},
+        "anos": {"2025": {"uvt": 49799, "ingresos_minimos": 1200000}}
+    }
+
+Cada combinación (año, versión) se compila una sola vez en un objeto
+``ReglasFiscales`` con sus tablas como arrays de NumPy y se guarda en una caché
+LRU acotada. Cuando cambia el archivo cambia la versión y las entradas viejas
+simplemente dejan de usarse. Las reglas se compilan la primera vez que se
+piden (y NumPy se importa entonces), no al crear la aplicación.
+
+Un archivo nuevo se valida al leerlo compilando las reglas de los años que
+afecta; si no se puede leer o las reglas son inconsistentes se sigue usando
+la versión anterior.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+REGLAS_BASE = {
+    'ano_minimo': 2000,
+    'ingresos_minimos': 1000000,
+    'ingresos_maximos': 999999999999,
+    'deduccion_minima': 1000,
+    'deducciones_maximas': 999999999999,
+    'max_dependientes': 5,
+    'max_otros_ingresos_deducciones': 1000,
+    'estados_civiles': ['Soltero/a', 'Casado/a', 'Divorciado/a', 'Viudo/a'],
+    # Tabla marginal del art. 241 E.T. en UVT.
+    'rangos_uvt': [0, 1090, 1700, 4100, 8670, 18970, 31000],
+    'tarifas': [0.0, 0.19, 0.28, 0.33, 0.35, 0.37, 0.39],
+    'impuesto_base_uvt': [0, 0, 116, 788, 2296, 5901, 10352],
+    # Deducción por dependiente (UVT) y número máximo de dependientes deducibles.
+    'deduccion_dependiente_uvt': 72,
+    'max_dependientes_deducibles': 4,
+    # Las deducciones aplicadas no pueden superar el 40% del ingreso ni 1.340 UVT.
+    'tope_deducciones_porcentaje': 0.40,
+    'tope_deducciones_uvt': 1340,
+}
+
+# Valor de la UVT (Unidad de Valor Tributario) en COP por año fiscal.
+UVT_POR_ANO = {
+    2006: 20000, 2007: 20974, 2008: 22054, 2009: 23763, 2010: 24555,
+    2011: 25132, 2012: 26049, 2013: 26841, 2014: 27485, 2015: 28279,
+    2016: 29753, 2017: 31859, 2018: 33156, 2019: 34270, 2020: 35607,
+    2021: 36308, 2022: 38004, 2023: 42412, 2024: 47065, 2025: 49799,
+    2026: 52374,
+}
+
+VERSION_BASE = 'base'
+MAX_ENTRADAS_CACHE = 64
+RECHEQUEO_SEGUNDOS = 5.0
+
+_lock = threading.Lock()
+_cache = OrderedDict()
+_fuente = {'ruta': None, 'mtime': None, 'revisado': 0.0, 'version': VERSION_BASE, 'datos': {}}
+
+
+class ReglasFiscales:
+    """Reglas compiladas de un año fiscal. Se tratan como inmutables."""
+
+    __slots__ = (
+        'ano_fiscal', 'version', 'uvt', 'ano_minimo', 'ingresos_minimos', 'ingresos_maximos',
+        'deduccion_minima', 'deducciones_maximas', 'max_dependientes',
+        'max_otros_ingresos_deducciones', 'estados_civiles', 'rangos_uvt', 'tarifas',
+        'impuesto_base_uvt', 'deduccion_dependiente_uvt', 'max_dependientes_deducibles',
+        'tope_deducciones_porcentaje', 'tope_deducciones_uvt',
+    )
+
+    def __init__(self, ano_fiscal, version, datos):
+        self.ano_fiscal = ano_fiscal
+        self.version = version
+        self.uvt = float(datos['uvt'])
+        self.ano_minimo = int(datos['ano_minimo'])
+        self.ingresos_minimos = float(datos['ingresos_minimos'])
+        self.ingresos_maximos = float(datos['ingresos_maximos'])
+        self.deduccion_minima = float(datos['deduccion_minima'])
+        self.deducciones_maximas = float(datos['deducciones_maximas'])
+        self.max_dependientes = int(datos['max_dependientes'])
+        self.max_otros_ingresos_deducciones = int(datos['max_otros_ingresos_deducciones'])
+        self.estados_civiles = tuple(datos['estados_civiles'])
+        self.rangos_uvt = _tabla(datos['rangos_uvt'])
+        self.tarifas = _tabla(datos['tarifas'])
+        self.impuesto_base_uvt = _tabla(datos['impuesto_base_uvt'])
+        self.deduccion_dependiente_uvt = float(datos['deduccion_dependiente_uvt'])
+        self.max_dependientes_deducibles = int(datos['max_dependientes_deducibles'])
+        self.tope_deducciones_porcentaje = float(datos['tope_deducciones_porcentaje'])
+        self.tope_deducciones_uvt = float(datos['tope_deducciones_uvt'])
+
+        if not (len(self.rangos_uvt) == len(self.tarifas) == len(self.impuesto_base_uvt)) or not len(self.rangos_uvt):
+            raise ValueError(f'Tabla marginal inconsistente para el año {ano_fiscal}.')
+        if self.rangos_uvt[0] != 0 or (self.rangos_uvt[1:] <= self.rangos_uvt[:-1]).any():
+            raise ValueError(f'Los rangos de la tabla marginal del año {ano_fiscal} deben empezar en 0 y ser crecientes.')
+        if self.uvt <= 0 or not self.estados_civiles:
+            raise ValueError(f'UVT o estados civiles inválidos para el año {ano_fiscal}.')
+
+    def to_dict(self):
+        datos = {}
+        for campo in self.__slots__:
+            valor = getattr(self, campo)
+            if hasattr(valor, 'tolist'):
+                valor = valor.tolist()
+            elif isinstance(valor, tuple):
+                valor = list(valor)
+            datos[campo] = valor
+        return datos
+
+
+def _tabla(valores):
+    import numpy as np
+    tabla = np.array(valores, dtype=np.float64)
+    tabla.setflags(write=False)
+    return tabla
+
+
+def uvt_para(ano_fiscal):
+    """Devuelve la UVT base del año; para años sin valor usa el más cercano conocido."""
+    if ano_fiscal in UVT_POR_ANO:
+        return UVT_POR_ANO[ano_fiscal]
+    anos = sorted(UVT_POR_ANO)
+    return UVT_POR_ANO[anos[0]] if ano_fiscal < anos[0] else UVT_POR_ANO[anos[-1]]
+
+
+def _ruta_configurada():
+    try:
+        return current_app.config.get('TAX_RULES_FILE')
+    except RuntimeError:
+        return None
+
+
+def _leer_fuente(ruta):
+    """Relee el archivo de reglas si cambió. Debe llamarse con el lock tomado."""
+    ahora = time.monotonic()
+    if ruta == _fuente['ruta'] and ahora - _fuente['revisado'] < RECHEQUEO_SEGUNDOS:
+        return
+    _fuente['revisado'] = ahora
+
+    try:
+        mtime = os.stat(ruta).st_mtime if ruta else None
+    except OSError:
+        mtime = None
+
+    if ruta == _fuente['ruta'] and mtime == _fuente['mtime']:
+        return
+
+    version, datos = VERSION_BASE, {}
+    if mtime is not None:
+        try:
+            with open(ruta, encoding='utf-8') as f:
+                datos = json.load(f)
+            if not isinstance(datos, dict):
+                raise ValueError('el archivo debe contener un objeto JSON')
+            version = str(datos.get('version') or f'mtime-{int(mtime)}')
+            _validar(version, datos)
+        except (OSError, ValueError, TypeError, KeyError, AttributeError) as e:
+            # Un archivo inválido no debe tumbar la API: se siguen usando las reglas anteriores.
+            print(f"Error al leer reglas fiscales ({ruta}), se mantiene la versión {_fuente['version']}: {e}")
+            _fuente.update(ruta=ruta, mtime=mtime)
+            return
+
+    _fuente.update(ruta=ruta, mtime=mtime, version=version, datos=datos)
+
+
+def _validar(version, datos_fuente):
+    """Compila las reglas del año en curso y de cada año del archivo; lanza la excepción si alguna falla."""
+    anos = {time.localtime().tm_year}
+    anos.update(int(ano) for ano in (datos_fuente.get('anos') or {}))
+    for ano in anos:
+        _compilar(ano, version, datos_fuente)
+
+
+def _compilar(ano_fiscal, version, datos_fuente):
+    datos = dict(REGLAS_BASE)
+    datos['uvt'] = uvt_para(ano_fiscal)
+    datos.update(datos_fuente.get('base') or {})
+    datos.update((datos_fuente.get('anos') or {}).get(str(ano_fiscal)) or {})
+    return ReglasFiscales(ano_fiscal, version, datos)
+
+
+def obtener_reglas(ano_fiscal, ruta=None):
+    """Devuelve las reglas compiladas del año fiscal, desde la caché si es posible."""
+    ruta = ruta or _ruta_configurada()
+    with _lock:
+        _leer_fuente(ruta)
+        clave = (ano_fiscal, _fuente['version'], _fuente['mtime'])
+        reglas = _cache.get(clave)
+        if reglas is not None:
+            _cache.move_to_end(clave)
+            return reglas
+
+        reglas = _compilar(ano_fiscal, _fuente['version'], _fuente['datos'])
+        _cache[clave] = reglas
+        while len(_cache) > MAX_ENTRADAS_CACHE:
+            _cache.popitem(last=False)
+        return reglas
+
@@ -0,0 +1,116 @@
+"""Caché en proceso de los usuarios cargados por Flask-Login.
+
+``load_user`` se ejecuta en cada petición autenticada; sin caché cuesta una
+consulta por petición. Aquí se guardan las columnas del usuario (no el objeto
+ORM, que pertenece a la sesión de otra petición) en una LRU acotada con TTL, y
+en cada petición se reconstruye una instancia persistente sin tocar la base de
+datos.
+
+Las rutas que modifican usuarios llaman a ``record_change`` dentro de la
+transacción del cambio (deja una fila en ``UserChange``) y a ``invalidate``
+después del commit. Cada acierto de la caché lee primero la bitácora desde el
+último id visto (una consulta por llave primaria, casi siempre vacía) e
+invalida los usuarios que cambiaron en otros procesos, así que un cambio de
+``es_admin`` o ``estado`` se ve enseguida en todos los workers.
+
+Un ``put`` de una lectura que empezó antes de una invalidación se descarta
+(contador de generación), para no volver a guardar una fila vieja.
+"""
+import threading
+
+import sqlalchemy as sa
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+
+from .cache import LRUCache
+
+# Columnas que no se guardan en memoria; se cargan de la BD solo si se usan.
+# declaraciones_version cambia con cada declaración y debe leerse siempre fresca.
+EXCLUDED_COLUMNS = ('password_hash', 'declaraciones_version')
+
+cache = LRUCache(maxsize=1024, ttl=30.0)
+
+_lock = threading.Lock()
+# Se incrementa con cada invalidación; un put que empezó con otra generación se descarta
+_generation = 0
+# Último id leído de la bitácora UserChange; None hasta la primera lectura
+_last_change_id = None
+
+
+def snapshot(user):
+    """Extrae las columnas cacheables de una instancia de usuario."""
+    return {
+        attr.key: getattr(user, attr.key)
+        for attr in inspect(type(user)).column_attrs
+        if attr.key not in EXCLUDED_COLUMNS
+    }
+
+
+def rebuild(session, model, columns):
+    """Crea una instancia persistente en ``session`` a partir de columnas en caché, sin consultar la BD."""
+    instance = inspect(model).class_manager.new_instance()
+    for key, value in columns.items():
+        set_committed_value(instance, key, value)
+    make_transient_to_detached(instance)
+    return session.merge(instance, load=False)
+
+
+def _catch_up(session):
+    """Invalida los usuarios anotados en ``UserChange`` por cualquier proceso desde la última lectura."""
+    global _last_change_id
+    from . import db
+    from .models import UserChange
+    after_id = _last_change_id
+    # La bitácora se lee de la base principal aunque la ruta use una réplica
+    bind = {'bind': db.engine}
+    if after_id is None:
+        # La caché aún está vacía: basta con empezar desde el último cambio
+        last_id = session.execute(sa.select(sa.func.max(UserChange.id)), bind_arguments=bind).scalar() or 0
+        changes = []
+    else:
+        changes = session.execute(
+            sa.select(UserChange.id, UserChange.user_id).where(UserChange.id > after_id).order_by(UserChange.id),
+            bind_arguments=bind,
+        ).all()
+        last_id = changes[-1][0] if changes else after_id
+    with _lock:
+        for _, user_id in changes:
+            _invalidate(user_id)
+        if _last_change_id is None or last_id > _last_change_id:
+            _last_change_id = last_id
+
+
+def load(session, model, user_id):
+    """Carga un usuario usando la caché; equivale a ``model.query.get(user_id)``."""
+    if cache.maxsize:
+        _catch_up(session)
+    generation = _generation
+    columns = cache.get(user_id)
+    if columns is not None:
+        return rebuild(session, model, columns)
+    user = session.query(model).get(user_id)
+    if user is not None:
+        columns = snapshot(user)
+        with _lock:
+            if _generation == generation:
+                cache.put(user_id, columns)
+    return user
+
+
+def record_change(user_id):
+    """Anota en la bitácora que cambió el usuario, para las cachés de otros procesos (sin commit)."""
+    from . import db
+    from .models import UserChange
+    db.session.add(UserChange(user_id=user_id))
+
+
+def _invalidate(user_id):
+    global _generation
+    _generation += 1
+    cache.invalidate(user_id)
+
+
+def invalidate(user_id):
+    with _lock:
+        _invalidate(user_id)
@@ -0,0 +1,136 @@
+"""Benchmark de serialización: ruta anterior vs. esquemas precompilados.
+
+Compara, sobre una base SQLite temporal con declaraciones sintéticas:
+
+* ``anterior``: consulta de entidades ORM completas, ``serialize()`` con la
+  cadena de ``isinstance`` y ``jsonify``.
+* ``esquema``: consulta solo de columnas, ``Schema.row_serializer`` y
+  ``serializers.json_response`` (orjson si está instalado).
+
+Uso::
+
+    python benchmarks/bench_serialization.py --filas 50000 --repeticiones 5
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+def serialize_anterior(model_instance, User, Declaration):
+    """Copia del ``serialize()`` original de ``routes.py``."""
+    if isinstance(model_instance, User):
+        return {
+            'id': model_instance.id,
+            'nombre_completo': model_instance.nombre_completo,
+            'tipo_documento': model_instance.tipo_documento,
+            'numero_documento': model_instance.numero_documento,
+            'correo_electronico': model_instance.correo_electronico,
+            'estado': model_instance.estado,
+            'es_admin': model_instance.es_admin
+        }
+    elif isinstance(model_instance, Declaration):
+        return {
+            'id': model_instance.id,
+            'user_id': model_instance.user_id,
+            'ano_fiscal': model_instance.ano_fiscal,
+            'ingresos_totales': model_instance.ingresos_totales,
+            'deducciones_aplicadas': model_instance.deducciones_aplicadas,
+            'estado_civil': model_instance.estado_civil,
+            'dependientes': model_instance.dependientes,
+            'otros_ingresos_deducciones': model_instance.otros_ingresos_deducciones,
+            'estado_declaracion': model_instance.estado_declaracion,
+            'renta_gravable': model_instance.renta_gravable,
+            'impuesto_liquidado': model_instance.impuesto_liquidado,
+            'fecha_creacion': model_instance.fecha_creacion.isoformat()
+        }
+    return None
+
+
+def sembrar(db, Declaration, filas):
+    ahora = datetime.now()
+    estados = ('Soltero', 'Casado', 'Union Libre')
+    lote = []
+    for i in range(filas):
+        ingresos = random.uniform(10_000_000, 500_000_000)
+        lote.append({
+            'user_id': 1,
+            'ano_fiscal': 2020 + i % 5,
+            'ingresos_totales': ingresos,
+            'deducciones_aplicadas': ingresos * 0.1,
+            'estado_civil': estados[i % 3],
+            'dependientes': i % 4,
+            'otros_ingresos_deducciones': None,
+            'estado_declaracion': 'Guardada',
+            'renta_gravable': ingresos * 0.7,
+            'impuesto_liquidado': ingresos * 0.05,
+            'fecha_creacion': ahora,
+            'fecha_liquidacion': ahora,
+        })
+        if len(lote) == 10000:
+            db.session.bulk_insert_mappings(Declaration, lote)
+            lote = []
+    if lote:
+        db.session.bulk_insert_mappings(Declaration, lote)
+    db.session.commit()
+
+
+def medir(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        cuerpo = funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return tiempos, len(cuerpo)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--filas', type=int, default=20000)
+    parser.add_argument('--repeticiones', type=int, default=5)
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp(prefix='bench_serializacion_')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(directorio, 'bench.db')
+    os.environ['TAX_RULES_FILE'] = os.path.join(directorio, 'reglas_fiscales.json')
+
+    from flask import jsonify
+    from backend import create_app, db, serializers
+    from backend.models import User, Declaration
+
+    app = create_app()
+    with app.app_context():
+        sembrar(db, Declaration, args.filas)
+
+        def anterior():
+            declaraciones = Declaration.query.order_by(Declaration.id).all()
+            respuesta = jsonify([serialize_anterior(d, User, Declaration) for d in declaraciones])
+            db.session.expunge_all()
+            return respuesta.get_data()
+
+        def esquema():
+            schema = serializers.DECLARATION_SCHEMA
+            filas = db.session.query(*schema.columns()).order_by(Declaration.id).all()
+            to_dict = schema.row_serializer()
+            return serializers.json_response([to_dict(fila) for fila in filas]).get_data()
+
+        resultados = {}
+        for nombre, funcion in (('anterior', anterior), ('esquema', esquema)):
+            tiempos, tamano = medir(funcion, args.repeticiones)
+            resultados[nombre] = statistics.median(tiempos)
+            print(f"{nombre:<9} mediana {resultados[nombre] * 1000:9.1f} ms   "
+                  f"mínimo {min(tiempos) * 1000:9.1f} ms   {tamano} bytes")
+
+    codificador = 'orjson' if serializers.USE_ORJSON else 'json'
+    print(f"{args.filas} filas, codificador {codificador}: "
+          f"{resultados['anterior'] / resultados['esquema']:.2f}x más rápido")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""Verificación del motor de liquidación con casos conocidos.
+
+Compara ``liquidation.liquidar`` con valores calculados a mano sobre la tabla
+marginal del art. 241 E.T. (bordes de cada rango), el tope de deducciones
+(40% del ingreso y 1.340 UVT) y la deducción por dependientes (72 UVT, hasta
+4). Usa las reglas base con la UVT de 2024 y no necesita base de datos.
+
+Uso::
+
+    python benchmarks/check_liquidation.py
+
+Termina con código 1 si algún caso no coincide.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from backend import liquidation, tax_rules  # noqa: E402
+
+UVT = 47065
+REGLAS = tax_rules.ReglasFiscales(2024, 'check', dict(tax_rules.REGLAS_BASE, uvt=UVT))
+
+# (descripción, ingresos, deducciones, dependientes, renta gravable esperada, impuesto esperado en UVT)
+CASOS_RANGOS = [
+    ('sin renta', 0, 0, 0, 0, 0),
+    ('límite del rango exento (1.090 UVT)', 1090 * UVT, 0, 0, 1090 * UVT, 0),
+    ('primer UVT gravado al 19%', 1091 * UVT, 0, 0, 1091 * UVT, 0.19),
+    ('inicio del rango del 28% (1.700 UVT)', 1700 * UVT, 0, 0, 1700 * UVT, 116),
+    ('inicio del rango del 33% (4.100 UVT)', 4100 * UVT, 0, 0, 4100 * UVT, 788),
+    ('mitad del rango del 35%', 12000 * UVT, 0, 0, 12000 * UVT, 2296 + 0.35 * (12000 - 8670)),
+    ('inicio del rango del 39% (31.000 UVT)', 31000 * UVT, 0, 0, 31000 * UVT, 10352),
+    ('por encima del último rango', 40000 * UVT, 0, 0, 40000 * UVT, 10352 + 0.39 * 9000),
+]
+
+CASOS_DEDUCCIONES = [
+    # Tope del 40%: 2.000 UVT de ingreso admiten como máximo 800 UVT de deducciones
+    ('tope del 40% del ingreso', 2000 * UVT, 1000 * UVT, 0, 1200 * UVT, 0.19 * 110),
+    # Tope absoluto: 10.000 UVT de ingreso admiten como máximo 1.340 UVT
+    ('tope de 1.340 UVT', 10000 * UVT, 5000 * UVT, 0, 8660 * UVT, 788 + 0.33 * (8660 - 4100)),
+    ('deducciones negativas se ignoran', 1500 * UVT, -100 * UVT, 0, 1500 * UVT, 0.19 * 410),
+    ('deducciones vacías (None) cuentan como cero', 1500 * UVT, None, 0, 1500 * UVT, 0.19 * 410),
+    ('dos dependientes', 1500 * UVT, 0, 2, 1356 * UVT, 0.19 * 266),
+    ('solo 4 dependientes son deducibles', 1500 * UVT, 0, 7, 1212 * UVT, 0.19 * 122),
+    ('la renta gravable no es negativa', 400 * UVT, 160 * UVT, 4, 0, 0),
+    ('dependientes vacíos (None) cuentan como cero', 1500 * UVT, 0, None, 1500 * UVT, 0.19 * 410),
+]
+
+
+def main():
+    casos = CASOS_RANGOS + CASOS_DEDUCCIONES
+    resultado = liquidation.liquidar(
+        [c[1] for c in casos], [c[2] for c in casos], [c[3] for c in casos], REGLAS
+    )
+    fallos = []
+    for caso, renta, impuesto in zip(casos, resultado['renta_gravable'].tolist(), resultado['impuesto'].tolist()):
+        descripcion, _, _, _, renta_esperada, impuesto_uvt = caso
+        impuesto_esperado = round(impuesto_uvt * UVT)
+        # El motor redondea el impuesto al peso; se admite la diferencia de redondeo
+        if abs(renta - renta_esperada) > 0.01 or abs(impuesto - impuesto_esperado) > 1:
+            fallos.append(f'{descripcion}: renta {renta:,.2f} (esperada {renta_esperada:,.2f}), '
+                          f'impuesto {impuesto:,.0f} (esperado {impuesto_esperado:,.0f})')
+
+    # La liquidación de un lote debe coincidir con la de cada declaración por separado
+    for i, caso in enumerate(casos):
+        individual = liquidation.liquidar([caso[1]], [caso[2]], [caso[3]], REGLAS)
+        if individual['impuesto'][0] != resultado['impuesto'][i]:
+            fallos.append(f'{caso[0]}: el resultado en lote difiere del individual')
+
+    if fallos:
+        print('FALLÓ:\n  ' + '\n  '.join(fallos))
+        sys.exit(1)
+    print(f'OK: {len(casos)} casos de liquidación verificados.')
+
+
+if __name__ == '__main__':
+    main()
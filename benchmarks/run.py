@@ -0,0 +1,374 @@
+"""Benchmark de todas las rutas de la API, con comparación contra una línea base.
+
+1. Crea una base SQLite temporal (o usa ``--database-url``) y la siembra con
+   ``--usuarios`` usuarios y ``--declaraciones`` declaraciones por usuario;
+   los ``--anos-archivados`` años más antiguos pasan al archivo columnar.
+2. Modo ``cliente``: recorre los escenarios de ``scenarios.py`` uno a uno con
+   el cliente de pruebas de Flask (sin red) y mide cada petición.
+3. Modo ``http``: levanta la app en un servidor local con hilos (o usa
+   ``--url``) y la carga con ``--concurrencia`` hilos durante ``--duracion``
+   segundos, mezclando los escenarios según su peso.
+4. Reporta throughput y latencias p50/p95/p99 por escenario y, si existe
+   ``--baseline``, las compara: la ejecución falla (código 1) si la mediana
+   de algún escenario empeora más de ``--tolerancia`` (y más de
+   ``--umbral-ms``), si el throughput HTTP cae más de esa
+   tolerancia, si hubo respuestas inesperadas o si alguna ruta no tiene
+   escenario.
+
+Ejemplos::
+
+    python benchmarks/run.py --modo cliente --guardar-baseline
+    python benchmarks/run.py --modo ambos --usuarios 2000 --declaraciones 50
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from http.cookiejar import CookieJar
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import seed  # noqa: E402
+from scenarios import ESCENARIOS  # noqa: E402
+
+BASELINE_POR_DEFECTO = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+
+class ClienteFlask:
+    """Cliente de pruebas de Flask: mide la app sin red ni servidor."""
+
+    def __init__(self, app):
+        self._cliente = app.test_client()
+
+    def enviar(self, peticion):
+        respuesta = self._cliente.open(
+            peticion['url'], method=peticion['method'], json=peticion.get('json'),
+            data=peticion.get('data'), headers=peticion.get('headers'),
+        )
+        respuesta.get_data()
+        return respuesta.status_code
+
+
+class ClienteHTTP:
+    """Cliente HTTP real con su propio cookie jar (una sesión por cliente)."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self._opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+
+    def enviar(self, peticion):
+        datos, headers = peticion.get('data'), dict(peticion.get('headers') or {})
+        if peticion.get('json') is not None:
+            datos = json.dumps(peticion['json']).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        solicitud = urllib.request.Request(
+            self.base_url + peticion['url'], data=datos, headers=headers, method=peticion['method']
+        )
+        try:
+            with self._opener.open(solicitud, timeout=60) as respuesta:
+                respuesta.read()
+                return respuesta.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+
+
+def iniciar_sesion(cliente, correo, password, intentos=30):
+    peticion = {'method': 'POST', 'url': '/api/login',
+                'json': {'correo_electronico': correo, 'password': password}}
+    for _ in range(intentos):
+        estado = cliente.enviar(peticion)
+        # 429: el pool de hashing está saturado por los demás hilos; se reintenta
+        if estado != 429:
+            break
+        time.sleep(0.2)
+    if estado != 200:
+        raise RuntimeError(f'No se pudo iniciar sesión como {correo} (HTTP {estado}).')
+    return cliente
+
+
+class Sesiones:
+    """Clientes por rol para un hilo de carga."""
+
+    def __init__(self, nuevo_cliente, ctx):
+        self._nuevo = nuevo_cliente
+        self._ctx = ctx
+        self._clientes = {
+            'user': iniciar_sesion(nuevo_cliente(), ctx['correo_usuario'], ctx['password']),
+            'admin': iniciar_sesion(nuevo_cliente(), ctx['correo_admin'], ctx['password_admin']),
+        }
+
+    def para(self, rol):
+        if rol == 'anon':
+            return self._nuevo()
+        if rol == 'nueva_sesion':
+            return iniciar_sesion(self._nuevo(), self._ctx['correo_usuario'], self._ctx['password'])
+        return self._clientes[rol]
+
+
+class Resultados:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencias = defaultdict(list)
+        self.errores = defaultdict(int)
+        self.ejemplos_error = {}
+
+    def registrar(self, escenario, segundos, estado):
+        with self._lock:
+            self.latencias[escenario.nombre].append(segundos)
+            if estado not in escenario.esperado:
+                self.errores[escenario.nombre] += 1
+                self.ejemplos_error.setdefault(escenario.nombre, estado)
+
+    def resumen(self, duracion=None):
+        resumen = {}
+        for nombre, latencias in self.latencias.items():
+            ms = np.array(latencias) * 1000
+            p50, p95, p99 = np.percentile(ms, [50, 95, 99]).tolist()
+            resumen[nombre] = {
+                'n': len(latencias),
+                'errores': self.errores.get(nombre, 0),
+                # En modo cliente las peticiones son secuenciales: throughput = n / tiempo medido
+                'rps': len(latencias) / (duracion if duracion else ms.sum() / 1000),
+                'p50_ms': p50,
+                'p95_ms': p95,
+                'p99_ms': p99,
+                'ejemplo_error': self.ejemplos_error.get(nombre),
+            }
+        return resumen
+
+
+def ejecutar(escenario, sesiones, ctx, i, resultados):
+    peticion = escenario.peticion(ctx, i)
+    cliente = sesiones.para(escenario.rol)
+    inicio = time.perf_counter()
+    estado = cliente.enviar(peticion)
+    resultados.registrar(escenario, time.perf_counter() - inicio, estado)
+
+
+def esperar_trabajos(app, limite=30.0):
+    """Espera a que la cola de trabajos se vacíe, para no medir un escenario mientras corren los del anterior."""
+    from backend import db, jobs
+    from backend.models import Job
+    fin = time.perf_counter() + limite
+    with app.app_context():
+        while time.perf_counter() < fin:
+            if not db.session.query(Job.id).filter(Job.estado.in_((jobs.PENDIENTE, jobs.EN_PROCESO))).first():
+                return
+            db.session.rollback()
+            time.sleep(0.05)
+
+
+def modo_cliente(app, ctx, iteraciones):
+    resultados = Resultados()
+    sesiones = Sesiones(lambda: ClienteFlask(app), ctx)
+    for escenario in ESCENARIOS:
+        esperar_trabajos(app)
+        n = max(1, int(iteraciones * escenario.peso))
+        if escenario.peso >= 1:
+            # Una petición de calentamiento sin medir (cachés, compilación de consultas)
+            sesiones.para(escenario.rol).enviar(escenario.peticion(ctx, n))
+        for i in range(n):
+            ejecutar(escenario, sesiones, ctx, i, resultados)
+    return resultados.resumen()
+
+
+def modo_http(app, ctx, url, concurrencia, duracion):
+    servidor = None
+    if url is None:
+        from werkzeug.serving import WSGIRequestHandler, make_server
+
+        class SinRegistro(WSGIRequestHandler):
+            def log_request(self, *args, **kwargs):
+                pass
+
+        servidor = make_server('127.0.0.1', 0, app, threaded=True, request_handler=SinRegistro)
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        url = f'http://127.0.0.1:{servidor.server_port}'
+
+    resultados = Resultados()
+    contadores = {e.nombre: itertools.count(10_000) for e in ESCENARIOS}
+    pesos = [e.peso for e in ESCENARIOS]
+    fin = [0.0]
+    fallos = []
+    # El último hilo en llegar fija el final de la carga: el inicio de sesión no cuenta
+    listos = threading.Barrier(concurrencia + 1, action=lambda: fin.__setitem__(0, time.perf_counter() + duracion))
+
+    def trabajador(semilla):
+        rng = random.Random(semilla)
+        try:
+            sesiones = Sesiones(lambda: ClienteHTTP(url), ctx)
+        except RuntimeError as e:
+            fallos.append(str(e))
+            listos.abort()
+            return
+        try:
+            listos.wait()
+        except threading.BrokenBarrierError:
+            return
+        while time.perf_counter() < fin[0]:
+            escenario = rng.choices(ESCENARIOS, weights=pesos)[0]
+            ejecutar(escenario, sesiones, ctx, next(contadores[escenario.nombre]), resultados)
+
+    hilos = [threading.Thread(target=trabajador, args=(n,)) for n in range(concurrencia)]
+    for hilo in hilos:
+        hilo.start()
+    try:
+        listos.wait()
+    except threading.BrokenBarrierError:
+        for hilo in hilos:
+            hilo.join()
+        if servidor is not None:
+            servidor.shutdown()
+        raise RuntimeError(f'No se pudo preparar la carga: {fallos[0] if fallos else "barrera rota"}')
+    inicio = time.perf_counter()
+    for hilo in hilos:
+        hilo.join()
+    transcurrido = time.perf_counter() - inicio
+
+    if servidor is not None:
+        servidor.shutdown()
+    resumen = resultados.resumen(transcurrido)
+    total = sum(r['n'] for r in resumen.values())
+    resumen['_total'] = {'n': total, 'errores': sum(r['errores'] for r in resumen.values()),
+                         'rps': total / transcurrido, 'p50_ms': 0.0, 'p95_ms': 0.0, 'p99_ms': 0.0,
+                         'ejemplo_error': None}
+    return resumen
+
+
+def rutas_sin_escenario(app):
+    cubiertos = {e.endpoint for e in ESCENARIOS}
+    return sorted(
+        rule.endpoint for rule in app.url_map.iter_rules()
+        if rule.endpoint.startswith('main.') and rule.endpoint not in cubiertos
+    )
+
+
+def imprimir(modo, resumen):
+    print(f"\n== Modo {modo} ==")
+    print(f"{'escenario':<24}{'n':>7}{'errores':>9}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for nombre, r in sorted(resumen.items()):
+        print(f"{nombre:<24}{r['n']:>7}{r['errores']:>9}{r['rps']:>10.1f}"
+              f"{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{r['p99_ms']:>10.2f}")
+
+
+def comparar(resultados, baseline, tolerancia, umbral_ms):
+    """Devuelve la lista de regresiones respecto a la línea base."""
+    regresiones = []
+    for modo, resumen in resultados.items():
+        base_modo = baseline.get('resultados', {}).get(modo, {})
+        for nombre, actual in resumen.items():
+            base = base_modo.get(nombre)
+            if base is None:
+                continue
+            # Se compara la mediana: con pocas muestras el p95 depende demasiado del ruido de la máquina
+            if nombre != '_total' and actual['p50_ms'] > base['p50_ms'] * (1 + tolerancia) \
+                    and actual['p50_ms'] - base['p50_ms'] > umbral_ms:
+                regresiones.append(f"{modo}/{nombre}: p50 {base['p50_ms']:.2f} -> {actual['p50_ms']:.2f} ms")
+            if modo == 'http' and actual['rps'] < base['rps'] * (1 - tolerancia):
+                regresiones.append(f"{modo}/{nombre}: throughput {base['rps']:.1f} -> {actual['rps']:.1f} req/s")
+    return regresiones
+
+
+def preparar(args):
+    directorio = tempfile.mkdtemp(prefix='bench_api_')
+    os.environ['DATABASE_URL'] = args.database_url or 'sqlite:///' + os.path.join(directorio, 'bench.db')
+    os.environ.setdefault('TAX_RULES_FILE', os.path.join(directorio, 'reglas_fiscales.json'))
+    os.environ.setdefault('ARCHIVE_DIR', os.path.join(directorio, 'archivo'))
+    # Los límites de peticiones convertirían la carga en respuestas 429
+    os.environ.setdefault('RATE_LIMIT_ENABLED', '0')
+
+    from backend import create_app
+    app = create_app()
+    with app.app_context():
+        datos = seed.sembrar(args.usuarios, args.declaraciones)
+        datos.update(seed.archivar_anos(datos['anos'], args.anos_archivados))
+        datos.update(seed.preparar_trabajos(datos['user_ids'][0]))
+    user_ids = datos['user_ids']
+    ctx = {
+        **datos,
+        'correos': [seed.correo(u) for u in user_ids[2:] or user_ids],
+        'correo_usuario': seed.correo(user_ids[0]),
+        'objetivo': user_ids[1],
+        'correo_objetivo': seed.correo(user_ids[1]),
+        'correo_admin': 'admin@example.com',
+        'password_admin': 'adminpassword',
+        'etiqueta': str(int(time.time()))[-6:],
+    }
+    return app, ctx
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de todas las rutas de la API.')
+    parser.add_argument('--usuarios', type=int, default=200)
+    parser.add_argument('--declaraciones', type=int, default=20, help='Declaraciones por usuario.')
+    parser.add_argument('--modo', choices=('cliente', 'http', 'ambos'), default='cliente')
+    parser.add_argument('--iteraciones', type=int, default=50, help='Iteraciones por escenario (modo cliente).')
+    parser.add_argument('--concurrencia', type=int, default=8, help='Hilos de carga (modo http).')
+    parser.add_argument('--duracion', type=float, default=10.0, help='Segundos de carga (modo http).')
+    parser.add_argument('--url', help='Servidor ya levantado contra la misma base de datos (modo http).')
+    parser.add_argument('--anos-archivados', type=int, default=1,
+                        help='Años fiscales más antiguos que se pasan al archivo columnar antes de medir.')
+    parser.add_argument('--database-url', help='Base de datos a sembrar (por defecto, SQLite temporal).')
+    parser.add_argument('--baseline', default=BASELINE_POR_DEFECTO)
+    parser.add_argument('--guardar-baseline', action='store_true', help='Guarda los resultados como nueva línea base.')
+    parser.add_argument('--tolerancia', type=float, default=0.5, help='Empeoramiento relativo admitido.')
+    parser.add_argument('--umbral-ms', type=float, default=2.0, help='Diferencia mínima de p50 para contar como regresión.')
+    args = parser.parse_args()
+
+    if args.usuarios < 2:
+        parser.error('--usuarios debe ser al menos 2.')
+    if args.anos_archivados < 1:
+        parser.error('--anos-archivados debe ser al menos 1 (hay escenarios sobre años archivados).')
+
+    app, ctx = preparar(args)
+    faltantes = rutas_sin_escenario(app)
+    if faltantes:
+        print(f"Rutas sin escenario de benchmark: {', '.join(faltantes)}")
+
+    resultados = {}
+    if args.modo in ('cliente', 'ambos'):
+        resultados['cliente'] = modo_cliente(app, ctx, args.iteraciones)
+        imprimir('cliente', resultados['cliente'])
+    if args.modo in ('http', 'ambos'):
+        resultados['http'] = modo_http(app, ctx, args.url, args.concurrencia, args.duracion)
+        imprimir('http', resultados['http'])
+
+    fallos = [f'{modo}/{nombre}: {r["errores"]} respuestas inesperadas (p. ej. HTTP {r["ejemplo_error"]})'
+              for modo, resumen in resultados.items() for nombre, r in resumen.items()
+              if r['errores'] and nombre != '_total']
+    if faltantes:
+        fallos.append(f'{len(faltantes)} rutas sin escenario')
+
+    if args.guardar_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({'usuarios': args.usuarios, 'declaraciones': args.declaraciones,
+                       'resultados': resultados}, f, indent=2, sort_keys=True)
+        print(f"\nLínea base guardada en {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if (baseline.get('usuarios'), baseline.get('declaraciones')) != (args.usuarios, args.declaraciones):
+            print("\nAviso: la línea base se tomó con otra escala de datos.")
+        fallos += comparar(resultados, baseline, args.tolerancia, args.umbral_ms)
+    else:
+        print(f"\nSin línea base en {args.baseline}; usa --guardar-baseline para crearla.")
+
+    if fallos:
+        print('\nFALLÓ:\n  ' + '\n  '.join(fallos))
+        sys.exit(1)
+    print('\nOK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""Escenarios de benchmark: una petición representativa por ruta del blueprint.
+
+Cada escenario indica el endpoint de Flask que cubre (``run.py`` falla si
+alguna ruta de ``routes.py`` queda sin escenario), el rol con el que se
+ejecuta y una función que arma la petición ``i``:
+
+* ``anon``: cliente nuevo sin sesión.
+* ``user`` / ``admin``: cliente con sesión iniciada (se reutiliza).
+* ``nueva_sesion``: cliente nuevo que inicia sesión sin medirse antes de la
+  petición (para cerrar sesión).
+
+``peso`` escala el número de iteraciones (modo cliente) y la frecuencia
+relativa en la mezcla de carga (modo HTTP); las escrituras costosas pesan menos.
+Las rutas que hashean contraseñas aceptan 429: bajo carga concurrente el pool
+de hashing rechaza trabajo a propósito en lugar de encolarlo sin límite.
+"""
+import json
+from collections import namedtuple
+
+Escenario = namedtuple('Escenario', 'nombre endpoint rol peso peticion esperado')
+
+
+def _escenario(nombre, endpoint, rol, peticion, peso=1.0, esperado=(200,)):
+    return Escenario(nombre, f'main.{endpoint}', rol, peso, peticion, frozenset(esperado))
+
+
+def _get(url):
+    return lambda ctx, i: {'method': 'GET', 'url': url(ctx, i) if callable(url) else url}
+
+
+def _json(method, url, cuerpo):
+    return lambda ctx, i: {
+        'method': method,
+        'url': url(ctx, i) if callable(url) else url,
+        'json': cuerpo(ctx, i) if callable(cuerpo) else cuerpo,
+    }
+
+
+def _declaracion(ctx, i):
+    # Los años archivados no admiten declaraciones nuevas
+    return {
+        'ano_fiscal': ctx['anos_abiertos'][i % len(ctx['anos_abiertos'])],
+        'ingresos_totales': 50_000_000 + (i % 100) * 1_000_000,
+        'deducciones_aplicadas': 2_000_000,
+        'estado_civil': 'Soltero/a',
+        'dependientes': i % 3,
+    }
+
+
+def _importacion(ctx, i):
+    lineas = '\n'.join(json.dumps(_declaracion(ctx, i * 50 + n)) for n in range(50))
+    return {
+        'method': 'POST',
+        'url': '/api/declarations/import',
+        'data': lineas.encode('utf-8'),
+        'headers': {'Content-Type': 'application/x-ndjson'},
+    }
+
+
+def _simulacion(ctx, i):
+    return {
+        'base': _declaracion(ctx, i),
+        'escenarios': {
+            'deducciones_aplicadas': [0] + [1_000_000 * n for n in range(1, 20)],
+            'dependientes': [0, 1, 2, 3, 4],
+            # Cambia con i para medir también evaluaciones que no salen de la caché
+            'ingresos_totales': [60_000_000 + (i % 10) * 1_000_000, 90_000_000],
+        },
+    }
+
+
+def _cursor_usuarios(ctx, i):
+    # Páginas a distintas profundidades de la tabla de usuarios
+    from backend.serializers import encode_cursor
+    ids = ctx['user_ids']
+    return encode_cursor(ids[(i * 7919) % len(ids)]) if i % 4 else ''
+
+
+def _correo(ctx, i):
+    existe = ctx['correos'][i % len(ctx['correos'])]
+    return existe if i % 2 == 0 else f'inexistente{i}@bench.local'
+
+
+ESCENARIOS = [
+    _escenario('sesion', 'check_session', 'user', _get('/api/session')),
+    _escenario('cerrar_sesion', 'logout_api', 'nueva_sesion',
+               lambda ctx, i: {'method': 'DELETE', 'url': '/api/session'}, peso=0.2),
+    _escenario('registro', 'register_api', 'anon', _json('POST', '/api/register', lambda ctx, i: {
+        'nombre_completo': 'Usuario Benchmark',
+        'tipo_documento': 'CC',
+        'numero_documento': f"{ctx['etiqueta']}{i:06d}",
+        'correo_electronico': f"nuevo{ctx['etiqueta']}_{i}@bench.local",
+        'password': ctx['password'],
+    }), peso=0.2, esperado=(201, 429)),
+    _escenario('login', 'login_api', 'anon', _json('POST', '/api/login', lambda ctx, i: {
+        'correo_electronico': ctx['correos'][i % len(ctx['correos'])], 'password': ctx['password'],
+    }), peso=0.2, esperado=(200, 429)),
+    _escenario('declaraciones', 'get_declarations', 'user', _get('/api/declarations')),
+    _escenario('declaraciones_campos', 'get_declarations', 'user',
+               _get('/api/declarations?fields=id,ano_fiscal,ingresos_totales,estado_declaracion&limit=20')),
+    _escenario('declaraciones_archivadas', 'get_declarations', 'user',
+               _get(lambda ctx, i: f"/api/declarations?ano_fiscal={ctx['anos_archivados'][i % len(ctx['anos_archivados'])]}")),
+    _escenario('crear_declaracion', 'create_declaration', 'user',
+               _json('POST', '/api/declarations', _declaracion), peso=0.5, esperado=(201,)),
+    _escenario('crear_declaracion_async', 'create_declaration', 'user',
+               _json('POST', '/api/declarations?async=1', _declaracion), peso=0.5, esperado=(202,)),
+    _escenario('presentar_declaracion', 'submit_declaration', 'user', lambda ctx, i: {
+        'method': 'POST',
+        'url': f"/api/declarations/{ctx['declaraciones_guardadas'][i % len(ctx['declaraciones_guardadas'])]}/submit",
+    }, peso=0.2, esperado=(202, 409)),
+    _escenario('trabajo', 'get_job', 'user', _get(lambda ctx, i: f"/api/jobs/{ctx['job_usuario']}")),
+    _escenario('simular', 'simulate', 'user', _json('POST', '/api/simulate', _simulacion)),
+    _escenario('importar', 'import_declarations', 'user', _importacion, peso=0.2),
+    _escenario('exportar_usuarios', 'admin_export_users', 'admin',
+               _get('/api/admin/export/users?format=ndjson'), peso=0.2),
+    _escenario('exportar_declaraciones', 'admin_export_declarations', 'admin',
+               _get(lambda ctx, i: f"/api/admin/export/declarations?format=csv&ano_fiscal={ctx['anos'][-1]}"), peso=0.2),
+    _escenario('estadisticas', 'admin_get_stats', 'admin', _get('/api/admin/stats')),
+    _escenario('metricas', 'metrics', 'admin', _get('/api/metrics')),
+    _escenario('reglas', 'admin_get_tax_rules', 'admin',
+               _get(lambda ctx, i: f"/api/admin/tax-rules/{ctx['anos'][i % len(ctx['anos'])]}")),
+    _escenario('liquidar_ano', 'admin_liquidate_fiscal_year', 'admin', lambda ctx, i: {
+        'method': 'POST', 'url': f"/api/admin/declarations/{ctx['anos_abiertos'][0]}/liquidate",
+    }, peso=0.05),
+    _escenario('liquidar_ano_archivado', 'admin_liquidate_fiscal_year', 'admin', lambda ctx, i: {
+        'method': 'POST', 'url': f"/api/admin/declarations/{ctx['anos_archivados'][0]}/liquidate",
+    }, peso=0.05),
+    _escenario('reporte_anos', 'admin_report_fiscal_years', 'admin', _get('/api/admin/reports/fiscal-years')),
+    _escenario('reporte_diario', 'admin_report_daily', 'admin', _get('/api/admin/reports/daily')),
+    _escenario('usuarios_pagina', 'admin_get_users', 'admin',
+               _get(lambda ctx, i: f"/api/admin/users?cursor={_cursor_usuarios(ctx, i)}")),
+    _escenario('usuarios_pagina_offset', 'admin_get_users', 'admin', _get(lambda ctx, i: f'/api/admin/users?page={i % 5 + 1}'),
+               peso=0.2),
+    _escenario('usuarios_busqueda', 'admin_get_users', 'admin',
+               _get(lambda ctx, i: f"/api/admin/users?q={('ana', 'gomez', 'car', 'usuario1', 'bench.lo', '10000')[i % 6]}&cursor=")),
+    _escenario('usuario', 'admin_get_user', 'admin',
+               _get(lambda ctx, i: f"/api/admin/users/{ctx['user_ids'][i % len(ctx['user_ids'])]}")),
+    _escenario('actualizar_usuario', 'admin_update_user', 'admin',
+               _json('PUT', lambda ctx, i: f"/api/admin/users/{ctx['objetivo']}",
+                     lambda ctx, i: {'nombre_completo': ('Objetivo Benchmark', 'Objetivo Prueba')[i % 2]}), peso=0.5),
+    _escenario('cambiar_estado', 'admin_toggle_user_status_api', 'admin', lambda ctx, i: {
+        'method': 'POST', 'url': f"/api/admin/users/{ctx['objetivo']}/toggle_status",
+    }, peso=0.5),
+    _escenario('buscar_correo', 'find_mail', 'anon', _get(lambda ctx, i: f'/api/find-mail?mail={_correo(ctx, i)}')),
+    _escenario('restablecer_password', 'update_pass', 'anon', _json('PATCH', '/api/reset-password', lambda ctx, i: {
+        'mail': ctx['correo_objetivo'], 'password': ctx['password'],
+    }), peso=0.2, esperado=(200, 429)),
+]
@@ -0,0 +1,160 @@
+"""Siembra una base de datos sintética para los benchmarks.
+
+Crea ``usuarios`` usuarios (con sus índices de búsqueda) y ``declaraciones``
+declaraciones por usuario, ya liquidadas, usando los modelos de
+``backend/models.py`` con inserciones masivas. Todos los usuarios comparten la
+contraseña ``PASSWORD`` (se hashea una sola vez). Al final se recalculan los
+agregados de reportes.
+
+Uso independiente (sobre la base de datos de ``DATABASE_URL``)::
+
+    python benchmarks/seed.py --usuarios 1000 --declaraciones 50
+"""
+import argparse
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+PASSWORD = 'Bench1234!'
+NOMBRES = ('Ana', 'Luis', 'María', 'Carlos', 'Sofía', 'Andrés', 'Valentina', 'Jorge', 'Camila', 'Julián')
+APELLIDOS = ('Pérez', 'Gómez', 'Rodríguez', 'Martínez', 'López', 'Díaz', 'Torres', 'Ramírez', 'Castro', 'Vargas')
+TAMANO_LOTE = 10000
+
+
+def correo(i):
+    return f'usuario{i}@bench.local'
+
+
+def sembrar(usuarios, declaraciones, semilla=42):
+    """Inserta los datos sintéticos; debe llamarse dentro de un app context.
+
+    Devuelve un diccionario con los ids creados, útil para los escenarios.
+    """
+    from backend import db, hashing, liquidation, reporting, tax_rules
+    from backend.models import User, UserSearchToken, UserSearchTrigram, Declaration, normalize_search_text, search_trigrams
+
+    rng = random.Random(semilla)
+    password_hash = hashing.hash_password(PASSWORD)
+    primer_id = (db.session.query(db.func.max(User.id)).scalar() or 0) + 1
+
+    filas_usuarios, filas_tokens, filas_trigramas = [], [], []
+    for i in range(usuarios):
+        nombre = f'{rng.choice(NOMBRES)} {rng.choice(APELLIDOS)} {rng.choice(APELLIDOS)}'
+        user_id = primer_id + i
+        filas_usuarios.append({
+            'id': user_id,
+            'nombre_completo': nombre,
+            'tipo_documento': 'CC',
+            'numero_documento': str(10000000 + user_id),
+            'correo_electronico': correo(user_id),
+            'password_hash': password_hash,
+            'estado': 'activo',
+            'es_admin': False,
+        })
+        filas_tokens.extend({'user_id': user_id, 'token': t} for t in sorted(set(normalize_search_text(nombre).split())))
+        filas_trigramas.extend(
+            {'user_id': user_id, 'trigram': t}
+            for t in sorted(search_trigrams(correo(user_id), str(10000000 + user_id)))
+        )
+    for inicio in range(0, len(filas_usuarios), TAMANO_LOTE):
+        db.session.bulk_insert_mappings(User, filas_usuarios[inicio:inicio + TAMANO_LOTE])
+    for inicio in range(0, len(filas_tokens), TAMANO_LOTE):
+        db.session.bulk_insert_mappings(UserSearchToken, filas_tokens[inicio:inicio + TAMANO_LOTE])
+    for inicio in range(0, len(filas_trigramas), TAMANO_LOTE):
+        db.session.bulk_insert_mappings(UserSearchTrigram, filas_trigramas[inicio:inicio + TAMANO_LOTE])
+    db.session.commit()
+
+    ahora = datetime.now()
+    anos = list(range(ahora.year - 4, ahora.year + 1))
+    reglas = {ano: tax_rules.obtener_reglas(ano) for ano in anos}
+    lote = []
+
+    def insertar(lote):
+        por_ano = {}
+        for fila in lote:
+            por_ano.setdefault(fila['ano_fiscal'], []).append(fila)
+        for ano, filas in por_ano.items():
+            resultado = liquidation.liquidar(
+                [f['ingresos_totales'] for f in filas], [f['deducciones_aplicadas'] for f in filas],
+                [f['dependientes'] for f in filas], reglas[ano],
+            )
+            for fila, renta, impuesto in zip(filas, resultado['renta_gravable'].tolist(), resultado['impuesto'].tolist()):
+                fila['renta_gravable'] = renta
+                fila['impuesto_liquidado'] = impuesto
+        db.session.bulk_insert_mappings(Declaration, lote)
+        db.session.commit()
+
+    for fila_usuario in filas_usuarios:
+        for _ in range(declaraciones):
+            ano = rng.choice(anos)
+            r = reglas[ano]
+            ingresos = rng.uniform(r.ingresos_minimos, min(r.ingresos_maximos, 800_000_000))
+            fecha = ahora - timedelta(days=rng.randint(0, 89), seconds=rng.randint(0, 86399))
+            lote.append({
+                'user_id': fila_usuario['id'],
+                'ano_fiscal': ano,
+                'ingresos_totales': round(ingresos, 2),
+                'deducciones_aplicadas': round(rng.choice((0.0, rng.uniform(r.deduccion_minima, ingresos * 0.3))), 2),
+                'estado_civil': rng.choice(r.estados_civiles),
+                'dependientes': rng.randint(0, 4),
+                'otros_ingresos_deducciones': None,
+                'estado_declaracion': rng.choice(('Guardada', 'Guardada', 'Presentada')),
+                'fecha_creacion': fecha,
+                'fecha_liquidacion': fecha,
+            })
+            if len(lote) >= TAMANO_LOTE:
+                insertar(lote)
+                lote = []
+    if lote:
+        insertar(lote)
+
+    reporting.reconstruir()
+    return {
+        'user_ids': [f['id'] for f in filas_usuarios],
+        'anos': anos,
+        'password': PASSWORD,
+    }
+
+
+def archivar_anos(anos, cuantos):
+    """Archiva los ``cuantos`` años más antiguos; devuelve los años archivados y los que admiten escrituras."""
+    from backend import archive
+    archivados = sorted(anos)[:min(cuantos, len(anos) - 1)]  # al menos un año sigue abierto
+    for ano in archivados:
+        archive.archivar(ano)
+    return {'anos_archivados': archivados, 'anos_abiertos': [a for a in anos if a not in archivados]}
+
+
+def preparar_trabajos(user_id):
+    """Encola y ejecuta un trabajo del usuario y devuelve sus declaraciones guardadas (para ``/submit``)."""
+    from backend import db, jobs
+    from backend.models import Declaration
+    ids = [i for i, in db.session.query(Declaration.id).filter(
+        Declaration.user_id == user_id, Declaration.estado_declaracion == 'Guardada'
+    ).order_by(Declaration.id)]
+    job = jobs.encolar('liquidar_declaraciones', {'ids': ids[:1]}, user_id)
+    db.session.commit()
+    while jobs.cola.ejecutar_siguiente():
+        pass
+    return {'job_usuario': job.id, 'declaraciones_guardadas': ids}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Siembra datos sintéticos para benchmarks.')
+    parser.add_argument('--usuarios', type=int, default=200)
+    parser.add_argument('--declaraciones', type=int, default=20, help='Declaraciones por usuario.')
+    parser.add_argument('--semilla', type=int, default=42)
+    args = parser.parse_args()
+
+    from backend import create_app
+    app = create_app()
+    with app.app_context():
+        datos = sembrar(args.usuarios, args.declaraciones, args.semilla)
+    print(f"Sembrados {len(datos['user_ids'])} usuarios con {args.declaraciones} declaraciones cada uno.")
+
+
+if __name__ == '__main__':
+    main()
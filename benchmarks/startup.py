@@ -0,0 +1,216 @@
+"""Benchmark de arranque en frío: tiempo hasta la primera petición de un worker.
+
+Simula el arranque de un worker de producción: la base de datos ya está
+migrada (``flask db upgrade`` una vez por despliegue) y el proceso arranca con
+``AUTO_MIGRATE=0``. Cada repetición es un proceso de Python nuevo que importa
+``backend``, llama a ``create_app`` y atiende ``GET /api/session``; se mide
+desde que se lanza el proceso hasta que responde. Además se reporta:
+
+* el desglose dentro del proceso (importación, ``create_app``, primera
+  petición) y la primera liquidación, que es cuando se compilan las reglas
+  fiscales y se importa NumPy;
+* con ``--importtime``, los paquetes que más tardan en importarse según
+  ``python -X importtime``.
+
+El tiempo absoluto depende de la máquina, así que la comparación es contra
+una línea base medida en la misma ejecución, alternando un arranque de cada
+lado para que el ruido afecte a ambos por igual:
+
+* ``--baseline ansioso`` (por defecto): el mismo árbol, pero importando antes
+  de ``backend`` los módulos que el arranque difiere (``DIFERIDOS``), como
+  hacía antes de diferirlos;
+* ``--baseline <revisión>``: el paquete ``backend`` de esa revisión de git
+  (p. ej. la rama principal), exportado con ``git archive``.
+
+Ambos lados corren desde copias en el mismo directorio temporal.
+
+La ejecución falla (código 1) si la mediana hasta la primera petición no
+mejora al menos ``--mejora-minima`` por ciento sobre la línea base (con un
+valor negativo se admite esa pérdida, para comparar contra la rama principal)
+o, si se indica, supera ``--objetivo-ms``.
+
+Uso::
+
+    python benchmarks/startup.py --repeticiones 15 --importtime
+    python benchmarks/startup.py --baseline main --mejora-minima -10
+"""
+import argparse
+import io
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+from collections import defaultdict
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Módulos que el arranque no debe importar: la línea base "ansioso" los importa de entrada
+DIFERIDOS = ('numpy', 'sqlalchemy.dialects.postgresql', 'sqlalchemy.dialects.sqlite')
+
+WORKER = """
+import importlib, json, sys, time
+inicio = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+for modulo in filter(None, sys.argv[3].split(',')):
+    importlib.import_module(modulo)
+import backend
+importado = time.perf_counter()
+app = backend.create_app()
+creada = time.perf_counter()
+estado = app.test_client().get('/api/session').status_code
+respondida, respondida_epoch = time.perf_counter(), time.time()
+with app.app_context():
+    from backend import liquidation, tax_rules
+    liquidation.liquidar([50e6], [0], [0], tax_rules.obtener_reglas(int(sys.argv[2])))
+liquidada = time.perf_counter()
+print(json.dumps({
+    'estado': estado,
+    'importacion_ms': 1000 * (importado - inicio),
+    'create_app_ms': 1000 * (creada - importado),
+    'primera_peticion_ms': 1000 * (respondida - creada),
+    'primera_liquidacion_ms': 1000 * (liquidada - respondida),
+    'respondida_epoch': respondida_epoch,
+}))
+"""
+
+
+def entorno(directorio):
+    env = dict(os.environ)
+    env['DATABASE_URL'] = 'sqlite:///' + os.path.join(directorio, 'arranque.db')
+    env['TAX_RULES_FILE'] = os.path.join(directorio, 'reglas_fiscales.json')
+    env['AUTO_MIGRATE'] = '0'
+    return env
+
+
+def migrar(env):
+    codigo = (
+        'import sys; sys.path.insert(0, sys.argv[1])\n'
+        'from backend import create_app, migrations\n'
+        'app = create_app()\n'
+        'with app.app_context(): migrations.upgrade()\n'
+    )
+    subprocess.run([sys.executable, '-c', codigo, RAIZ], env=env, check=True, stdout=subprocess.DEVNULL)
+
+
+def arrancar(env, ano, raiz=RAIZ, precargar=()):
+    """Lanza un worker nuevo; devuelve el tiempo total hasta la primera respuesta y su desglose."""
+    inicio = time.time()
+    proceso = subprocess.run(
+        [sys.executable, '-c', WORKER, raiz, str(ano), ','.join(precargar)], env=env, stdout=subprocess.PIPE, text=True,
+    )
+    if proceso.returncode != 0:
+        raise RuntimeError(f'El worker terminó con código {proceso.returncode}.')
+    # La última línea es la del worker; antes puede haber mensajes de la aplicación
+    datos = json.loads(proceso.stdout.strip().splitlines()[-1])
+    datos['hasta_primera_peticion_ms'] = 1000 * (datos.pop('respondida_epoch') - inicio)
+    return datos
+
+
+def copiar_actual(destino):
+    """Copia el paquete ``backend`` del árbol de trabajo en ``destino``."""
+    shutil.copytree(os.path.join(RAIZ, 'backend'), os.path.join(destino, 'backend'),
+                    ignore=shutil.ignore_patterns('__pycache__'))
+    return destino
+
+
+def exportar_revision(revision, destino):
+    """Extrae el paquete ``backend`` de ``revision`` en ``destino`` con ``git archive``."""
+    salida = subprocess.run(['git', '-C', RAIZ, 'archive', '--format=tar', revision, 'backend'],
+                            check=True, stdout=subprocess.PIPE).stdout
+    with tarfile.open(fileobj=io.BytesIO(salida)) as tar:
+        tar.extractall(destino)
+    return destino
+
+
+def medianas(muestras):
+    campos = ('importacion_ms', 'create_app_ms', 'primera_peticion_ms', 'hasta_primera_peticion_ms',
+              'primera_liquidacion_ms')
+    return {campo: statistics.median(m[campo] for m in muestras) for campo in campos}
+
+
+def importaciones(env, top):
+    """Paquetes de nivel superior con más tiempo propio de importación (``-X importtime``)."""
+    codigo = 'import sys; sys.path.insert(0, sys.argv[1]); import backend; backend.create_app()'
+    salida = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', codigo, RAIZ], env=env, check=True,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+    ).stderr
+    por_paquete = defaultdict(int)
+    for linea in salida.splitlines():
+        if not linea.startswith('import time:') or 'self [us]' in linea:
+            continue
+        propio, _, modulo = linea[len('import time:'):].split('|')
+        por_paquete[modulo.strip().split('.')[0]] += int(propio)
+    total = sum(por_paquete.values())
+    return total / 1000, sorted(((us / 1000, p) for p, us in por_paquete.items()), reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeticiones', type=int, default=15, help='Arranques de cada lado.')
+    parser.add_argument('--baseline', default='ansioso',
+                        help="'ansioso' (este árbol importando DIFERIDOS al arrancar) o una revisión de git.")
+    parser.add_argument('--mejora-minima', type=float, default=7.0,
+                        help='Mejora mínima, en porcentaje, de la mediana hasta la primera petición.')
+    parser.add_argument('--objetivo-ms', type=float, default=None,
+                        help='Mediana máxima admitida hasta la primera petición (opcional, depende de la máquina).')
+    parser.add_argument('--importtime', action='store_true', help='Reporta los paquetes más lentos de importar.')
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directorio:
+        env = entorno(directorio)
+        migrar(env)
+        ano = time.localtime().tm_year
+        # Los dos lados corren desde copias en el mismo directorio, para que el sistema de archivos no favorezca a uno
+        arbol = {'raiz': copiar_actual(os.path.join(directorio, 'actual'))}
+        if args.baseline == 'ansioso':
+            base = dict(arbol, precargar=DIFERIDOS)
+        else:
+            base = {'raiz': exportar_revision(args.baseline, os.path.join(directorio, 'baseline'))}
+        # Calienta la caché de bytecode y del sistema de archivos de ambos árboles
+        arrancar(env, ano, **arbol)
+        arrancar(env, ano, **base)
+        muestras, muestras_base = [], []
+        for i in range(args.repeticiones):
+            # Alterna cuál arranca primero, para no favorecer a ninguno de los dos
+            if i % 2:
+                muestras_base.append(arrancar(env, ano, **base))
+                muestras.append(arrancar(env, ano, **arbol))
+            else:
+                muestras.append(arrancar(env, ano, **arbol))
+                muestras_base.append(arrancar(env, ano, **base))
+
+        actual, linea_base = medianas(muestras), medianas(muestras_base)
+        print(f'{args.repeticiones} arranques en frío de cada lado (mediana, ms):')
+        print(f'  {"":28} {"actual":>8} {args.baseline:>12}')
+        for campo in actual:
+            print(f'  {campo:28} {actual[campo]:8.1f} {linea_base[campo]:12.1f}')
+
+        if args.importtime:
+            total, lentos = importaciones(env, args.top)
+            print(f'\nImportaciones: {total:.1f} ms en total; paquetes más lentos:')
+            for ms, paquete in lentos:
+                print(f'  {paquete:28} {ms:8.1f}')
+
+    mediana, mediana_base = actual['hasta_primera_peticion_ms'], linea_base['hasta_primera_peticion_ms']
+    mejora = 100 * (1 - mediana / mediana_base)
+    fallas = []
+    if mejora < args.mejora_minima:
+        fallas.append(f'mejora {mejora:.1f} % sobre {args.baseline}, menos del {args.mejora_minima:.0f} % exigido')
+    if args.objetivo_ms is not None and mediana > args.objetivo_ms:
+        fallas.append(f'{mediana:.1f} ms supera el objetivo de {args.objetivo_ms:.0f} ms')
+    if fallas:
+        print('\nFALLA: ' + '; '.join(fallas) + '.')
+        sys.exit(1)
+    print(f'\nOK: {mediana:.1f} ms hasta la primera petición, {mejora:.1f} % menos que {args.baseline} '
+          f'({mediana_base:.1f} ms).')
+
+
+if __name__ == '__main__':
+    main()
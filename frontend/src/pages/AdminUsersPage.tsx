@@ -13,6 +13,15 @@ interface User {
   es_admin: boolean;
 }
 
+interface UsersPage {
+  users: User[];
+  total: number;
+  has_next: boolean;
+  next_cursor: string | null;
+}
+
+const PER_PAGE = 10;
+
 interface FormData {
   nombre_completo: string;
   tipo_documento: string;
@@ -40,6 +49,10 @@ const AdminUsersPage: React.FC = () => {
   const [error, setError] = useState<string | null>(null);
   const [searchQuery, setSearchQuery] = useState('');
   const [currentPage, setCurrentPage] = useState(1);
+  // cursors[i] es el cursor con el que se pide la página i + 1 ('' para la primera)
+  const [cursors, setCursors] = useState<string[]>(['']);
+  const [hasNext, setHasNext] = useState(false);
+  const [total, setTotal] = useState<number | null>(null);
   const [showForm, setShowForm] = useState(false);
   const [formData, setFormData] = useState<FormData>({
     nombre_completo: '',
@@ -87,6 +100,21 @@ const AdminUsersPage: React.FC = () => {
     );
   }
 
+  const fetchUsersPage = async (page: number) => {
+    const cursor = encodeURIComponent(cursors[page - 1] ?? '');
+    const response = await apiClient.get<UsersPage>(
+      `/admin/users?cursor=${cursor}&per_page=${PER_PAGE}&q=${encodeURIComponent(searchQuery)}`
+    );
+    const data = response.data;
+    setUsers(data?.users ?? []);
+    setHasNext(Boolean(data?.has_next));
+    setTotal(data?.total ?? null);
+    if (data?.next_cursor) {
+      setCursors(prev => [...prev.slice(0, page), data.next_cursor as string]);
+    }
+    return data;
+  };
+
   useEffect(() => {
     const fetchUsers = async () => {
       if (authLoading || !user || !user.es_admin) {
@@ -96,13 +124,8 @@ const AdminUsersPage: React.FC = () => {
       setLoading(true);
       setError(null);
       try {
-        const response = await apiClient.get(`/admin/users?page=${currentPage}&q=${searchQuery}`);
-        if (response.data && response.data.users) {
-          setUsers(response.data.users);
-          console.log("Usuarios obtenidos:", response.data.users);
-        } else {
-          setUsers([]);
-        }
+        const data = await fetchUsersPage(currentPage);
+        console.log("Usuarios obtenidos:", data?.users);
       } catch (err: any) {
         console.error("Error al obtener usuarios:", err);
         
@@ -121,16 +144,16 @@ const AdminUsersPage: React.FC = () => {
   }, [currentPage, searchQuery, user, authLoading, navigate]);
 
   const handleSearchChange = (e: React.ChangeEvent<HTMLInputElement>) => {
+    // Una búsqueda nueva vuelve a la primera página y descarta los cursores anteriores
     setSearchQuery(e.target.value);
+    setCurrentPage(1);
+    setCursors(['']);
   };
 
   const handleToggleStatus = async (userId: number) => {
     try {
       await apiClient.post(`/admin/users/${userId}/toggle_status`);
-      const response = await apiClient.get(`/admin/users?page=${currentPage}&q=${searchQuery}`);
-      if (response.data && response.data.users) {
-        setUsers(response.data.users);
-      }
+      await fetchUsersPage(currentPage);
     } catch (err: any) {
       console.error("Error al cambiar estado del usuario:", err);
       setError(err.response?.data?.message || 'Error al cambiar estado del usuario');
@@ -230,10 +253,7 @@ const AdminUsersPage: React.FC = () => {
       
       setShowForm(false);
       
-      const usersResponse = await apiClient.get(`/admin/users?page=${currentPage}&q=${searchQuery}`);
-      if (usersResponse.data && usersResponse.data.users) {
-        setUsers(usersResponse.data.users);
-      }
+      await fetchUsersPage(currentPage);
     } catch (err: any) {
       console.error('Error al crear usuario:', err);
       if (err.response?.data?.errors) {
@@ -574,10 +594,12 @@ const AdminUsersPage: React.FC = () => {
         >
           Anterior
         </button>
-        <span style={{ margin: '0 10px' }}>Página {currentPage}</span>
+        <span style={{ margin: '0 10px' }}>
+          Página {currentPage}{total !== null ? ` de ${Math.max(Math.ceil(total / PER_PAGE), 1)}` : ''}
+        </span>
         <button 
           onClick={() => setCurrentPage(prev => prev + 1)} 
-          disabled={users.length < 10 || loading}
+          disabled={!hasNext || loading}
           style={{
             padding: '5px 10px',
             marginLeft: '10px',
@@ -585,8 +607,8 @@ const AdminUsersPage: React.FC = () => {
             color: 'white',
             border: 'none',
             borderRadius: '4px',
-            cursor: users.length < 10 ? 'not-allowed' : 'pointer',
-            opacity: users.length < 10 ? 0.5 : 1
+            cursor: !hasNext ? 'not-allowed' : 'pointer',
+            opacity: !hasNext ? 0.5 : 1
           }}
         >
           Siguiente
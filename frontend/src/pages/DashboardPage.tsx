@@ -39,7 +39,10 @@ const DashboardPage: FC = () => {
       setIsLoading(true);
       setError(null);
       try {
-        const response = await apiClient.get<Declaration[]>('/declarations');
+        // Solo se piden las columnas que muestra el panel; el backend responde 304 si no hubo cambios
+        const response = await apiClient.get<Declaration[]>('/declarations', {
+          params: { fields: 'id,ano_fiscal,ingresos_totales,estado_declaracion,fecha_creacion' }
+        });
         setDeclarations(response.data);
       } catch (err: any) {
         console.error("Error fetching declarations:", err);
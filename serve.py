@@ -0,0 +1,130 @@
+"""Punto de entrada de producción con varios workers.
+
+Ejemplos:
+    python serve.py --workers auto --threads 4
+    python serve.py --asgi --workers 4 --bind 0.0.0.0:8000
+
+En modo WSGI usa gunicorn (Linux/macOS); en modo ASGI usa uvicorn sobre
+``asgi:app``. En ambos casos SIGTERM/SIGINT inicia un apagado ordenado que
+espera hasta ``--graceful-timeout`` segundos a que terminen las peticiones.
+"""
+import argparse
+import os
+import sys
+
+from dotenv import load_dotenv
+
+
+def available_cores():
+    """Núcleos disponibles para este proceso (respeta la afinidad de CPU)."""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0)) or 1
+    return os.cpu_count() or 1
+
+
+def parse_workers(value):
+    if value == 'auto':
+        return available_cores()
+    try:
+        workers = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError('debe ser un entero positivo o "auto"')
+    if workers < 1:
+        raise argparse.ArgumentTypeError('debe ser un entero positivo o "auto"')
+    return workers
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Servidor de producción del Simulador de Impuestos.')
+    parser.add_argument('--bind', default=os.environ.get('BIND', '127.0.0.1:5000'),
+                        help='host:puerto donde escuchar (por defecto 127.0.0.1:5000)')
+    parser.add_argument('--workers', type=parse_workers, default=os.environ.get('WEB_WORKERS', 'auto'),
+                        help='número de procesos o "auto" para usar un worker por núcleo disponible')
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('WEB_THREADS', 4)),
+                        help='hilos por worker para atender peticiones')
+    parser.add_argument('--timeout', type=int, default=int(os.environ.get('WEB_TIMEOUT', 60)),
+                        help='segundos antes de reiniciar un worker bloqueado (solo WSGI)')
+    parser.add_argument('--graceful-timeout', type=int, default=int(os.environ.get('WEB_GRACEFUL_TIMEOUT', 30)),
+                        help='segundos para terminar peticiones en curso al apagar')
+    parser.add_argument('--asgi', action='store_true', help='servir la variante ASGI con uvicorn')
+    return parser.parse_args(argv)
+
+
+def serve_wsgi(args):
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        sys.exit('gunicorn no está instalado (no funciona en Windows); usa --asgi o instala gunicorn.')
+
+    class Application(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', [args.bind])
+            self.cfg.set('workers', args.workers)
+            self.cfg.set('threads', args.threads)
+            self.cfg.set('worker_class', 'gthread' if args.threads > 1 else 'sync')
+            self.cfg.set('timeout', args.timeout)
+            self.cfg.set('graceful_timeout', args.graceful_timeout)
+            self.cfg.set('worker_exit', _worker_exit)
+            # La aplicación se crea una vez en el proceso maestro y los workers la heredan con el
+            # fork: no repiten las importaciones. Es seguro porque create_app no abre conexiones
+            # (AUTO_MIGRATE=0) y los hilos y pools se crean con la primera petición de cada worker.
+            self.cfg.set('preload_app', True)
+
+        def load(self):
+            from backend import create_app
+            return create_app()
+
+    Application().run()
+
+
+def _worker_exit(server, worker):
+    # Libera el pool de procesos de hashing del worker que se apaga
+    from backend import hashing
+    hashing.hasher.shutdown()
+
+
+def serve_asgi(args):
+    try:
+        import uvicorn
+    except ImportError:
+        sys.exit('uvicorn no está instalado; ejecuta pip install uvicorn asgiref.')
+
+    # Tamaño del pool de hilos de asgi.py donde corren las rutas síncronas
+    os.environ['ASGI_THREADS'] = str(args.threads)
+    host, _, port = args.bind.rpartition(':')
+    uvicorn.run(
+        'asgi:app',
+        host=host or '127.0.0.1',
+        port=int(port),
+        workers=args.workers,
+        timeout_graceful_shutdown=args.graceful_timeout,
+    )
+
+
+def bootstrap():
+    """Aplica las migraciones una sola vez antes de lanzar los workers.
+
+    Los workers arrancan con AUTO_MIGRATE=0, así que no tocan el esquema ni
+    compiten creando el usuario administrador.
+    """
+    os.environ['AUTO_MIGRATE'] = '0'
+    from backend import create_app, db, migrations
+    app = create_app()
+    with app.app_context():
+        migrations.upgrade()
+        db.engine.dispose()
+
+
+def main(argv=None):
+    load_dotenv()
+    args = parse_args(argv)
+    bootstrap()
+    print(f"Sirviendo en {args.bind} con {args.workers} workers x {args.threads} hilos ({'ASGI' if args.asgi else 'WSGI'})")
+    if args.asgi:
+        serve_asgi(args)
+    else:
+        serve_wsgi(args)
+
+
+if __name__ == '__main__':
+    main()